@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+
+"""
+Times retaining the samples from a synthetic prior closest to a target with
+the 'numpy' distance engine of 'GerenukRejector', against the original
+implementation, which calculated the distance to each row of the prior in
+Python and then sorted all of them, and checks that the retained samples are
+the same. Both are timed the same way: the best of ``--num-repeats`` runs.
+"""
+
+import sys
+import math
+import time
+import argparse
+import numpy
+from gerenuk import reject
+from gerenuk import utility
+
+def closest_values_indexes_by_sort(stat_values, target_stat_values, num_to_retain):
+    results = []
+    for idx, prior_value in enumerate(stat_values):
+        dist = [(a - b)**2 for a, b in zip(prior_value, target_stat_values)]
+        results.append((math.sqrt(sum(dist)), idx,))
+    results.sort(key=lambda x: x[0])
+    return results[:num_to_retain]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-samples", type=int, default=20000)
+    parser.add_argument("--num-stats", type=int, default=1000)
+    parser.add_argument("--num-to-retain", type=int, default=100)
+    parser.add_argument("--num-repeats", type=int, default=3, help="Number of times each implementation is timed (the best is reported).")
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = numpy.random.RandomState(args.random_seed)
+    # SFS-like counts: most of the mass in the first few bins
+    means = 1000.0 / (1.0 + numpy.arange(args.num_stats))
+    prior = rng.poisson(means, size=(args.num_samples, args.num_stats)).astype(numpy.float64)
+    target = rng.poisson(means, size=args.num_stats).astype(numpy.float64).tolist()
+    stat_values = prior.tolist()
+    original_time = None
+    for repeat_idx in range(args.num_repeats):
+        start_time = time.time()
+        expected = closest_values_indexes_by_sort(stat_values, target, args.num_to_retain)
+        elapsed = time.time() - start_time
+        if original_time is None or elapsed < original_time:
+            original_time = elapsed
+    gr = reject.GerenukRejector(
+            rejection_criteria_type="num",
+            rejection_criteria_value=args.num_to_retain,
+            run_logger=utility.RunLogger(name="gerenuk-benchmark", log_to_stderr=False, log_to_file=False),
+            logging_frequency=0,
+            distance_engine="numpy")
+    gr.stat_fieldnames = ["stat.{}".format(i) for i in range(args.num_stats)]
+    gr.stat_matrix = prior
+    gr.stat_values = prior
+    numpy_time = None
+    for repeat_idx in range(args.num_repeats):
+        start_time = time.time()
+        results = gr.closest_values_indexes(target, args.num_to_retain)
+        elapsed = time.time() - start_time
+        if numpy_time is None or elapsed < numpy_time:
+            numpy_time = elapsed
+    sys.stdout.write("{} x {} prior, retaining {}: {:.3f}s -> {:.4f}s ({:.1f}x); same samples retained: {}\n".format(
+        args.num_samples,
+        args.num_stats,
+        args.num_to_retain,
+        original_time,
+        numpy_time,
+        original_time / numpy_time,
+        [idx for d, idx in results] == [idx for d, idx in expected]))
+
+if __name__ == "__main__":
+    main()
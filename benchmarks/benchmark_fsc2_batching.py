@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+
+"""
+Times simulation of replicates with loci of the same configuration run one
+FastSimCoal2 invocation at a time, against all together in a single
+invocation ('--batch-loci'). By default, uses a stand-in for FastSimCoal2
+that just writes random site frequency spectra, so as to measure the
+overhead of launching the process and exchanging files.
+"""
+
+import os
+import sys
+import time
+import argparse
+from gerenuk import simulate
+from gerenuk import utility
+from gerenuk.test import TESTS_DATA_DIR
+
+def build_worker(args, model, working_directory, is_batch_loci):
+    return simulate.SimulationWorker(
+            name="benchmark-{}".format(int(is_batch_loci)),
+            model=model,
+            work_queue=None,
+            results_queue=None,
+            fsc2_path=args.fsc2_path,
+            working_directory=working_directory,
+            run_logger=None,
+            logging_frequency=0,
+            messenger_lock=None,
+            random_seed=args.random_seed,
+            is_calculate_single_population_sfs=True,
+            is_calculate_joint_population_sfs=True,
+            is_unfolded_site_frequency_spectrum=False,
+            stat_label_prefix="stat",
+            is_include_model_id_field=False,
+            supplemental_labels=None,
+            debug_mode=False,
+            is_batch_loci=is_batch_loci)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-reps", type=int, default=20)
+    parser.add_argument("--num-lineage-pairs", type=int, default=3)
+    parser.add_argument("--num-loci", type=int, default=5, help="Number of loci per lineage pair.")
+    parser.add_argument("--num-genes", type=int, default=10)
+    parser.add_argument("--num-sites", type=int, default=1000)
+    parser.add_argument("--fsc2-path", default=os.path.join(TESTS_DATA_DIR, "fake-fsc25"))
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    locus_info = []
+    for lineage_pair_idx in range(args.num_lineage_pairs):
+        for locus_idx in range(args.num_loci):
+            locus_info.append({
+                "taxon_label": "S{}".format(lineage_pair_idx+1),
+                "locus_label": "Locus{}".format(locus_idx+1),
+                "ploidy_factor": 1,
+                "mutation_rate_factor": 1,
+                "num_genes_deme0": args.num_genes,
+                "num_genes_deme1": args.num_genes,
+                "ti_tv_rate_ratio": 3,
+                "num_sites": args.num_sites,
+                "freq_a": 0.25,
+                "freq_c": 0.25,
+                "freq_g": 0.25,
+                })
+    params_d = {
+        "concentrationShape": 10,
+        "concentrationScale": 0.3766,
+        "thetaShape": 1,
+        "thetaScale": 0.03,
+        "ancestralThetaShape": 0,
+        "ancestralThetaScale": 0,
+        "thetaParameters": "012",
+        "tauShape": 1.0,
+        "tauScale": 0.007,
+        "timeInSubsPerSite": 1,
+        "bottleProportionShared": 0,
+        "migrationShape": 0,
+        "migrationScale": 0,
+        "numTauClasses": 0,
+        }
+    model = simulate.GerenukSimulationModel(params_d=params_d, locus_info=locus_info)
+    timings = {}
+    num_executions = {}
+    fieldnames = {}
+    with utility.TemporaryDirectory(prefix="gerenuk-benchmark-") as working_directory:
+        for label, is_batch_loci in (("per-locus", False), ("batched", True)):
+            worker = build_worker(args, model, working_directory, is_batch_loci)
+            start_time = time.time()
+            for rep_idx in range(args.num_reps):
+                results_d = worker.simulate()
+            timings[label] = time.time() - start_time
+            num_executions[label] = worker.simulation_handler._num_executions
+            fieldnames[label] = sorted(results_d.keys())
+    for label in ("per-locus", "batched"):
+        sys.stdout.write("{:>10}: {:8.3f}s ({:.1f} replicates/s, {} FastSimCoal2 runs)\n".format(
+            label,
+            timings[label],
+            args.num_reps / timings[label],
+            num_executions[label]))
+    sys.stdout.write("   speedup: {:.1f}x\n".format(timings["per-locus"] / timings["batched"]))
+    sys.stdout.write("    fields: {}\n".format("identical" if fieldnames["per-locus"] == fieldnames["batched"] else "DIFFERENT"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+
+"""
+Times simulation of replicates with the FastSimCoal2 working files on disk
+(under '-w', or the system default temporary directory) against a RAM-backed
+file system ('--working-directory-backend memory'), reporting the time spent
+in each phase of the runs. By default, uses a stand-in for FastSimCoal2 that
+just writes random site frequency spectra, so as to measure the file
+exchange rather than the simulation.
+"""
+
+import os
+import sys
+import time
+import argparse
+from gerenuk import simulate
+from gerenuk import utility
+from gerenuk.test import TESTS_DATA_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-reps", type=int, default=20)
+    parser.add_argument("--num-loci", type=int, default=10)
+    parser.add_argument("--num-genes", type=int, default=10)
+    parser.add_argument("--num-sites", type=int, default=1000)
+    parser.add_argument("-w", "--working-directory-parent", default=None)
+    parser.add_argument("--fsc2-path", default=os.path.join(TESTS_DATA_DIR, "fake-fsc25"))
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    locus_info = []
+    for locus_idx in range(args.num_loci):
+        locus_info.append({
+            "taxon_label": "S1",
+            "locus_label": "Locus{}".format(locus_idx+1),
+            "ploidy_factor": 1,
+            "mutation_rate_factor": 1,
+            "num_genes_deme0": args.num_genes,
+            "num_genes_deme1": args.num_genes,
+            "ti_tv_rate_ratio": 3,
+            "num_sites": args.num_sites,
+            "freq_a": 0.25,
+            "freq_c": 0.25,
+            "freq_g": 0.25,
+            })
+    params_d = {
+        "concentrationShape": 10,
+        "concentrationScale": 0.3766,
+        "thetaShape": 1,
+        "thetaScale": 0.03,
+        "ancestralThetaShape": 0,
+        "ancestralThetaScale": 0,
+        "thetaParameters": "012",
+        "tauShape": 1.0,
+        "tauScale": 0.007,
+        "timeInSubsPerSite": 1,
+        "bottleProportionShared": 0,
+        "migrationShape": 0,
+        "migrationScale": 0,
+        "numTauClasses": 0,
+        }
+    model = simulate.GerenukSimulationModel(params_d=params_d, locus_info=locus_info)
+    for backend in utility.WORKING_DIRECTORY_BACKENDS:
+        parent_dir, used_backend = utility.get_working_directory_parent(
+                backend=backend,
+                parent_dir=args.working_directory_parent)
+        if used_backend != backend:
+            sys.stdout.write("{:>8}: no RAM-backed file system available\n".format(backend))
+            continue
+        with utility.TemporaryDirectory(prefix="gerenuk-benchmark-", parent_dir=parent_dir) as working_directory:
+            worker = simulate.SimulationWorker(
+                    name="benchmark",
+                    model=model,
+                    work_queue=None,
+                    results_queue=None,
+                    fsc2_path=args.fsc2_path,
+                    working_directory=working_directory,
+                    run_logger=None,
+                    logging_frequency=0,
+                    messenger_lock=None,
+                    random_seed=args.random_seed,
+                    is_calculate_single_population_sfs=True,
+                    is_calculate_joint_population_sfs=True,
+                    is_unfolded_site_frequency_spectrum=False,
+                    stat_label_prefix="stat",
+                    is_include_model_id_field=False,
+                    supplemental_labels=None,
+                    debug_mode=False)
+            start_time = time.time()
+            for rep_idx in range(args.num_reps):
+                worker.simulate()
+            sys.stdout.write("{:>8}: {:8.3f}s; {}\n".format(
+                backend,
+                time.time() - start_time,
+                worker.simulation_handler.describe_phase_durations()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+
+"""
+Times parsing of the site frequency spectrum ('.obs') files written by
+FastSimCoal2, as done by 'Fsc2Handler' (with the field names of each layout
+composed once and then reused), against composing the field name of each
+value as it is read (as was done before). By default, parses the files in
+'gerenuk/test/data/fsc-results/test-one'.
+"""
+
+import os
+import sys
+import time
+import argparse
+import collections
+from gerenuk import simulate
+from gerenuk.test import TESTS_DATA_DIR
+
+def parse_deme_per_value(filepath, field_name_prefix, results_d):
+    with open(filepath) as src:
+        lines = src.read().split("\n")
+    header_row = lines[1].split("\t")
+    for line in lines[2:]:
+        if not line:
+            continue
+        for key, val in zip(header_row, line.split("\t")):
+            if not val:
+                continue
+            results_d["{}.{}".format(field_name_prefix, key)] = float(val)
+    return results_d
+
+def parse_joint_per_value(filepath, field_name_prefix, results_d):
+    with open(filepath) as src:
+        lines = src.read().split("\n")
+    for line in lines[1:]:
+        if not line:
+            continue
+        cols = line.split("\t")
+        if not cols[0]:
+            col_keys = cols[1:]
+            continue
+        row_key = cols[0]
+        for col_key, val in zip(col_keys, cols[1:]):
+            results_d["{}.{}.{}".format(field_name_prefix, row_key, col_key)] = float(val)
+    return results_d
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--results-dir",
+            default=os.path.join(TESTS_DATA_DIR, "fsc-results", "test-one"),
+            help="Directory of FastSimCoal2 results, with '<NAME>_MAFpop0.obs', '<NAME>_MAFpop1.obs', and '<NAME>_jointMAFpop1_0.obs' (of a single observation), where <NAME> is that of the directory.")
+    parser.add_argument("--num-reps", type=int, default=20000)
+    args = parser.parse_args()
+    name = os.path.basename(os.path.normpath(args.results_dir))
+    handler = simulate.Fsc2Handler(
+            name=name,
+            fsc2_path=None,
+            working_directory=os.path.dirname(os.path.normpath(args.results_dir)),
+            is_calculate_single_population_sfs=True,
+            is_calculate_joint_population_sfs=True,
+            is_unfolded_site_frequency_spectrum=False)
+    parsers = (
+            ("per-value", parse_deme_per_value, parse_joint_per_value),
+            ("cached", handler._parse_deme_derived_allele_frequencies, handler._parse_joint_derived_allele_frequencies),
+            )
+    timings = {}
+    results = {}
+    for label, parse_deme, parse_joint in parsers:
+        start_time = time.time()
+        for rep_idx in range(args.num_reps):
+            results_d = collections.OrderedDict()
+            for deme_idx, filepath in enumerate((handler.deme0_site_frequency_filepath, handler.deme1_site_frequency_filepath)):
+                parse_deme(
+                        filepath=filepath,
+                        field_name_prefix="stat.locus1.deme{}.sfs".format(deme_idx),
+                        results_d=results_d)
+            parse_joint(
+                    filepath=handler.joint_site_frequency_filepath,
+                    field_name_prefix="stat.locus1.joint.sfs",
+                    results_d=results_d)
+        timings[label] = time.time() - start_time
+        results[label] = results_d
+    for label, parse_deme, parse_joint in parsers:
+        sys.stdout.write("{:>10}: {:8.3f}s ({:.1f} microseconds per replicate)\n".format(
+            label,
+            timings[label],
+            1E6 * timings[label] / args.num_reps))
+    sys.stdout.write("   speedup: {:.1f}x\n".format(timings["per-value"] / timings["cached"]))
+    sys.stdout.write("   results: {}\n".format("identical" if list(results["per-value"].items()) == list(results["cached"].items()) else "DIFFERENT"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+
+"""
+Times drawing the partitions of lineage pairs into groups with the same
+divergence time from their exact prior probabilities, precomputed by
+'PartitionPrior' (an integer partition chosen from an alias table, and the
+lineage pairs then shuffled into its groups), against drawing the
+concentration from its hyperprior and then running the Chinese restaurant
+process with 'sample_partition', and reports the time taken to precompute
+the probabilities.
+"""
+
+import sys
+import time
+import random
+import argparse
+from gerenuk import simulate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-draws", type=int, default=50000)
+    parser.add_argument("--num-elements", type=int, nargs="+", default=[3, 10, 20])
+    parser.add_argument("--concentration-shape", type=float, default=10)
+    parser.add_argument("--concentration-scale", type=float, default=0.3766)
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    prior_concentration = (args.concentration_shape, args.concentration_scale)
+    for num_elements in args.num_elements:
+        start_time = time.time()
+        partition_prior = simulate.PartitionPrior(
+                number_of_elements=num_elements,
+                prior_concentration=prior_concentration)
+        setup_time = time.time() - start_time
+        timings = {}
+        mean_num_groups = {}
+        for label in ("process", "table"):
+            rng = random.Random(args.random_seed)
+            total_num_groups = 0
+            start_time = time.time()
+            if label == "process":
+                for draw_idx in range(args.num_draws):
+                    concentration = rng.gammavariate(*prior_concentration)
+                    total_num_groups += len(simulate.sample_partition(num_elements, concentration, rng))
+            else:
+                for draw_idx in range(args.num_draws):
+                    total_num_groups += len(partition_prior.sample_partition(rng))
+            timings[label] = time.time() - start_time
+            mean_num_groups[label] = float(total_num_groups) / args.num_draws
+        expected_num_groups = sum(k * p for k, p in enumerate(partition_prior.get_num_groups_probabilities(), 1))
+        sys.stdout.write("{:>3} elements ({:>4} integer partitions, precomputed in {:.3f}s): {:6.2f} -> {:6.2f} microseconds per draw ({:.1f}x); mean number of groups {:.3f} vs {:.3f} (expected {:.3f})\n".format(
+            num_elements,
+            len(partition_prior.integer_partitions),
+            setup_time,
+            1E6 * timings["process"] / args.num_draws,
+            1E6 * timings["table"] / args.num_draws,
+            timings["process"] / timings["table"],
+            mean_num_groups["process"],
+            mean_num_groups["table"],
+            expected_num_groups))
+
+if __name__ == "__main__":
+    main()
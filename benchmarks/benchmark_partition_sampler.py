@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+
+"""
+Times drawing partitions of lineage pairs from the Chinese restaurant process
+with 'sample_partition', against the previous implementation, which built the
+list of the probabilities of every group for each element and chose one by a
+linear scan.
+"""
+
+import sys
+import time
+import random
+import argparse
+from gerenuk import simulate
+
+def sample_partition_by_scan(
+        number_of_elements,
+        scaling_parameter,
+        rng,):
+    groups = []
+    element_ids = [i for i in range(number_of_elements)]
+    rng.shuffle(element_ids)
+    a = scaling_parameter
+    for i, element_id in enumerate(element_ids):
+        probs = []
+        n = i + 1
+        if i == 0:
+            groups.append([element_id])
+            continue
+        p_new = a/(a + n - 1.0)
+        probs.append(p_new)
+        for group in groups:
+            p = len(group)/(a + n - 1.0)
+            probs.append(p)
+        assert abs(sum(probs) - 1.0) <= 1e-5
+        selected_idx = simulate.weighted_index_choice(
+                weights=probs,
+                sum_of_weights=1.0,
+                rng=rng)
+        if selected_idx == 0:
+            groups.append([element_id])
+        else:
+            groups[selected_idx-1].append(element_id)
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-draws", type=int, default=20000)
+    parser.add_argument("--num-elements", type=int, nargs="+", default=[3, 10, 50])
+    parser.add_argument("--concentrations", type=float, nargs="+", default=[1.0, 10.0])
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    for num_elements in args.num_elements:
+        for concentration in args.concentrations:
+            timings = {}
+            mean_num_groups = {}
+            for label, sampler in (("scan", sample_partition_by_scan), ("current", simulate.sample_partition)):
+                rng = random.Random(args.random_seed)
+                total_num_groups = 0
+                start_time = time.time()
+                for draw_idx in range(args.num_draws):
+                    total_num_groups += len(sampler(num_elements, concentration, rng))
+                timings[label] = time.time() - start_time
+                mean_num_groups[label] = float(total_num_groups) / args.num_draws
+            sys.stdout.write("{:>3} elements, concentration {:>5}: {:7.2f} -> {:7.2f} microseconds per draw ({:.1f}x); mean number of groups {:.2f} vs {:.2f}\n".format(
+                num_elements,
+                concentration,
+                1E6 * timings["scan"] / args.num_draws,
+                1E6 * timings["current"] / args.num_draws,
+                timings["scan"] / timings["current"],
+                mean_num_groups["scan"],
+                mean_num_groups["current"]))
+
+if __name__ == "__main__":
+    main()
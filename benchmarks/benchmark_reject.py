@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+"""
+Times rejection of a synthetic prior against a set of targets, comparing
+scoring each target separately against scoring all the targets against
+each chunk of the prior at once ('--batch-targets').
+"""
+
+import sys
+import time
+import argparse
+import numpy
+from gerenuk import reject
+from gerenuk import utility
+
+def build_rejector(args, prior, is_batch_targets):
+    run_logger = utility.RunLogger(
+            name="gerenuk-benchmark",
+            log_to_stderr=False,
+            log_to_file=False)
+    gr = reject.GerenukRejector(
+            rejection_criteria_type="num",
+            rejection_criteria_value=args.num_to_retain,
+            run_logger=run_logger,
+            logging_frequency=0,
+            is_batch_targets=is_batch_targets)
+    gr.stat_fieldnames = ["stat.{}".format(i) for i in range(prior.shape[1])]
+    gr.stat_matrix = prior
+    gr.stat_values = prior
+    return gr
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-samples", type=int, default=100000)
+    parser.add_argument("--num-stats", type=int, default=1000)
+    parser.add_argument("--num-targets", type=int, default=100)
+    parser.add_argument("--num-to-retain", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=reject.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = numpy.random.RandomState(args.random_seed)
+    # SFS-like counts: most of the mass in the first few bins
+    means = 1000.0 / (1.0 + numpy.arange(args.num_stats))
+    prior = rng.poisson(means, size=(args.num_samples, args.num_stats)).astype(numpy.float64)
+    targets = rng.poisson(means, size=(args.num_targets, args.num_stats)).astype(numpy.float64).tolist()
+    timings = {}
+    results = {}
+    for label, is_batch_targets in (("per-target", False), ("batched", True)):
+        gr = build_rejector(args, prior, is_batch_targets)
+        accumulators = [reject.RejectionAccumulator(num_to_retain=args.num_to_retain) for t in targets]
+        start_time = time.time()
+        for start in range(0, args.num_samples, args.chunk_size):
+            stop = min(start + args.chunk_size, args.num_samples)
+            gr.score_chunk(
+                    targets=targets,
+                    accumulators=accumulators,
+                    stat_chunk=prior[start:stop],
+                    first_row_idx=start,
+                    other_rows=[None] * (stop - start))
+        timings[label] = time.time() - start_time
+        results[label] = [[s[1] for s in a.get_samples()] for a in accumulators]
+    num_comparisons = float(args.num_samples) * args.num_targets
+    for label in ("per-target", "batched"):
+        sys.stdout.write("{:>10}: {:8.3f}s ({:.3g} sample-target comparisons/s)\n".format(
+            label,
+            timings[label],
+            num_comparisons / timings[label]))
+    sys.stdout.write("   speedup: {:.1f}x\n".format(timings["per-target"] / timings["batched"]))
+    sys.stdout.write(" identical: {}\n".format(results["per-target"] == results["batched"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+
+"""
+Compares the cost of sending the results of replicates from the worker
+processes to the parent as dictionaries keyed by field name, against sending
+the schema once and then just the packed values of each replicate (or batch
+of replicates; see ``gerenuk.simulate.ResultsSchema``): size of the pickled
+messages, and time to pickle them (in the worker) and unpickle and unpack
+them (in the parent).
+"""
+
+import sys
+import time
+import pickle
+import random
+import argparse
+import collections
+from gerenuk import simulate
+
+def get_results(args, rng):
+    results_d = collections.OrderedDict()
+    results_d["param.divTimeModel"] = "M1{}".format(rng.randint(1, 3))
+    results_d["param.numDivTimes"] = rng.randint(1, 3)
+    for locus_idx in range(args.num_loci):
+        for d1_idx in range(args.num_genes + 1):
+            for d0_idx in range(args.num_genes + 1):
+                key = "stat.S1.Locus{}.joint.sfs.d1_{}.d0_{}".format(locus_idx+1, d1_idx, d0_idx)
+                results_d[key] = float(rng.randint(0, 10))
+    return results_d
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-reps", type=int, default=200)
+    parser.add_argument("--num-loci", type=int, default=25)
+    parser.add_argument("--num-genes", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1, help="Number of replicates packed per message.")
+    args = parser.parse_args()
+    rng = random.Random(1)
+    replicates = [get_results(args, rng) for rep_idx in range(args.num_reps)]
+    sys.stdout.write("{} replicates of {} fields\n".format(args.num_reps, len(replicates[0])))
+
+    start_time = time.time()
+    messages = [pickle.dumps(results_d, pickle.HIGHEST_PROTOCOL) for results_d in replicates]
+    send_time = time.time() - start_time
+    start_time = time.time()
+    for message in messages:
+        pickle.loads(message)
+    receive_time = time.time() - start_time
+    sys.stdout.write("dictionaries: {:10.1f} KB/replicate, {:.3f}s sending, {:.3f}s receiving\n".format(
+        sum(len(m) for m in messages) / 1024.0 / args.num_reps, send_time, receive_time))
+
+    start_time = time.time()
+    schema = simulate.ResultsSchema.from_results("worker", replicates[0])
+    schema_message = pickle.dumps(schema, pickle.HIGHEST_PROTOCOL)
+    messages = []
+    for start in range(0, args.num_reps, args.batch_size):
+        messages.append(pickle.dumps(schema.pack(replicates[start:start + args.batch_size]), pickle.HIGHEST_PROTOCOL))
+    send_time = time.time() - start_time
+    start_time = time.time()
+    schema = pickle.loads(schema_message)
+    schema.set_output_fieldnames(schema.fieldnames)
+    for message in messages:
+        for values in schema.unpack(pickle.loads(message)):
+            pass
+    receive_time = time.time() - start_time
+    sys.stdout.write("      packed: {:10.1f} KB/replicate, {:.3f}s sending, {:.3f}s receiving ({:.1f} KB schema, {} messages)\n".format(
+        sum(len(m) for m in messages) / 1024.0 / args.num_reps, send_time, receive_time, len(schema_message) / 1024.0, len(messages)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+
+"""
+Times repeated calls to 'GerenukSimulator.execute' with new worker processes
+launched for each call, against the same calls made to a simulator with a
+pool of worker processes kept running between calls (i.e., used as a context
+manager). Uses the native simulator backend by default, so that the
+simulations themselves are cheap relative to launching the processes.
+"""
+
+import os
+import sys
+import time
+import argparse
+from gerenuk import simulate
+from gerenuk import utility
+from gerenuk.test import TESTS_DATA_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-calls", type=int, default=20)
+    parser.add_argument("--num-reps", type=int, default=10, help="Number of replicates per call.")
+    parser.add_argument("--num-processes", type=int, default=2)
+    parser.add_argument("--num-lineage-pairs", type=int, default=3)
+    parser.add_argument("--num-loci", type=int, default=5, help="Number of loci per lineage pair.")
+    parser.add_argument("--num-genes", type=int, default=10)
+    parser.add_argument("--num-sites", type=int, default=1000)
+    parser.add_argument("--simulator-backend", default="native", choices=simulate.SIMULATOR_BACKENDS)
+    parser.add_argument("--fsc2-path", default=os.path.join(TESTS_DATA_DIR, "fake-fsc25"))
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    locus_info = []
+    for lineage_pair_idx in range(args.num_lineage_pairs):
+        for locus_idx in range(args.num_loci):
+            locus_info.append({
+                "taxon_label": "S{}".format(lineage_pair_idx+1),
+                "locus_label": "Locus{}".format(locus_idx+1),
+                "ploidy_factor": 1,
+                "mutation_rate_factor": 1,
+                "num_genes_deme0": args.num_genes,
+                "num_genes_deme1": args.num_genes,
+                "ti_tv_rate_ratio": 3,
+                "num_sites": args.num_sites,
+                "freq_a": 0.25,
+                "freq_c": 0.25,
+                "freq_g": 0.25,
+                })
+    params_d = {
+        "concentrationShape": 10,
+        "concentrationScale": 0.3766,
+        "thetaShape": 1,
+        "thetaScale": 0.03,
+        "ancestralThetaShape": 0,
+        "ancestralThetaScale": 0,
+        "thetaParameters": "012",
+        "tauShape": 1.0,
+        "tauScale": 0.007,
+        "timeInSubsPerSite": 1,
+        "bottleProportionShared": 0,
+        "migrationShape": 0,
+        "migrationScale": 0,
+        "numTauClasses": 0,
+        }
+    timings = {}
+    with utility.TemporaryDirectory(prefix="gerenuk-benchmark-") as working_directory:
+        for label in ("respawned", "pooled"):
+            config_d = {
+                "title": "benchmark",
+                "working_directory": working_directory,
+                "standard_error_logging_level": "warning",
+                "log_to_file": False,
+                "simulator_backend": args.simulator_backend,
+                "fsc2_path": args.fsc2_path,
+                "random_seed": args.random_seed,
+                "is_calculate_single_population_sfs": True,
+                "params": dict(params_d),
+                "locus_info": [dict(locus_d) for locus_d in locus_info],
+                }
+            gs = simulate.GerenukSimulator(
+                    config_d=config_d,
+                    num_processes=args.num_processes,
+                    is_verbose_setup=False)
+            start_time = time.time()
+            if label == "pooled":
+                gs.start_workers()
+            for call_idx in range(args.num_calls):
+                gs.execute(args.num_reps, results_store=[])
+            gs.stop_workers()
+            timings[label] = time.time() - start_time
+    for label in ("respawned", "pooled"):
+        sys.stdout.write("{:>10}: {:8.3f}s ({:.1f} calls/s)\n".format(
+            label,
+            timings[label],
+            args.num_calls / timings[label]))
+    sys.stdout.write("   speedup: {:.1f}x\n".format(timings["respawned"] / timings["pooled"]))
+
+if __name__ == "__main__":
+    main()
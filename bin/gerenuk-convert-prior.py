@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import argparse
+from gerenuk import reject
+from gerenuk import utility
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="GERENUK Simultaneous Divergence Time Analysis -- Convert Samples from the Prior to Binary Format",
+            )
+    parser.add_argument(
+            "simulations_data_filepaths",
+            nargs="+",
+            help="Path to samples from the prior data files.")
+    output_options = parser.add_argument_group("Output Options")
+    output_options.add_argument('-o', '--output-prefix',
+        action='store',
+        type=str,
+        default=None,
+        metavar='OUTPUT-FILE-PREFIX',
+        help="Prefix for output files (default: same as first data file, without extension).")
+    processing_options = parser.add_argument_group("Processing Options")
+    processing_options.add_argument("--field-delimiter",
+        type=str,
+        default="\t",
+        help="Field delimiter (default: <TAB>).")
+    processing_options.add_argument("--stats-field-prefix",
+        type=str,
+        default="stat",
+        help="Prefix identifying summary statistic fields (default: '%(default)s').")
+    processing_options.add_argument("--chunk-size",
+        type=int,
+        default=reject.DEFAULT_CHUNK_SIZE,
+        metavar="#",
+        help="Number of rows of the samples from the prior to read at a time (default: %(default)s).")
+    run_options = parser.add_argument_group("Run Options")
+    run_options.add_argument(
+            "-q", "--quiet",
+            action="store_true",
+            help="Work silently.")
+    args = parser.parse_args()
+    if args.output_prefix is None:
+        output_prefix = os.path.splitext(args.simulations_data_filepaths[0])[0]
+        if output_prefix.endswith(".sumstats"):
+            output_prefix = os.path.splitext(output_prefix)[0]
+    else:
+        output_prefix = args.output_prefix
+    run_logger = utility.RunLogger(
+            name="gerenuk-convert-prior",
+            stderr_logging_level="info",
+            log_to_stderr=not args.quiet,
+            log_to_file=False
+            )
+    gr = reject.GerenukRejector(
+            rejection_criteria_type=None,
+            rejection_criteria_value=None,
+            run_logger=run_logger,
+            logging_frequency=0,
+            stats_field_prefix=args.stats_field_prefix,
+            field_delimiter=args.field_delimiter,
+            distance_engine="numpy",
+            )
+    gr.write_binary_prior(
+            filepaths=args.simulations_data_filepaths,
+            output_prefix=output_prefix,
+            chunk_size=args.chunk_size)
+
+if __name__ == "__main__":
+    main()
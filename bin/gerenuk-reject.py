@@ -1,155 +1,10 @@
 #! /usr/bin/env python
 
-import math
-import csv
-import os
 import sys
 import argparse
-import collections
+from gerenuk import reject
 from gerenuk import utility
 
-if not (sys.version_info.major >= 3 and sys.version_info.minor >= 4):
-    open = utility.pre_py34_open
-
-class GerenukRejector(object):
-
-    def __init__(self,
-            rejection_criteria_type,
-            rejection_criteria_value,
-            run_logger,
-            stats_field_prefix="stat",
-            logging_frequency=1000,
-            field_delimiter="\t",
-            is_output_summary_stats=False,
-            is_suppress_checks=False,
-            ):
-        self.rejection_criteria_type = rejection_criteria_type
-        self.rejection_criteria_value = rejection_criteria_value
-        self.run_logger = run_logger
-        self.stats_field_prefix = stats_field_prefix
-        self.logging_frequency = logging_frequency
-        self.field_delimiter = field_delimiter
-        self.is_output_summary_stats = is_output_summary_stats
-        self.is_suppress_checks = is_suppress_checks
-        self.all_fieldnames = None
-        self.other_fieldnames = None
-        self.stat_fieldnames = None
-        self.stat_fieldnames_check = None
-        self.other_fieldname_check = None
-        self.stat_values = []
-        self.other_values = []
-
-    def read_simulated_data(self, filepaths):
-        for filepath in filepaths:
-            self.run_logger.info("Reading simulation file: '{}'".format(filepath))
-            with open(filepath) as src:
-                reader = csv.DictReader(
-                        src,
-                        delimiter=self.field_delimiter,
-                        quoting=csv.QUOTE_NONE)
-                for row_idx, row in enumerate(reader):
-                    if self.logging_frequency and row_idx > 0 and row_idx % self.logging_frequency == 0:
-                        self.run_logger.info("- Processing row {}".format(row_idx+1))
-                    if self.all_fieldnames is None:
-                        self.all_fieldnames = list(reader.fieldnames)
-                        self.stat_fieldnames = []
-                        self.other_fieldnames = []
-                        for field in reader.fieldnames:
-                            if field.startswith(self.stats_field_prefix):
-                                self.stat_fieldnames.append(field)
-                            else:
-                                self.other_fieldnames.append(field)
-                        self.stat_fieldnames_check = set(self.stat_fieldnames)
-                        self.other_fieldname_check = set(self.other_fieldnames)
-                    row_stat_values = []
-                    row_other_values = []
-                    for key_idx, key in enumerate(self.all_fieldnames): # keys must be read in same order!
-                        if not self.is_suppress_checks:
-                            if key not in self.stat_fieldnames_check and key not in self.other_fieldname_check:
-                                raise ValueError("File '{}', row {}, column {}: field '{}' not recognized".format(
-                                    filepath, row_idx+1, key_idx+1, key))
-                        if key.startswith(self.stats_field_prefix):
-                            row_stat_values.append(float(row[key]))
-                        else:
-                            row_other_values.append( row[key] )
-                    # assert len(row) == len(row_stat_values) + len(row_other_values)
-                    self.stat_values.append(row_stat_values)
-                    self.other_values.append(row_other_values)
-
-    def euclidean_distance(self, vector1, vector2):
-        assert len(vector1) == len(vector2)
-        dist = [(a - b)**2 for a, b in zip(vector1, vector2)]
-        dist = math.sqrt(sum(dist))
-        return dist
-
-    def closest_values_indexes(self, target_stat_values, num_to_retain):
-        assert len(target_stat_values) == len(self.stat_fieldnames), "Expecting {} values but found {}".format(
-                len(self.stat_fieldnames),
-                len(target_stat_values),
-                )
-        results = []
-        for idx, prior_value in enumerate(self.stat_values):
-            d = self.euclidean_distance(prior_value, target_stat_values)
-            results.append((d, idx,))
-        results.sort(key=lambda x: x[0])
-        return results[:num_to_retain]
-
-    def filter_by_distance(self, target_stat_values, max_distance):
-        assert len(target_stat_values) == len(self.stat_fieldnames), "Expecting {} values but found {}".format(
-                len(self.stat_fieldnames),
-                len(target_stat_values),
-                )
-        results = []
-        for idx, prior_value in enumerate(self.stat_values):
-            d = self.euclidean_distance(prior_value, target_stat_values)
-            if d <= max_distance:
-                results.append((d, idx,))
-        results.sort(key=lambda x: x[0])
-        return results[:num_to_retain]
-
-    def write_posterior(self, target_data_filepath,):
-        with open(target_data_filepath) as src:
-            reader = csv.DictReader(
-                    src,
-                    delimiter=self.field_delimiter,
-                    quoting=csv.QUOTE_NONE)
-            for row_idx, row in enumerate(reader):
-                target_stat_values = []
-                target_other_values = []
-                for key_idx, key in enumerate(self.all_fieldnames): # keys must be read in same order!
-                    if key not in row:
-                        continue
-                    if not self.is_suppress_checks:
-                        if key not in self.stat_fieldnames_check and key not in self.other_fieldname_check:
-                            raise ValueError("File '{}', target {}, column {}: field '{}' not recognized".format(
-                                target_data_filepath, target_idx+1, key_idx+1, key))
-                    if key.startswith(self.stats_field_prefix):
-                        target_stat_values.append(float(row[key]))
-                    else:
-                        target_other_values.append( row[key] )
-                if self.rejection_criteria_type == "distance":
-                    posterior_indexes = self.filter_by_distance(
-                        target_stat_values=target_stat_values,
-                        max_distance=self.rejection_criteria_value)
-                else:
-                    if self.rejection_criteria_type == "num":
-                        num_to_retain = self.rejection_criteria_value
-                    elif self.rejection_criteria_type == "proportion":
-                        num_to_retain = int(self.rejection_criteria_value * len(target_stat_values))
-                    posterior_indexes = self.closest_values_indexes(
-                        target_stat_values=target_stat_values,
-                        num_to_retain=num_to_retain,)
-                dest = open(os.path.splitext(os.path.basename(target_data_filepath))[0] + ".posterior.{}.tsv".format(row_idx+1), "w")
-                dest.write(self.field_delimiter.join(str(v) for v in self.other_fieldnames))
-                if self.is_output_summary_stats:
-                    dest.write(self.field_delimiter.join(str(v) for v in self.stat_fieldnames))
-                dest.write("\n")
-                for distance, index in posterior_indexes:
-                    dest.write(self.field_delimiter.join(str(v) for v in self.other_values[index]))
-                    if self.is_output_summary_stats:
-                        dest.write(self.field_delimiter.join(str(v) for v in self.stat_values[index]))
-                    dest.write("\n")
-
 def main():
     parser = argparse.ArgumentParser(
             description="GERENUK Simultaneous Divergence Time Analysis -- Rejection",
@@ -160,7 +15,7 @@ def main():
     parser.add_argument(
             "simulations_data_filepaths",
             nargs="+",
-            help="Path to samples from the prior data files.")
+            help="Path to samples from the prior data files, or to binary prior ('*{}') files written by 'gerenuk-convert-prior.py'.".format(reject.BINARY_PRIOR_MANIFEST_SUFFIX))
     # rejection_criteria = parser.add_mutually_exclusive_group(required=True)
     # rejection_criteria.add_argument(
     #         "-n", "--retain-max-num",
@@ -205,6 +60,59 @@ def main():
         type=str,
         default="stat",
         help="Prefix identifying summary statistic fields (default: '%(default)s').")
+    processing_options.add_argument("--distance-engine",
+        choices=["numpy", "python"],
+        default=None,
+        help="Implementation used to calculate distances: 'numpy' (vectorized; default if NumPy is available) or 'python'.")
+    processing_options.add_argument("--distance-type",
+        choices=list(reject.DISTANCE_TYPES),
+        default="euclidean",
+        help="Distance between samples: 'euclidean', on the raw summary statistic values (default); 'standardized', with each summary statistic divided by its standard deviation across the prior; or 'weighted', as 'standardized' with the squared difference in each summary statistic multiplied by a weight given by '--stat-weights'. The standard deviations are cached beside the prior for subsequent runs.")
+    processing_options.add_argument("--stat-weights",
+        metavar="FILE",
+        default=None,
+        help="File with a header row of summary statistic field names and a row of their weights for the 'weighted' distance (summary statistics not listed have a weight of 1).")
+    processing_options.add_argument("--stream",
+        action="store_true",
+        default=False,
+        help="Process the samples from the prior in chunks, retaining only the accepted samples, instead of loading them all into memory.")
+    processing_options.add_argument("--chunk-size",
+        type=int,
+        default=reject.DEFAULT_CHUNK_SIZE,
+        metavar="#",
+        help="Number of rows of the samples from the prior to read at a time (default: %(default)s).")
+    processing_options.add_argument("--batch-targets",
+        action="store_true",
+        default=False,
+        help="Score all the targets against each chunk of samples from the prior with a single matrix operation (requires NumPy; faster with many targets).")
+    processing_options.add_argument("--reduce-dimensions",
+        type=int,
+        default=None,
+        metavar="#",
+        help="Calculate distances over this number of principal components of the (scaled) summary statistics (requires NumPy), fitted to a random sample of the prior and cached beside it for subsequent runs. Distances are then approximate, but much faster to calculate with many summary statistics.")
+    processing_options.add_argument("--reduction-sample-size",
+        type=int,
+        default=reject.DEFAULT_REDUCTION_SAMPLE_SIZE,
+        metavar="#",
+        help="Number of samples from the prior to fit the principal components to (default: %(default)s).")
+    processing_options.add_argument("--reduction-random-seed",
+        type=int,
+        default=None,
+        metavar="#",
+        help="Seed for the random sampling of the prior to fit the principal components to.")
+    processing_options.add_argument("--spatial-index",
+        action="store_true",
+        default=False,
+        help="Find the closest samples from the prior with a spatial index (KD-tree; requires SciPy), built over the (scaled) summary statistics and cached beside the prior for subsequent runs. Results are identical to a full scan; fastest with many targets and few summary statistics. Not compatible with '--stream', '--num-processes', or '--batch-targets'.")
+    processing_options.add_argument("--no-memory-map",
+        action="store_true",
+        default=False,
+        help="Load binary priors into memory instead of memory-mapping them (by default, they are memory-mapped, so concurrent processes share them through the OS page cache).")
+    processing_options.add_argument("-m", "--num-processes",
+        type=int,
+        default=1,
+        metavar="#",
+        help="Number of processes to score the samples from the prior with; if more than 1, implies '--stream' (default: %(default)s).")
     output_options = parser.add_argument_group("Run Options")
     output_options.add_argument(
             "--output-summary-stats",
@@ -221,6 +129,10 @@ def main():
         sys.exit("Require exactly one of '-n'/'--max-num', '-p'/'--max-proportion', or '-d'/'--max-distance' to be specified.")
     elif num_non_Nones > 1:
         sys.exit("Require only one of '-n'/'--max-num', '-p'/'--max-proportion', or '-d'/'--max-distance' to be specified.")
+    if (args.distance_type == "weighted") != (args.stat_weights is not None):
+        sys.exit("Require '--stat-weights' to be specified with, and only with, '--distance-type weighted'.")
+    if args.spatial_index and (args.stream or args.num_processes > 1 or args.batch_targets):
+        sys.exit("'--spatial-index' cannot be combined with '--stream', '--num-processes', or '--batch-targets'.")
     if args.max_num:
         rejection_criteria_type = "num"
         rejection_criteria_value = args.max_num
@@ -236,16 +148,34 @@ def main():
             log_to_stderr=not args.quiet,
             log_to_file=False
             )
-    gr = GerenukRejector(
+    gr = reject.GerenukRejector(
             rejection_criteria_type=rejection_criteria_type,
             rejection_criteria_value=rejection_criteria_value,
             run_logger=run_logger,
             stats_field_prefix=args.stats_field_prefix,
             field_delimiter=args.field_delimiter,
             is_output_summary_stats=args.output_summary_stats,
+            distance_engine=args.distance_engine,
+            is_batch_targets=args.batch_targets,
+            is_memory_map_prior=not args.no_memory_map,
+            distance_type=args.distance_type,
+            stat_weights=reject.read_stat_weights(args.stat_weights, args.field_delimiter) if args.stat_weights else None,
+            is_use_spatial_index=args.spatial_index,
+            num_reduced_dimensions=args.reduce_dimensions,
+            reduction_sample_size=args.reduction_sample_size,
+            reduction_random_seed=args.reduction_random_seed,
             )
-    gr.read_simulated_data(args.simulations_data_filepaths)
-    gr.write_posterior(target_data_filepath=args.target_data_filepath,)
+    if args.stream or args.num_processes > 1:
+        gr.stream_posterior(
+                target_data_filepath=args.target_data_filepath,
+                simulations_data_filepaths=args.simulations_data_filepaths,
+                chunk_size=args.chunk_size,
+                num_processes=args.num_processes)
+    else:
+        gr.read_simulated_data(args.simulations_data_filepaths, chunk_size=args.chunk_size)
+        gr.write_posterior(
+                target_data_filepath=args.target_data_filepath,
+                chunk_size=args.chunk_size)
 
 if __name__ == "__main__":
     main()
@@ -34,6 +34,11 @@ def main():
         type=str,
         default=None,
         help="Directory within which to create temporary directories and files.")
+    output_options.add_argument('--working-directory-backend',
+        choices=utility.WORKING_DIRECTORY_BACKENDS,
+        default="disk",
+        help="Where to create temporary directories and files: 'disk' (under the directory given by '-w', if any, or the system default), or 'memory'"
+             " (a RAM-backed file system such as '/dev/shm', if available, falling back to 'disk' otherwise) (default: %(default)s).")
     output_options.add_argument(
             "-U",
             "--unfolded-site-frequency-spectrum",
@@ -75,18 +80,63 @@ def main():
             action="store_true",
             default=False,
             help="Do not writer header row.")
+    output_options.add_argument("--sharded-output",
+            action="store_true",
+            default=False,
+            help="Each worker process writes its results to its own file,"
+                 " '<OUTPUT-FILE-PREFIX>.part-<N>.sumstats.tsv', described by a"
+                 " manifest, '<OUTPUT-FILE-PREFIX>.sumstats.manifest.json',"
+                 " rather than sending them to the main process to write.")
+    output_options.add_argument("--merge-shards",
+            action="store_true",
+            default=False,
+            help="With '--sharded-output', concatenate the files written by the"
+                 " worker processes into a single file at the end of the run"
+                 " (removing them and the manifest).")
 
     run_options = parser.add_argument_group("Run Options")
     run_options.add_argument("-n", "--num-reps",
             type=int,
             default=1,
             help="Number of replicates (default: %(default)s).")
+    run_options.add_argument("--replicates-per-draw",
+            type=int,
+            default=1,
+            metavar="#",
+            help="Number of replicates to simulate under each draw of parameter values from the prior, with a single FastSimCoal2 run per locus for all of them (default: %(default)s)."
+                 " Values greater than 1 give replicates that are not independent draws from the prior, and so are intended for, e.g., power analyses with fixed numbers of divergence times ('numTauClasses'), rather than building a prior for rejection.")
     run_options.add_argument("-m", "--num-processes",
             default=1,
             type=int,
             help="Number of processes/CPU to run (default: %(default)s).")
+    run_options.add_argument("--results-batch-size",
+            type=int,
+            default=1,
+            metavar="#",
+            help="Number of replicates each worker process sends back to the main process at a time (default: %(default)s)."
+                 " Larger batches (e.g., 256) reduce the work of the main process when running many processes.")
+    run_options.add_argument("--prior-only",
+            action="store_true",
+            default=False,
+            help="Only sample parameter values from the prior (in batches, using NumPy), writing them to '<OUTPUT-FILE-PREFIX>.prior.tsv', without simulating summary statistics.")
+    run_options.add_argument("--exact-partition-prior",
+            action="store_true",
+            default=False,
+            help="Precompute the exact prior probabilities of the divergence time models (partitions of the lineage pairs), integrated over the hyperprior on the concentration, and draw the models from these rather than by the Dirichlet process,"
+                 " writing them to '<OUTPUT-FILE-PREFIX>.partition-prior.tsv' for post-processing (for up to {} lineage pairs, and not with 'numTauClasses').".format(simulate.PARTITION_PRIOR_MAX_ELEMENTS))
+    run_options.add_argument("--checkpoint-frequency",
+            type=int,
+            default=0,
+            metavar="#",
+            help="Number of replicates between checkpoints, recording progress in '<OUTPUT-FILE-PREFIX>.checkpoint.json' so that the run can be resumed with '--resume' if interrupted (0: no checkpoints) (default: %(default)s)."
+                 " With checkpoints, each batch of results sent back by the worker processes carries the state of their random number generator, so a larger '--results-batch-size' reduces the overhead.")
+    run_options.add_argument("--resume",
+            action="store_true",
+            default=False,
+            help="Resume an interrupted run from its last checkpoint: the output file is truncated to the replicates recorded by the checkpoint, and the remaining replicates simulated as the interrupted run would have (with the same number of processes), ignoring '-n'.")
     run_options.add_argument("-z", "--random-seed",
             default=None,
+            type=int,
             help="Seed for random number generator engine.")
     run_options.add_argument("--log-frequency",
             default=None,
@@ -108,12 +158,32 @@ def main():
             help="Run in debugging mode.")
 
     fsc2_options = parser.add_argument_group("FastSimCoal2 Options")
+    fsc2_options.add_argument("--simulator-backend",
+            choices=simulate.SIMULATOR_BACKENDS,
+            default="fsc2",
+            help="Simulate using FastSimCoal2 ('fsc2') or, without it, the built-in implementation of the same model ('native') (default: %(default)s).")
     fsc2_options.add_argument("--fsc2-path",
             metavar="FSC2-PATH",
             default="fsc25",
             help="Path to FastsimCoal2 application (default: %(default)s).")
+    fsc2_options.add_argument("--batch-loci",
+            action="store_true",
+            default=False,
+            help="Simulate loci with identical configurations (same sample sizes, number of sites, and rates) in a single FastSimCoal2 run for each replicate, rather than one run per locus.")
 
     args = parser.parse_args()
+    if args.merge_shards and not args.sharded_output:
+        sys.exit("'--merge-shards' requires '--sharded-output'")
+    if args.append and args.sharded_output:
+        sys.exit("'--append' cannot be used with '--sharded-output'")
+    if args.resume and args.append:
+        sys.exit("'--resume' cannot be used with '--append'")
+    if args.resume and args.sharded_output:
+        sys.exit("'--resume' cannot be used with '--sharded-output'")
+    if args.prior_only and (args.sharded_output or args.resume):
+        sys.exit("'--prior-only' cannot be used with '--sharded-output' or '--resume'")
+    if args.checkpoint_frequency < 0:
+        sys.exit("'--checkpoint-frequency' must not be negative")
 
     config_d = {}
     utility.parse_legacy_configuration(
@@ -129,7 +199,9 @@ def main():
         config_d["logging_frequency"] = None
     else:
         config_d["logging_frequency"] = args.log_frequency
+    config_d["random_seed"] = args.random_seed
     config_d["fsc2_path"] = args.fsc2_path
+    config_d["simulator_backend"] = args.simulator_backend
     config_d["file_logging_level"] = args.file_logging_level
     config_d["standard_error_logging_level"] = args.stderr_logging_level
     # config_d["log_to_file"] = args.log_to_file
@@ -140,33 +212,103 @@ def main():
     config_d["stat_label_prefix"] = args.summary_stats_label_prefix
     config_d["supplemental_labels"] = utility.parse_fieldname_and_value(args.labels)
     config_d["is_include_model_id_field"] = args.include_model_id_field
+    config_d["is_batch_loci"] = args.batch_loci
+    config_d["num_replicates_per_draw"] = args.replicates_per_draw
+    config_d["results_batch_size"] = args.results_batch_size
+    config_d["is_precompute_partition_prior"] = args.exact_partition_prior
+    filepath = config_d["output_prefix"] + simulate.SUMSTATS_SUFFIX
+    checkpoint_filepath = config_d["output_prefix"] + simulate.CHECKPOINT_SUFFIX
+    num_reps = args.num_reps
+    num_processes = args.num_processes
+    checkpoint = None
+    if args.resume:
+        if not os.path.exists(checkpoint_filepath):
+            sys.exit("No checkpoint to resume from: '{}'".format(checkpoint_filepath))
+        checkpoint = simulate.read_checkpoint(checkpoint_filepath)
+        filepath = checkpoint["output_filepath"]
+        num_reps = checkpoint["num_replicates"] - checkpoint["num_replicates_completed"]
+        if num_reps <= 0:
+            sys.stderr.write("All {} replicates already completed: '{}'\n".format(checkpoint["num_replicates"], filepath))
+            return
+        num_processes = len(checkpoint["workers"])
+        simulate.truncate_output_to_checkpoint(checkpoint)
+        sys.stderr.write("Resuming from checkpoint: {} of {} replicates completed, with {} processes\n".format(
+            checkpoint["num_replicates_completed"],
+            checkpoint["num_replicates"],
+            num_processes))
+    working_directory_parent, working_directory_backend = utility.get_working_directory_parent(
+            backend=args.working_directory_backend,
+            parent_dir=args.working_directory_parent)
+    if working_directory_backend != args.working_directory_backend:
+        sys.stderr.write("No RAM-backed file system available for working files: using disk instead\n")
     with utility.TemporaryDirectory(
             prefix="gerenuk-",
-            parent_dir=args.working_directory_parent,
+            parent_dir=working_directory_parent,
             is_suppress_cleanup=args.no_cleanup) as working_directory:
         config_d["working_directory"] = working_directory
         gs = simulate.GerenukSimulator(
                 config_d=config_d,
-                num_processes=args.num_processes,
+                num_processes=num_processes,
                 is_verbose_setup=True)
-        filepath = config_d["output_prefix"] + ".sumstats.tsv"
-        dest = utility.open_destput_file_for_csv_writer(
-                filepath=filepath,
-                is_append=args.append)
-        if args.append or args.no_write_header:
+        if args.append or args.no_write_header or args.resume:
             is_write_header = False
         else:
             is_write_header = True
+        if args.exact_partition_prior:
+            partition_prior_filepath = config_d["output_prefix"] + simulate.PARTITION_PRIOR_SUFFIX
+            with utility.open_destput_file_for_csv_writer(filepath=partition_prior_filepath) as dest:
+                gs.model.partition_prior.write(utility.get_csv_writer(dest=dest, delimiter=args.field_delimiter))
+            gs.run_logger.info("Prior probabilities of divergence time models written: '{}'".format(partition_prior_filepath))
+        if args.prior_only:
+            filepath = config_d["output_prefix"] + simulate.PRIOR_ONLY_SUFFIX
+            with utility.open_destput_file_for_csv_writer(filepath=filepath, is_append=args.append) as dest:
+                gs.write_prior_samples(
+                        nreps=num_reps,
+                        results_csv_writer=utility.get_csv_writer(dest=dest, delimiter=args.field_delimiter),
+                        is_write_header=is_write_header)
+            gs.run_logger.info("Results written: '{}'".format(filepath))
+            return
+        if args.sharded_output:
+            try:
+                manifest_filepath = gs.execute(
+                        nreps=num_reps,
+                        is_write_header=is_write_header,
+                        shard_output_prefix=config_d["output_prefix"],
+                        field_delimiter=args.field_delimiter)
+                if args.merge_shards:
+                    simulate.merge_sharded_output(
+                            manifest_filepath=manifest_filepath,
+                            output_filepath=filepath,
+                            is_remove_shards=True)
+                    gs.run_logger.info("Results merged: '{}'".format(filepath))
+            except Exception as e:
+                sys.stderr.write("Traceback (most recent call last):\n  {}{}\n".format(
+                    "  ".join(traceback.format_tb(sys.exc_info()[2])),
+                    e))
+                sys.exit(1)
+            return
+        dest = utility.open_destput_file_for_csv_writer(
+                filepath=filepath,
+                is_append=args.append or args.resume)
         with dest:
             writer = utility.get_csv_writer(
                     dest=dest,
                     delimiter=args.field_delimiter)
+            if args.checkpoint_frequency > 0 or checkpoint is not None:
+                checkpointer = simulate.SimulationCheckpointer(
+                        filepath=checkpoint_filepath,
+                        output_dest=dest,
+                        frequency=args.checkpoint_frequency if args.checkpoint_frequency > 0 else checkpoint["num_replicates"],
+                        checkpoint=checkpoint)
+            else:
+                checkpointer = None
             try:
                 results = gs.execute(
-                        nreps=args.num_reps,
+                        nreps=num_reps,
                         results_csv_writer=writer,
                         results_store=None,
-                        is_write_header=is_write_header)
+                        is_write_header=is_write_header,
+                        checkpointer=checkpointer)
             except Exception as e:
                 sys.stderr.write("Traceback (most recent call last):\n  {}{}\n".format(
                     "  ".join(traceback.format_tb(sys.exc_info()[2])),
@@ -0,0 +1,189 @@
+#! /usr/bin/env python
+
+##############################################################################
+## Copyright (c) 2017 Jeet Sukumaran.
+## All rights reserved.
+##
+## Redistribution and use in source and binary forms, with or without
+## modification, are permitted provided that the following conditions are met:
+##
+##     * Redistributions of source code must retain the above copyright
+##       notice, this list of conditions and the following disclaimer.
+##     * Redistributions in binary form must reproduce the above copyright
+##       notice, this list of conditions and the following disclaimer in the
+##       documentation and/or other materials provided with the distribution.
+##     * The names of its contributors may not be used to endorse or promote
+##       products derived from this software without specific prior written
+##       permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+## IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL JEET SUKUMARAN BE LIABLE FOR ANY
+## DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+## (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+## LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+## AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+## (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+## SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+##
+##############################################################################
+
+"""
+Simulation of site frequency spectra under the two-deme isolation model of
+``gerenuk.simulate.FSC2_CONFIG_TEMPLATE`` without FastSimCoal2: two demes
+diverged at a single time in the past from an ancestral deme, with no
+migration or recombination and infinite-sites mutation. All the replicates
+of a configuration are simulated together, with each coalescent event
+processed for all the replicates at once.
+
+Population sizes are numbers of genes and times are in generations, as in
+FastSimCoal2: a pair of lineages in a deme of size N coalesces at rate 1/N
+per generation, and the ancestral deme is twice the size of deme 1 (the
+relative size of the sink deme in the historical event of the template).
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _coalesce(counts, num_lineages, pop_size, duration, branch_lengths, rng):
+    # Runs the coalescent process for up to ``duration`` generations (or
+    # until a single lineage remains, if ``duration`` is infinite) in a deme
+    # of ``pop_size`` genes. ``counts`` gives, for each replicate (row) and
+    # lineage (column), the number of sampled genes of each of the two demes
+    # that descend from the lineage, with lineages ``num_lineages`` and
+    # higher of a replicate being inactive. The time each lineage spends in
+    # the process is added to ``branch_lengths``, indexed by replicate and
+    # the numbers of descendant genes in deme 0 and deme 1.
+    num_replicates, max_lineages = counts.shape[:2]
+    num_cells = branch_lengths.shape[1] * branch_lengths.shape[2]
+    flat_branch_lengths = branch_lengths.reshape(-1)
+    replicate_idxs = numpy.arange(num_replicates)
+    lineage_idxs = numpy.arange(max_lineages)
+    elapsed = numpy.zeros(num_replicates)
+    is_done = numpy.zeros(num_replicates, dtype=bool)
+    while not is_done.all():
+        rates = num_lineages * (num_lineages - 1) / (2.0 * pop_size)
+        with numpy.errstate(divide="ignore"):
+            waiting_times = rng.standard_exponential(num_replicates) / rates
+        is_coalescing = ~is_done & (elapsed + waiting_times < duration)
+        intervals = numpy.where(is_coalescing, waiting_times, duration - elapsed)
+        intervals[is_done | ~numpy.isfinite(intervals)] = 0.0
+        is_active = lineage_idxs < num_lineages[:, None]
+        cells = (replicate_idxs[:, None] * num_cells
+                + counts[:, :, 0] * branch_lengths.shape[2]
+                + counts[:, :, 1])
+        flat_branch_lengths += numpy.bincount(
+                cells[is_active],
+                weights=numpy.broadcast_to(intervals[:, None], is_active.shape)[is_active],
+                minlength=flat_branch_lengths.shape[0])
+        elapsed += intervals
+        is_done |= ~is_coalescing
+        # merge a random pair of the active lineages of each coalescing
+        # replicate, moving the last active lineage into the vacated slot
+        rows = replicate_idxs[is_coalescing]
+        k = num_lineages[rows]
+        first = (rng.random_sample(len(rows)) * k).astype(int)
+        second = (rng.random_sample(len(rows)) * (k - 1)).astype(int)
+        second += second >= first
+        low = numpy.minimum(first, second)
+        high = numpy.maximum(first, second)
+        counts[rows, low] += counts[rows, high]
+        counts[rows, high] = counts[rows, k - 1]
+        num_lineages[rows] -= 1
+    return counts, num_lineages
+
+def simulate_branch_lengths(
+        num_replicates,
+        sample_sizes,
+        population_sizes,
+        div_time,
+        rng):
+    """
+    Returns the total length (in generations) of the branches of the
+    genealogies of ``num_replicates`` replicates, as an array indexed by
+    replicate and the numbers of genes sampled from deme 0 and from deme 1
+    that descend from the branches.
+    """
+    n0, n1 = sample_sizes
+    branch_lengths = numpy.zeros((num_replicates, n0 + 1, n1 + 1))
+    counts = numpy.zeros((num_replicates, n0 + n1, 2), dtype=int)
+    num_lineages = []
+    for deme_idx, sample_size in enumerate(sample_sizes):
+        deme_counts = numpy.zeros((num_replicates, sample_size, 2), dtype=int)
+        deme_counts[:, :, deme_idx] = 1
+        deme_num_lineages = numpy.full(num_replicates, sample_size, dtype=int)
+        _coalesce(
+                counts=deme_counts,
+                num_lineages=deme_num_lineages,
+                pop_size=population_sizes[deme_idx],
+                duration=div_time,
+                branch_lengths=branch_lengths,
+                rng=rng)
+        # pool the lineages of both demes that remain at the divergence
+        # time, with those of deme 0 first
+        offsets = num_lineages[0] if num_lineages else numpy.zeros(num_replicates, dtype=int)
+        is_active = numpy.arange(sample_size) < deme_num_lineages[:, None]
+        rows, cols = numpy.nonzero(is_active)
+        counts[rows, cols + offsets[rows]] = deme_counts[rows, cols]
+        num_lineages.append(deme_num_lineages)
+    _coalesce(
+            counts=counts,
+            num_lineages=num_lineages[0] + num_lineages[1],
+            pop_size=2 * population_sizes[1],
+            duration=numpy.inf,
+            branch_lengths=branch_lengths,
+            rng=rng)
+    return branch_lengths
+
+def get_folding_indexes(sample_sizes):
+    """
+    Returns, for each cell of the joint site frequency spectrum, the flat
+    index of the cell of the folded (minor allele) spectrum it maps to: the
+    cell itself if the derived allele is present in at most half of all the
+    genes sampled, or that of the ancestral allele otherwise.
+    """
+    n0, n1 = sample_sizes
+    i, j = numpy.meshgrid(numpy.arange(n0 + 1), numpy.arange(n1 + 1), indexing="ij")
+    is_major = 2 * (i + j) > n0 + n1
+    i = numpy.where(is_major, n0 - i, i)
+    j = numpy.where(is_major, n1 - j, j)
+    return i * (n1 + 1) + j
+
+def simulate_joint_site_frequency_spectra(
+        num_replicates,
+        sample_sizes,
+        population_sizes,
+        div_time,
+        mutation_rate,
+        num_sites,
+        is_unfolded_site_frequency_spectrum,
+        rng):
+    """
+    Returns the joint site frequency spectra of ``num_replicates``
+    replicates, as an array indexed by replicate and the numbers of genes of
+    deme 0 and of deme 1 with the derived (if
+    ``is_unfolded_site_frequency_spectrum``) or minor allele. Sites that are
+    not polymorphic are counted in the first cell.
+    """
+    if numpy is None:
+        raise ImportError("The native simulation backend requires NumPy")
+    branch_lengths = simulate_branch_lengths(
+            num_replicates=num_replicates,
+            sample_sizes=sample_sizes,
+            population_sizes=population_sizes,
+            div_time=div_time,
+            rng=rng)
+    sfs = rng.poisson(branch_lengths * (mutation_rate * num_sites))
+    if not is_unfolded_site_frequency_spectrum:
+        num_cells = sfs[0].size
+        cells = (numpy.arange(num_replicates)[:, None] * num_cells
+                + get_folding_indexes(sample_sizes).reshape(1, -1))
+        sfs = numpy.bincount(
+                cells.reshape(-1),
+                weights=sfs.reshape(-1),
+                minlength=sfs.size).astype(sfs.dtype).reshape(sfs.shape)
+    sfs[:, 0, 0] = numpy.maximum(num_sites - sfs.reshape(num_replicates, -1).sum(axis=1), 0)
+    return sfs
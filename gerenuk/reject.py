@@ -0,0 +1,1822 @@
+#! /usr/bin/env python
+
+##############################################################################
+## Copyright (c) 2017 Jeet Sukumaran.
+## All rights reserved.
+##
+## Redistribution and use in source and binary forms, with or without
+## modification, are permitted provided that the following conditions are met:
+##
+##     * Redistributions of source code must retain the above copyright
+##       notice, this list of conditions and the following disclaimer.
+##     * Redistributions in binary form must reproduce the above copyright
+##       notice, this list of conditions and the following disclaimer in the
+##       documentation and/or other materials provided with the distribution.
+##     * The names of its contributors may not be used to endorse or promote
+##       products derived from this software without specific prior written
+##       permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+## IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL JEET SUKUMARAN BE LIABLE FOR ANY
+## DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+## (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+## LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+## AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+## (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+## SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+##
+##############################################################################
+
+import math
+import bisect
+import heapq
+import itertools
+import collections
+import csv
+import json
+import os
+import sys
+import multiprocessing
+import traceback
+import pickle
+import hashlib
+import random
+import time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from scipy import spatial as scipy_spatial
+except ImportError:
+    scipy_spatial = None
+
+from gerenuk import utility
+
+if not (sys.version_info.major >= 3 and sys.version_info.minor >= 4):
+    open = utility.pre_py34_open
+
+# Number of cells (rows x columns) of the prior processed at a time by the
+# NumPy distance engine: keeps the work buffer (256KB) within the L2 cache.
+DISTANCE_BLOCK_NUM_CELLS = 1 << 15
+
+# Number of rows of the simulation files parsed at a time.
+DEFAULT_CHUNK_SIZE = 10000
+
+# Binary prior: a manifest, '<prefix>.prior.json', describing the summary
+# statistics, stored as a float64 matrix in '<prefix>.stats.npy', and the
+# other (parameter) fields, stored as a tab-delimited '<prefix>.params.tsv'.
+BINARY_PRIOR_FORMAT = "gerenuk-binary-prior"
+BINARY_PRIOR_FORMAT_VERSION = 1
+BINARY_PRIOR_MANIFEST_SUFFIX = ".prior.json"
+BINARY_PRIOR_STATS_SUFFIX = ".stats.npy"
+BINARY_PRIOR_PARAMS_SUFFIX = ".params.tsv"
+BINARY_PRIOR_PARAMS_DELIMITER = "\t"
+
+# Scales of the summary statistics for standardized and weighted distances,
+# cached beside the prior, named after its first file: '<prefix>.scales.json'
+# for a binary prior, or '<filename>.scales.json' for a simulation file.
+STAT_SCALES_FORMAT = "gerenuk-stat-scales"
+STAT_SCALES_FORMAT_VERSION = 1
+STAT_SCALES_SUFFIX = ".scales.json"
+
+DISTANCE_TYPES = ("euclidean", "standardized", "weighted")
+
+# Spatial index (KD-tree) over the summary statistics of the prior, cached
+# beside the prior in the same way as the scales.
+SPATIAL_INDEX_FORMAT = "gerenuk-spatial-index"
+SPATIAL_INDEX_FORMAT_VERSION = 1
+SPATIAL_INDEX_SUFFIX = ".kdtree.pickle"
+
+# Dimension reduction: principal components of the (scaled) summary
+# statistics, fitted on a random sample of the prior and cached beside it.
+REDUCTION_FORMAT = "gerenuk-pca-reduction"
+REDUCTION_FORMAT_VERSION = 1
+REDUCTION_SUFFIX = ".pca.npz"
+DEFAULT_REDUCTION_SAMPLE_SIZE = 10000
+
+def is_binary_prior(filepath):
+    return filepath.endswith(BINARY_PRIOR_MANIFEST_SUFFIX)
+
+def read_binary_prior_manifest(filepath):
+    """
+    Returns the manifest of a binary prior as a dictionary, with the paths
+    of the statistics and parameters files resolved relative to it.
+    """
+    with open(filepath) as src:
+        manifest = json.load(src)
+    if manifest.get("format") != BINARY_PRIOR_FORMAT:
+        raise ValueError("File '{}': not a binary prior manifest".format(filepath))
+    if manifest.get("version") != BINARY_PRIOR_FORMAT_VERSION:
+        raise ValueError("File '{}': unsupported binary prior version: {}".format(filepath, manifest.get("version")))
+    dirpath = os.path.dirname(os.path.abspath(filepath))
+    manifest["stats_filepath"] = os.path.join(dirpath, manifest["stats_filename"])
+    manifest["params_filepath"] = os.path.join(dirpath, manifest["params_filename"])
+    return manifest
+
+def open_binary_prior_stats(manifest, mmap_mode="r"):
+    """
+    Returns the summary statistics matrix of a binary prior, memory-mapped
+    read-only by default.
+    """
+    stat_matrix = numpy.load(manifest["stats_filepath"], mmap_mode=mmap_mode)
+    if stat_matrix.shape != (manifest["num_samples"], len(manifest["stat_fieldnames"])):
+        raise ValueError("File '{}': expecting {} x {} values but found {} x {}".format(
+            manifest["stats_filepath"],
+            manifest["num_samples"],
+            len(manifest["stat_fieldnames"]),
+            stat_matrix.shape[0],
+            stat_matrix.shape[1]))
+    return stat_matrix
+
+def get_binary_prior_params_offsets(manifest, row_idxs):
+    """
+    Returns the byte offset in the parameters file of a binary prior of the
+    start of each of the rows ``row_idxs`` (in increasing order), found by
+    scanning the file for the ends of lines, without parsing it.
+    """
+    offsets = []
+    row_idxs = iter(row_idxs)
+    next_row_idx = next(row_idxs, None)
+    with open(manifest["params_filepath"], "rb") as src:
+        offset = len(src.readline()) # header
+        for row_idx, line in enumerate(src):
+            while next_row_idx == row_idx:
+                offsets.append(offset)
+                next_row_idx = next(row_idxs, None)
+            if next_row_idx is None:
+                break
+            offset += len(line)
+    if next_row_idx is not None:
+        raise ValueError("File '{}': expecting {} rows but found {}".format(
+            manifest["params_filepath"], manifest["num_samples"], next_row_idx))
+    return offsets
+
+class ShardedStatMatrix(object):
+    """
+    Presents a sequence of summary statistic matrices with the same columns
+    (e.g., several memory-mapped binary priors) as the single matrix of
+    their rows stacked, without copying them into one array. Supports what
+    the distance engine needs: ``shape``, ``len()``, and indexing by row,
+    by a contiguous slice of rows (which is a zero-copy view unless the
+    slice straddles two shards), or by an array of row indexes (a copy).
+    """
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        num_cols = self.shards[0].shape[1]
+        for shard in self.shards:
+            if shard.shape[1] != num_cols:
+                raise ValueError("Expecting {} columns but found {}".format(num_cols, shard.shape[1]))
+        self.shard_offsets = [0]
+        for shard in self.shards:
+            self.shard_offsets.append(self.shard_offsets[-1] + shard.shape[0])
+        self.shape = (self.shard_offsets[-1], num_cols)
+        self.dtype = self.shards[0].dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _locate(self, row_idx):
+        shard_idx = bisect.bisect_right(self.shard_offsets, row_idx) - 1
+        return shard_idx, row_idx - self.shard_offsets[shard_idx]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.shape[0])
+            if step != 1:
+                raise IndexError("Only contiguous slices are supported")
+            pieces = []
+            while start < stop:
+                shard_idx, local_start = self._locate(start)
+                shard = self.shards[shard_idx]
+                local_stop = min(shard.shape[0], local_start + (stop - start))
+                pieces.append(shard[local_start:local_stop])
+                start += local_stop - local_start
+            if len(pieces) == 1:
+                return pieces[0]
+            elif not pieces:
+                return numpy.empty((0, self.shape[1]), dtype=self.dtype)
+            return numpy.concatenate(pieces)
+        if isinstance(key, (numpy.ndarray, list)):
+            indexes = numpy.asarray(key, dtype=numpy.intp)
+            if indexes.size and (indexes.min() < 0 or indexes.max() >= self.shape[0]):
+                raise IndexError("Row index out of range")
+            shard_idxs = numpy.searchsorted(self.shard_offsets, indexes, side="right") - 1
+            rows = numpy.empty((len(indexes), self.shape[1]), dtype=self.dtype)
+            for shard_idx, shard in enumerate(self.shards):
+                is_in_shard = shard_idxs == shard_idx
+                if is_in_shard.any():
+                    rows[is_in_shard] = shard[indexes[is_in_shard] - self.shard_offsets[shard_idx]]
+            return rows
+        if key < 0:
+            key += self.shape[0]
+        if key < 0 or key >= self.shape[0]:
+            raise IndexError("Row index out of range: {}".format(key))
+        shard_idx, local_idx = self._locate(key)
+        return self.shards[shard_idx][local_idx]
+
+def get_prior_sidecar_filepath(filepaths, suffix):
+    """
+    Path of a file of data derived from the prior, stored beside (and named
+    after) its first file.
+    """
+    filepath = filepaths[0]
+    if is_binary_prior(filepath):
+        return filepath[:-len(BINARY_PRIOR_MANIFEST_SUFFIX)] + suffix
+    return filepath + suffix
+
+def get_stat_scales_filepath(filepaths):
+    return get_prior_sidecar_filepath(filepaths, STAT_SCALES_SUFFIX)
+
+def get_spatial_index_filepath(filepaths):
+    return get_prior_sidecar_filepath(filepaths, SPATIAL_INDEX_SUFFIX)
+
+def get_reduction_filepath(filepaths):
+    return get_prior_sidecar_filepath(filepaths, REDUCTION_SUFFIX)
+
+def describe_prior_sources(filepaths):
+    """
+    Identifies the files of a prior by path, size, and modification time, so
+    that data derived from them (e.g., cached scales) are not used if they
+    change.
+    """
+    sources = []
+    for filepath in filepaths:
+        st = os.stat(filepath)
+        sources.append([os.path.abspath(filepath), st.st_size, st.st_mtime])
+    return sources
+
+def read_stat_weights(filepath, field_delimiter="\t"):
+    """
+    Reads the weights of the summary statistics for the 'weighted'
+    distance: a file with a header row of the summary statistic field names
+    and a single row of weights. Returns a dictionary of weights by field
+    name.
+    """
+    with open(filepath) as src:
+        reader = csv.reader(
+                src,
+                delimiter=field_delimiter,
+                quoting=csv.QUOTE_NONE)
+        rows = [row for row in reader if row]
+    if len(rows) != 2 or len(rows[0]) != len(rows[1]):
+        raise ValueError("File '{}': expecting a header row and a single row of weights".format(filepath))
+    weights = collections.OrderedDict()
+    for key, value in zip(rows[0], rows[1]):
+        weights[key] = float(value)
+        if weights[key] < 0:
+            raise ValueError("File '{}': negative weight for field '{}'".format(filepath, key))
+    return weights
+
+class ColumnMomentsAccumulator(object):
+    """
+    Running count, mean, and sum of squared deviations from the mean of each
+    column of the summary statistics, updated chunk by chunk in a single pass
+    (Welford's algorithm, with the per-chunk moments merged as in Chan et
+    al.), giving the standard deviations without holding on to the data.
+
+    The per-chunk sums are accumulated in row order with either engine, so
+    that the scales (and hence the distances) are identical across engines.
+    """
+
+    def __init__(self, num_cols):
+        self.num_rows = 0
+        self.means = [0.0] * num_cols
+        self.m2s = [0.0] * num_cols
+
+    def add_chunk(self, stat_rows):
+        num_rows = len(stat_rows)
+        if num_rows == 0:
+            return
+        if numpy is not None and isinstance(stat_rows, numpy.ndarray):
+            # `cumsum()` rather than `sum()`, as the latter sums pairwise
+            chunk_means = numpy.cumsum(stat_rows, axis=0)[-1] / num_rows
+            deviations = stat_rows - chunk_means
+            chunk_m2s = numpy.cumsum(deviations * deviations, axis=0)[-1].tolist()
+            chunk_means = chunk_means.tolist()
+        else:
+            chunk_means = []
+            chunk_m2s = []
+            for column in zip(*stat_rows):
+                total = 0.0
+                for value in column:
+                    total += value
+                mean = total / num_rows
+                total = 0.0
+                for value in column:
+                    total += (value - mean) * (value - mean)
+                chunk_means.append(mean)
+                chunk_m2s.append(total)
+        if self.num_rows == 0:
+            self.num_rows = num_rows
+            self.means = chunk_means
+            self.m2s = chunk_m2s
+            return
+        total_rows = self.num_rows + num_rows
+        for col_idx, (chunk_mean, chunk_m2) in enumerate(zip(chunk_means, chunk_m2s)):
+            delta = chunk_mean - self.means[col_idx]
+            self.means[col_idx] += delta * num_rows / total_rows
+            self.m2s[col_idx] += chunk_m2 + delta * delta * self.num_rows * num_rows / total_rows
+        self.num_rows = total_rows
+
+    def get_standard_deviations(self):
+        if self.num_rows < 2:
+            return [0.0 for m2 in self.m2s]
+        return [math.sqrt(m2 / (self.num_rows - 1)) for m2 in self.m2s]
+
+def euclidean_distances(stat_matrix, target_stat_values, block_num_cells=DISTANCE_BLOCK_NUM_CELLS, column_scales=None):
+    """
+    Returns a vector of the Euclidean distances between each row of
+    ``stat_matrix`` and ``target_stat_values``, with the difference in each
+    column multiplied by the corresponding entry of ``column_scales``, if
+    given.
+
+    The rows are processed in blocks, transposed so that the squared
+    differences of each row are summed column-by-column in order (i.e., not
+    pairwise), so that the distances are bit-for-bit identical to those
+    calculated by ``GerenukRejector.euclidean_distance``. If
+    ``is_einsum_exact()``, the differences are squared and summed in a
+    single pass by ``numpy.einsum``.
+    """
+    num_rows, num_cols = stat_matrix.shape
+    target_stat_values = numpy.asarray(target_stat_values, dtype=numpy.float64)
+    assert target_stat_values.shape == (num_cols,)
+    distances = numpy.zeros(num_rows, dtype=numpy.float64)
+    if num_cols == 0 or num_rows == 0:
+        return distances
+    target_column = target_stat_values[:, numpy.newaxis]
+    if column_scales is not None:
+        scales_column = numpy.asarray(column_scales, dtype=numpy.float64)[:, numpy.newaxis]
+    is_einsum = is_einsum_exact()
+    block_size = max(1, block_num_cells // num_cols)
+    buffer = numpy.empty((num_cols, min(block_size, num_rows)), dtype=numpy.float64)
+    for start in range(0, num_rows, block_size):
+        stop = min(start + block_size, num_rows)
+        work = buffer[:, :stop-start]
+        numpy.subtract(stat_matrix[start:stop].T, target_column, out=work)
+        if column_scales is not None:
+            numpy.multiply(work, scales_column, out=work)
+        if stop - start == 1:
+            # NumPy sums a lone column pairwise: accumulate it in order instead
+            numpy.multiply(work, work, out=work)
+            distances[start] = numpy.cumsum(work[:, 0])[-1]
+        elif is_einsum:
+            numpy.einsum("ij,ij->j", work, work, out=distances[start:stop])
+        else:
+            numpy.multiply(work, work, out=work)
+            numpy.add.reduce(work, axis=0, out=distances[start:stop])
+    numpy.sqrt(distances, out=distances)
+    return distances
+
+_IS_EINSUM_EXACT = None
+
+def is_einsum_exact():
+    """
+    Returns True if ``numpy.einsum("ij,ij->j", ...)`` gives the same results
+    as squaring and then summing the rows in order with
+    ``numpy.add.reduce``, as it does with NumPy's baseline builds: it is not
+    guaranteed to (e.g., NumPy built for a CPU with fused multiply-add
+    instructions may use them), so this is checked on random values, once.
+    """
+    global _IS_EINSUM_EXACT
+    if _IS_EINSUM_EXACT is None:
+        rng = numpy.random.RandomState(1)
+        _IS_EINSUM_EXACT = True
+        for num_cols, num_rows in ((2, 3), (7, 64), (1000, 32), (300, 1000)):
+            work = rng.standard_normal((num_cols, num_rows)) * 3.7
+            if not numpy.array_equal(
+                    numpy.einsum("ij,ij->j", work, work),
+                    numpy.add.reduce(work * work, axis=0)):
+                _IS_EINSUM_EXACT = False
+                break
+    return _IS_EINSUM_EXACT
+
+def select_closest(distances, num_to_retain):
+    """
+    Returns the indexes of the ``num_to_retain`` smallest values of the
+    vector ``distances``, ordered by distance and then index (i.e., the same
+    as the first ``num_to_retain`` of a stable sort of all the distances).
+
+    Only the retained values are sorted: the rest are discarded by an
+    O(n) partial selection, with ties at the boundary resolved in favor of
+    the lowest indexes.
+    """
+    num_values = len(distances)
+    if num_to_retain <= 0:
+        return numpy.empty(0, dtype=numpy.intp)
+    if num_to_retain >= num_values:
+        return numpy.argsort(distances, kind="stable")
+    partition = numpy.argpartition(distances, num_to_retain - 1)
+    threshold = distances[partition[num_to_retain - 1]]
+    indexes = numpy.flatnonzero(distances < threshold)
+    ties = numpy.flatnonzero(distances == threshold)[:num_to_retain - len(indexes)]
+    indexes = numpy.concatenate((indexes, ties))
+    return indexes[numpy.lexsort((indexes, distances[indexes]))]
+
+def batch_closest_candidates(
+        stat_matrix,
+        target_matrix,
+        num_to_retain=None,
+        max_distances=None,
+        column_scales=None):
+    """
+    Screens all the rows of ``stat_matrix`` against all the targets (rows of
+    ``target_matrix``) at once, using a single matrix product in the
+    expansion ``|x - t|^2 = |x|^2 + |t|^2 - 2 x.t``.
+
+    This is fast but not exact, so it is only used to discard rows that
+    cannot possibly be accepted, allowing for the worst-case rounding error
+    of the expansion: i.e., those rows that are not within the
+    ``num_to_retain`` closest to a target, or further than the target's
+    entry in ``max_distances`` (None for no limit). For each target, returns
+    a tuple of the indexes of the remaining rows and their exact distances
+    (from ``euclidean_distances``), so that what is accepted is identical to
+    scoring each target separately. If ``column_scales`` is given, the
+    distances are scaled as by ``euclidean_distances``.
+    """
+    num_rows, num_cols = stat_matrix.shape
+    num_targets = target_matrix.shape[0]
+    if max_distances is None:
+        max_distances = [None] * num_targets
+    if num_rows == 0 or num_targets == 0:
+        return [(numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=numpy.float64)) for t in range(num_targets)]
+    unscaled_stat_matrix = stat_matrix
+    unscaled_target_matrix = target_matrix
+    extra_error_factor = 0
+    if column_scales is not None:
+        column_scales = numpy.asarray(column_scales, dtype=numpy.float64)
+        stat_matrix = stat_matrix * column_scales
+        target_matrix = target_matrix * column_scales
+        # scaling the values rather than their differences adds (a lot less
+        # than) another 8 epsilon to the error bound below
+        extra_error_factor = 4
+    stat_sq_norms = numpy.einsum("ij,ij->i", stat_matrix, stat_matrix)
+    target_sq_norms = numpy.einsum("ij,ij->i", target_matrix, target_matrix)
+    sq_distances = numpy.dot(stat_matrix, target_matrix.T)
+    sq_distances *= -2.0
+    sq_distances += stat_sq_norms[:, numpy.newaxis]
+    sq_distances += target_sq_norms[numpy.newaxis, :]
+    # bound on the rounding error of each entry: a generous multiple of the
+    # standard dot-product bound of n * epsilon * |x| * |t|
+    error_bounds = numpy.add.outer(numpy.sqrt(stat_sq_norms), numpy.sqrt(target_sq_norms))
+    error_bounds *= error_bounds
+    error_bounds *= 2 * (num_cols + 4 + extra_error_factor) * numpy.finfo(numpy.float64).eps
+    # upper bound on the squared distance to be accepted, by target
+    upper_bounds = numpy.full(num_targets, numpy.inf)
+    for target_idx, max_distance in enumerate(max_distances):
+        if max_distance is not None:
+            upper_bounds[target_idx] = max_distance * max_distance
+    if num_to_retain is not None and 0 < num_to_retain < num_rows:
+        upper_limits = sq_distances + error_bounds
+        kth_upper_limits = numpy.partition(upper_limits, num_to_retain - 1, axis=0)[num_to_retain - 1]
+        numpy.minimum(upper_bounds, kth_upper_limits, out=upper_bounds)
+    # widen a little, so that the rounding of the bounds themselves cannot
+    # lose a row
+    upper_bounds *= 1.0 + 8 * numpy.finfo(numpy.float64).eps
+    sq_distances -= error_bounds
+    is_candidate = sq_distances <= upper_bounds[numpy.newaxis, :]
+    results = []
+    for target_idx in range(num_targets):
+        candidate_indexes = numpy.flatnonzero(is_candidate[:, target_idx])
+        distances = euclidean_distances(
+                unscaled_stat_matrix[candidate_indexes],
+                unscaled_target_matrix[target_idx],
+                column_scales=column_scales)
+        results.append((candidate_indexes, distances))
+    return results
+
+class PrincipalComponentsReducer(object):
+    """
+    Projects the summary statistics (scaled by ``column_scales``, if given)
+    onto their first ``num_components`` principal components, so that
+    distances can be calculated over a few hundred columns rather than tens
+    of thousands.
+
+    The components are fitted on a uniform random sample of up to
+    ``sample_size`` rows of the prior, collected in a single streaming pass
+    by reservoir sampling (``add_chunk``), and then calculated by a
+    randomized singular value decomposition (Halko et al. 2011) of the
+    centered sample if it is large, or an exact one otherwise.
+    """
+
+    def __init__(self, num_components, sample_size=DEFAULT_REDUCTION_SAMPLE_SIZE, random_seed=None):
+        if numpy is None:
+            raise ImportError("Dimension reduction requires NumPy to be installed")
+        self.num_components = num_components
+        self.sample_size = sample_size
+        self.random_seed = random_seed
+        self.rng = numpy.random.RandomState(random_seed)
+        self.sample = None
+        self.num_sampled = 0
+        self.num_rows_seen = 0
+        self.column_scales = None
+        self.mean = None
+        self.components = None
+
+    def add_chunk(self, stat_rows):
+        stat_rows = numpy.asarray(stat_rows, dtype=numpy.float64)
+        if self.sample is None:
+            self.sample = numpy.empty((self.sample_size, stat_rows.shape[1]), dtype=numpy.float64)
+        # fill the reservoir, and then replace a random member of it with
+        # the i-th row with probability sample_size / i
+        num_to_fill = min(self.sample_size - self.num_sampled, stat_rows.shape[0])
+        if num_to_fill > 0:
+            self.sample[self.num_sampled:self.num_sampled+num_to_fill] = stat_rows[:num_to_fill]
+            self.num_sampled += num_to_fill
+        if num_to_fill < stat_rows.shape[0]:
+            # the slots of all the rows of the chunk drawn at once: where
+            # several rows replace the same member, the last one is kept
+            row_idxs = numpy.arange(num_to_fill, stat_rows.shape[0])
+            slots = self.rng.randint(0, self.num_rows_seen + row_idxs + 1)
+            is_kept = slots < self.sample_size
+            row_idxs = row_idxs[is_kept][::-1]
+            slots, first_idxs = numpy.unique(slots[is_kept][::-1], return_index=True)
+            self.sample[slots] = stat_rows[row_idxs[first_idxs]]
+        self.num_rows_seen += stat_rows.shape[0]
+
+    def fit(self, column_scales=None):
+        if not self.num_sampled:
+            raise ValueError("No samples to fit the principal components to")
+        sample = self.sample[:self.num_sampled]
+        if column_scales is not None:
+            column_scales = list(column_scales)
+            sample = sample * numpy.asarray(column_scales, dtype=numpy.float64)
+        self.column_scales = column_scales
+        self.mean = sample.mean(axis=0)
+        centered = sample - self.mean
+        num_components = min(self.num_components, min(centered.shape))
+        num_probes = num_components + 10
+        if 2 * num_probes < min(centered.shape):
+            # range finder, with a couple of power iterations for accuracy
+            basis, r = numpy.linalg.qr(numpy.dot(centered, self.rng.standard_normal((centered.shape[1], num_probes))))
+            for iteration in range(2):
+                basis, r = numpy.linalg.qr(numpy.dot(centered.T, basis))
+                basis, r = numpy.linalg.qr(numpy.dot(centered, basis))
+            u, singular_values, vt = numpy.linalg.svd(numpy.dot(basis.T, centered), full_matrices=False)
+        else:
+            u, singular_values, vt = numpy.linalg.svd(centered, full_matrices=False)
+        self.components = numpy.ascontiguousarray(vt[:num_components])
+        if len(singular_values) and singular_values[0] > 0:
+            total_variance = float(numpy.einsum("ij,ij->", centered, centered))
+            self.explained_variance_ratio = float((singular_values[:num_components]**2).sum()) / total_variance
+        else:
+            self.explained_variance_ratio = 1.0
+        self.sample = None
+
+    def transform(self, stat_rows, block_num_cells=DISTANCE_BLOCK_NUM_CELLS):
+        """
+        Returns the projection of the rows of ``stat_rows`` (a matrix, or a
+        single vector) onto the principal components, processing large
+        matrices in blocks to bound the size of temporaries.
+        """
+        if not (hasattr(stat_rows, "shape") and len(stat_rows.shape) == 2):
+            stat_rows = numpy.asarray(stat_rows, dtype=numpy.float64)
+            if stat_rows.ndim == 1:
+                return self.transform(stat_rows[numpy.newaxis, :])[0]
+        num_rows, num_cols = stat_rows.shape
+        scales = None
+        if self.column_scales is not None:
+            scales = numpy.asarray(self.column_scales, dtype=numpy.float64)
+        reduced = numpy.empty((num_rows, self.components.shape[0]), dtype=numpy.float64)
+        block_size = max(1, block_num_cells // max(1, num_cols))
+        for start in range(0, num_rows, block_size):
+            stop = min(start + block_size, num_rows)
+            block = numpy.asarray(stat_rows[start:stop], dtype=numpy.float64)
+            if scales is not None:
+                block = block * scales
+            else:
+                block = block.copy()
+            block -= self.mean
+            numpy.dot(block, self.components.T, out=reduced[start:stop])
+        return reduced
+
+    def get_digest(self):
+        digest = hashlib.sha1()
+        digest.update(self.mean.tobytes())
+        digest.update(self.components.tobytes())
+        return digest.hexdigest()
+
+class SpatialIndex(object):
+    """
+    KD-tree (SciPy's ``cKDTree``) over the summary statistics of the prior,
+    scaled by ``column_scales`` if given, for nearest-neighbor and radius
+    queries in time sublinear in the size of the prior (if the number of
+    summary statistics is not large).
+
+    The distances calculated by the tree are only used to find candidates:
+    allowing for their worst-case rounding error, all the samples that could
+    be accepted are found, and then rescored exactly by
+    ``euclidean_distances``, so that the results are identical to scanning
+    the whole prior.
+    """
+
+    def __init__(self, stat_matrix, column_scales=None, leafsize=16):
+        if scipy_spatial is None:
+            raise ImportError("A spatial index requires SciPy to be installed")
+        points = numpy.array(stat_matrix[0:stat_matrix.shape[0]], dtype=numpy.float64)
+        if column_scales is not None:
+            column_scales = list(column_scales)
+            points *= numpy.asarray(column_scales, dtype=numpy.float64)
+        self.column_scales = column_scales
+        self.num_rows, self.num_cols = points.shape
+        if self.num_rows:
+            self.max_norm = math.sqrt(float(numpy.einsum("ij,ij->i", points, points).max()))
+        else:
+            self.max_norm = 0.0
+        self.tree = scipy_spatial.cKDTree(points, leafsize=leafsize)
+
+    def _get_target_point(self, target_stat_values):
+        target_point = numpy.asarray(target_stat_values, dtype=numpy.float64)
+        if self.column_scales is not None:
+            target_point = target_point * numpy.asarray(self.column_scales, dtype=numpy.float64)
+        return target_point
+
+    def _get_squared_error_bound(self, target_point):
+        # as in `batch_closest_candidates`, with the largest row norm
+        norm = self.max_norm + math.sqrt(float(numpy.dot(target_point, target_point)))
+        return 2 * (self.num_cols + 8) * numpy.finfo(numpy.float64).eps * norm * norm
+
+    def _get_candidates(self, stat_matrix, target_stat_values, target_point, radius):
+        # widen a little, so that the rounding of the radius cannot lose a row
+        radius *= 1.0 + 8 * numpy.finfo(numpy.float64).eps
+        indexes = numpy.sort(numpy.asarray(self.tree.query_ball_point(target_point, radius), dtype=numpy.intp))
+        distances = euclidean_distances(
+                stat_matrix[indexes],
+                target_stat_values,
+                column_scales=self.column_scales)
+        return indexes, distances
+
+    def closest(self, stat_matrix, target_stat_values, num_to_retain):
+        """
+        Returns the indexes of the ``num_to_retain`` samples of
+        ``stat_matrix`` (the matrix the index was built over) closest to the
+        target, and their distances, ordered as by ``select_closest``.
+        """
+        if num_to_retain <= 0 or num_to_retain >= self.num_rows:
+            distances = euclidean_distances(stat_matrix, target_stat_values, column_scales=self.column_scales)
+            indexes = select_closest(distances, num_to_retain)
+            return indexes, distances[indexes]
+        target_point = self._get_target_point(target_stat_values)
+        tree_distances, tree_indexes = self.tree.query(target_point, k=num_to_retain)
+        kth_distance = float(numpy.atleast_1d(tree_distances)[-1])
+        # the true distance of the k-th closest sample is within the error
+        # bound of that of the tree, and so is that of every sample at least
+        # as close
+        radius = math.sqrt(kth_distance * kth_distance + 2 * self._get_squared_error_bound(target_point))
+        indexes, distances = self._get_candidates(stat_matrix, target_stat_values, target_point, radius)
+        selected = select_closest(distances, num_to_retain)
+        return indexes[selected], distances[selected]
+
+    def within(self, stat_matrix, target_stat_values, max_distance):
+        """
+        Returns the indexes of the samples of ``stat_matrix`` (the matrix the
+        index was built over) within ``max_distance`` of the target, and their
+        distances, ordered by distance and then index.
+        """
+        target_point = self._get_target_point(target_stat_values)
+        radius = math.sqrt(max_distance * max_distance + self._get_squared_error_bound(target_point))
+        indexes, distances = self._get_candidates(stat_matrix, target_stat_values, target_point, radius)
+        is_accepted = distances <= max_distance
+        indexes = indexes[is_accepted]
+        distances = distances[is_accepted]
+        order = numpy.argsort(distances, kind="stable")
+        return indexes[order], distances[order]
+
+class RejectionAccumulator(object):
+    """
+    Collects the samples from the prior accepted for a single target as the
+    prior is processed chunk by chunk: either the ``num_to_retain`` closest
+    samples seen so far (a bounded set), or every sample within
+    ``max_distance``.
+    """
+
+    def __init__(self, num_to_retain=None, max_distance=None):
+        if (num_to_retain is None) == (max_distance is None):
+            raise TypeError("Exactly one of 'num_to_retain' or 'max_distance' must be specified")
+        self.num_to_retain = num_to_retain
+        self.max_distance = max_distance
+        # tuples of (distance, index, other values, stat values); if retaining
+        # by number, kept sorted by distance and then index
+        self.samples = []
+
+    def _get_max_accepted_distance(self):
+        """
+        The largest distance that a new sample could have and still be
+        accepted (or None if any sample would be).
+        """
+        if self.max_distance is not None:
+            return self.max_distance
+        elif self.num_to_retain <= 0:
+            return -1.0
+        elif len(self.samples) < self.num_to_retain:
+            return None
+        else:
+            return self.samples[-1][0]
+    max_accepted_distance = property(_get_max_accepted_distance)
+
+    def add_chunk(self, distances, first_index, other_rows, stat_rows=None, candidate_indexes=None):
+        """
+        Considers the samples of a chunk, with ``distances`` the distance of
+        each row of the chunk to the target or, if ``candidate_indexes`` (in
+        increasing order) is given, of just those rows.
+        """
+        if numpy is not None and isinstance(distances, numpy.ndarray):
+            if self.max_distance is not None:
+                chunk_idxs = numpy.flatnonzero(distances <= self.max_distance)
+            else:
+                chunk_idxs = select_closest(distances, self.num_to_retain)
+            chunk_distances = distances[chunk_idxs].tolist()
+            chunk_idxs = chunk_idxs.tolist()
+        else:
+            if self.max_distance is not None:
+                chunk_idxs = [idx for idx, d in enumerate(distances) if d <= self.max_distance]
+            else:
+                chunk_idxs = [idx for d, idx in heapq.nsmallest(self.num_to_retain, ((d, idx) for idx, d in enumerate(distances)))]
+            chunk_distances = [distances[idx] for idx in chunk_idxs]
+        if candidate_indexes is not None:
+            chunk_idxs = [int(candidate_indexes[idx]) for idx in chunk_idxs]
+        new_samples = []
+        for d, idx in zip(chunk_distances, chunk_idxs):
+            if stat_rows is None:
+                stat_values = None
+            elif numpy is not None and isinstance(stat_rows, numpy.ndarray):
+                stat_values = stat_rows[idx].tolist() # copy, so as not to hold on to the chunk
+            else:
+                stat_values = stat_rows[idx]
+            new_samples.append((d, first_index + idx, other_rows[idx], stat_values))
+        self.add_samples(new_samples)
+
+    def add_samples(self, samples):
+        """
+        Adds samples already accepted elsewhere (e.g., by another
+        accumulator over a later part of the prior), as tuples of (distance,
+        index, other values, stat values) sorted by distance and then index,
+        with indexes all greater than those added so far.
+        """
+        if self.max_distance is not None:
+            self.samples.extend(samples)
+        else:
+            # both sorted by (distance, index), and earlier chunks have lower
+            # indexes, so ties are resolved as with a stable sort of the entire prior
+            self.samples = list(itertools.islice(heapq.merge(self.samples, samples), self.num_to_retain))
+
+    def get_samples(self):
+        if self.max_distance is not None:
+            # chunks are added in index order, so stable sort keeps ties in index order
+            self.samples.sort(key=lambda x: x[0])
+        return self.samples
+
+class RejectionWorker(multiprocessing.Process):
+    """
+    Scores parts of the prior (whole simulation files, or row ranges of
+    binary priors) against all the targets, sending back, for each part,
+    the number of rows read and the samples accepted for each target, with
+    indexes relative to the start of the part.
+    """
+
+    def __init__(self,
+            name,
+            rejector,
+            targets,
+            num_to_retain,
+            max_distance,
+            chunk_size,
+            work_queue,
+            results_queue,
+            ):
+        multiprocessing.Process.__init__(self, name=name)
+        self.rejector = rejector
+        self.targets = targets
+        self.num_to_retain = num_to_retain
+        self.max_distance = max_distance
+        self.chunk_size = chunk_size
+        self.work_queue = work_queue
+        self.results_queue = results_queue
+
+    def run(self):
+        distance_targets = None
+        while True:
+            task = self.work_queue.get()
+            if task is None:
+                break
+            task_idx, filepath, start_row, stop_row, start_offset = task
+            try:
+                if distance_targets is None:
+                    distance_targets = self.rejector._get_distance_targets(self.targets)
+                accumulators = [RejectionAccumulator(num_to_retain=self.num_to_retain, max_distance=self.max_distance) for target in self.targets]
+                if start_row is None:
+                    chunks = self.rejector.iterate_simulated_data([filepath], self.chunk_size)
+                else:
+                    chunks = self.rejector._iterate_binary_prior(filepath, self.chunk_size, 0, start_row, stop_row, start_offset)
+                num_rows = 0
+                for first_row_idx, stat_chunk, other_rows in chunks:
+                    self.rejector.score_chunk(
+                            targets=distance_targets,
+                            accumulators=accumulators,
+                            stat_chunk=stat_chunk,
+                            first_row_idx=first_row_idx,
+                            other_rows=other_rows)
+                    num_rows += len(other_rows)
+                self.results_queue.put((task_idx, num_rows, [accumulator.samples for accumulator in accumulators]))
+            except (KeyboardInterrupt, Exception) as e:
+                e.worker_name = self.name
+                e.traceback_exc = traceback.format_exc()
+                self.results_queue.put(e)
+                break
+
+class GerenukRejector(object):
+
+    def __init__(self,
+            rejection_criteria_type,
+            rejection_criteria_value,
+            run_logger,
+            stats_field_prefix="stat",
+            logging_frequency=1000,
+            field_delimiter="\t",
+            is_output_summary_stats=False,
+            is_suppress_checks=False,
+            distance_engine=None,
+            is_batch_targets=False,
+            is_memory_map_prior=True,
+            distance_type="euclidean",
+            stat_weights=None,
+            is_use_spatial_index=False,
+            num_reduced_dimensions=None,
+            reduction_sample_size=DEFAULT_REDUCTION_SAMPLE_SIZE,
+            reduction_random_seed=None,
+            ):
+        self.rejection_criteria_type = rejection_criteria_type
+        self.rejection_criteria_value = rejection_criteria_value
+        self.run_logger = run_logger
+        self.stats_field_prefix = stats_field_prefix
+        self.logging_frequency = logging_frequency
+        self.field_delimiter = field_delimiter
+        self.is_output_summary_stats = is_output_summary_stats
+        self.is_suppress_checks = is_suppress_checks
+        if distance_engine is None:
+            distance_engine = "python" if numpy is None else "numpy"
+        if distance_engine not in ("numpy", "python"):
+            raise ValueError("Unrecognized distance engine: '{}'".format(distance_engine))
+        if distance_engine == "numpy" and numpy is None:
+            raise ImportError("The 'numpy' distance engine requires NumPy to be installed")
+        self.distance_engine = distance_engine
+        if is_batch_targets and distance_engine != "numpy":
+            raise ValueError("Batched scoring of targets requires the 'numpy' distance engine")
+        self.is_batch_targets = is_batch_targets
+        self.is_memory_map_prior = is_memory_map_prior
+        if distance_type not in DISTANCE_TYPES:
+            raise ValueError("Unrecognized distance type: '{}'".format(distance_type))
+        if (distance_type == "weighted") != (stat_weights is not None):
+            raise ValueError("Weights must be given for, and only for, the 'weighted' distance")
+        self.distance_type = distance_type
+        self.stat_weights = stat_weights
+        # multiplier of the difference in each summary statistic when
+        # calculating distances (None if not scaling)
+        self.column_scales = None
+        if is_use_spatial_index:
+            if distance_engine != "numpy":
+                raise ValueError("A spatial index requires the 'numpy' distance engine")
+            if is_batch_targets:
+                raise ValueError("A spatial index cannot be used with batched scoring of targets")
+            if scipy_spatial is None:
+                raise ImportError("A spatial index requires SciPy to be installed")
+        self.is_use_spatial_index = is_use_spatial_index
+        self.spatial_index = None
+        if num_reduced_dimensions is not None and distance_engine != "numpy":
+            raise ValueError("Dimension reduction requires the 'numpy' distance engine")
+        self.num_reduced_dimensions = num_reduced_dimensions
+        self.reduction_sample_size = reduction_sample_size
+        self.reduction_random_seed = reduction_random_seed
+        self.reducer = None
+        self.reduced_stat_matrix = None
+        self.all_fieldnames = None
+        self.other_fieldnames = None
+        self.stat_fieldnames = None
+        self.stat_fieldnames_check = None
+        self.other_fieldname_check = None
+        self.stat_values = []
+        self.other_values = []
+        self.stat_matrix = None
+
+    def _configure_fieldnames(self, fieldnames):
+        self.all_fieldnames = list(fieldnames)
+        self.stat_fieldnames = []
+        self.other_fieldnames = []
+        for field in fieldnames:
+            if field.startswith(self.stats_field_prefix):
+                self.stat_fieldnames.append(field)
+            else:
+                self.other_fieldnames.append(field)
+        self.stat_fieldnames_check = set(self.stat_fieldnames)
+        self.other_fieldname_check = set(self.other_fieldnames)
+
+    def _get_field_indexes(self, filepath, fieldnames):
+        """
+        Returns the column indexes of the summary statistic and other fields
+        in a file with header ``fieldnames``, in the order that the fields are
+        stored (so files may have their columns in any order).
+        """
+        if self.all_fieldnames is None:
+            self._configure_fieldnames(fieldnames)
+        field_indexes = {}
+        for key_idx, key in enumerate(fieldnames):
+            if not self.is_suppress_checks:
+                if key not in self.stat_fieldnames_check and key not in self.other_fieldname_check:
+                    raise ValueError("File '{}', column {}: field '{}' not recognized".format(
+                        filepath, key_idx+1, key))
+            field_indexes[key] = key_idx
+        for key in self.all_fieldnames:
+            if key not in field_indexes:
+                raise ValueError("File '{}': field '{}' not found".format(filepath, key))
+        stat_idxs = [field_indexes[key] for key in self.stat_fieldnames]
+        other_idxs = [field_indexes[key] for key in self.other_fieldnames]
+        return stat_idxs, other_idxs
+
+    def _pack_stat_rows(self, stat_rows):
+        if self.distance_engine == "numpy":
+            return numpy.array(stat_rows, dtype=numpy.float64).reshape(len(stat_rows), len(self.stat_fieldnames))
+        else:
+            return [[float(v) for v in row] for row in stat_rows]
+
+    def _read_fieldnames(self, filepath):
+        if is_binary_prior(filepath):
+            return read_binary_prior_manifest(filepath)["fieldnames"]
+        with open(filepath) as src:
+            reader = csv.reader(
+                    src,
+                    delimiter=self.field_delimiter,
+                    quoting=csv.QUOTE_NONE)
+            return next(reader)
+
+    def _iterate_binary_prior(self, filepath, chunk_size, first_row_idx, start_row=0, stop_row=None, start_offset=None):
+        """
+        Reads the rows ``start_row`` to ``stop_row`` of a binary prior in
+        chunks, as ``iterate_simulated_data``. If given, ``start_offset``
+        is the byte offset of ``start_row`` in the parameters file (see
+        ``get_binary_prior_params_offsets``), so that the rows before it
+        need not be read.
+        """
+        if numpy is None:
+            raise ImportError("Reading a binary prior requires NumPy to be installed")
+        manifest = read_binary_prior_manifest(filepath)
+        self._get_field_indexes(filepath, manifest["fieldnames"])
+        stat_matrix = open_binary_prior_stats(manifest)
+        stored_stat_idxs = dict((key, idx) for idx, key in enumerate(manifest["stat_fieldnames"]))
+        stat_idxs = [stored_stat_idxs[key] for key in self.stat_fieldnames]
+        if stat_idxs == list(range(len(stat_idxs))):
+            stat_idxs = None # stored in our order: chunks can be views of the mapped file
+        stored_other_idxs = dict((key, idx) for idx, key in enumerate(manifest["other_fieldnames"]))
+        other_idxs = [stored_other_idxs[key] for key in self.other_fieldnames]
+        with open(manifest["params_filepath"]) as src:
+            reader = csv.reader(
+                    src,
+                    delimiter=BINARY_PRIOR_PARAMS_DELIMITER,
+                    quoting=csv.QUOTE_NONE)
+            if stop_row is None:
+                stop_row = stat_matrix.shape[0]
+            if start_offset is not None:
+                # the start of a line: a valid position in a text file (of
+                # a stateless encoding)
+                src.seek(start_offset)
+            else:
+                next(reader)
+                for row in itertools.islice(reader, start_row):
+                    pass
+            for start in range(start_row, stop_row, chunk_size):
+                stop = min(start + chunk_size, stop_row)
+                if self.logging_frequency:
+                    self.run_logger.info("- Processing rows {} to {}".format(start+1, stop))
+                stat_chunk = stat_matrix[start:stop]
+                if stat_idxs is not None:
+                    stat_chunk = stat_chunk[:, stat_idxs]
+                if self.distance_engine != "numpy":
+                    stat_chunk = stat_chunk.tolist()
+                other_rows = []
+                for row in itertools.islice(reader, stop - start):
+                    other_rows.append([row[i] for i in other_idxs])
+                if len(other_rows) != stop - start:
+                    raise ValueError("File '{}': expecting {} rows but found {}".format(
+                        manifest["params_filepath"], manifest["num_samples"], start + len(other_rows)))
+                yield first_row_idx + start - start_row, stat_chunk, other_rows
+
+    def iterate_simulated_data(self, filepaths, chunk_size):
+        """
+        Reads the simulation files (or binary priors) in chunks of up to
+        ``chunk_size`` rows. Yields tuples of the index of the first row in
+        the chunk, the summary statistic values of the rows (a matrix with
+        the 'numpy' engine, or a list of lists of floats otherwise), and the
+        other field values of the rows (a list of lists of strings).
+        """
+        row_count = 0
+        for filepath in filepaths:
+            if is_binary_prior(filepath):
+                self.run_logger.info("Reading binary prior: '{}'".format(filepath))
+                for chunk in self._iterate_binary_prior(filepath, chunk_size, row_count):
+                    yield chunk
+                    row_count += len(chunk[2])
+                continue
+            self.run_logger.info("Reading simulation file: '{}'".format(filepath))
+            with open(filepath) as src:
+                reader = csv.reader(
+                        src,
+                        delimiter=self.field_delimiter,
+                        quoting=csv.QUOTE_NONE)
+                try:
+                    fieldnames = next(reader)
+                except StopIteration:
+                    continue
+                stat_idxs, other_idxs = self._get_field_indexes(filepath, fieldnames)
+                stat_rows = []
+                other_rows = []
+                row_idx = 0
+                for row in reader:
+                    if not row:
+                        continue
+                    if self.logging_frequency and row_idx > 0 and row_idx % self.logging_frequency == 0:
+                        self.run_logger.info("- Processing row {}".format(row_idx+1))
+                    stat_rows.append([row[i] for i in stat_idxs])
+                    other_rows.append([row[i] for i in other_idxs])
+                    row_idx += 1
+                    if len(stat_rows) == chunk_size:
+                        yield row_count, self._pack_stat_rows(stat_rows), other_rows
+                        row_count += len(stat_rows)
+                        stat_rows = []
+                        other_rows = []
+                if stat_rows:
+                    yield row_count, self._pack_stat_rows(stat_rows), other_rows
+                    row_count += len(stat_rows)
+
+    def count_simulated_data(self, filepaths):
+        """
+        Returns the number of samples in the simulation files, without parsing
+        them.
+        """
+        count = 0
+        for filepath in filepaths:
+            if is_binary_prior(filepath):
+                count += read_binary_prior_manifest(filepath)["num_samples"]
+                continue
+            with open(filepath) as src:
+                num_lines = sum(1 for line in src if line.strip())
+            count += max(0, num_lines - 1)
+        return count
+
+    def _begin_stat_scales(self, filepaths):
+        """
+        Sets up the scales of the summary statistics for the distance type.
+        Returns None if there is nothing more to do (no scaling, or the
+        scales were read from the cache), or else a
+        ``ColumnMomentsAccumulator`` to be given every chunk of the prior
+        and then passed to ``_finish_stat_scales``.
+        """
+        if self.distance_type == "euclidean":
+            self.column_scales = None
+            return None
+        if self.all_fieldnames is None:
+            self._configure_fieldnames(self._read_fieldnames(filepaths[0]))
+        if self.stat_weights is not None:
+            for key in self.stat_weights:
+                if key not in self.stat_fieldnames_check:
+                    raise ValueError("Weight given for unrecognized summary statistic field '{}'".format(key))
+        standard_deviations = self._read_stat_scales(filepaths)
+        if standard_deviations is not None:
+            self._set_column_scales(standard_deviations)
+            return None
+        return ColumnMomentsAccumulator(len(self.stat_fieldnames))
+
+    def _finish_stat_scales(self, filepaths, moments):
+        standard_deviations = moments.get_standard_deviations()
+        self._set_column_scales(standard_deviations)
+        self._write_stat_scales(filepaths, moments)
+
+    def _set_column_scales(self, standard_deviations):
+        self.column_scales = []
+        for key, sd in zip(self.stat_fieldnames, standard_deviations):
+            if self.stat_weights is not None:
+                weight = self.stat_weights.get(key, 1.0)
+            else:
+                weight = 1.0
+            if sd > 0:
+                self.column_scales.append(math.sqrt(weight) / sd)
+            else:
+                # constant across the prior: cannot discriminate
+                self.column_scales.append(0.0)
+
+    def _read_stat_scales(self, filepaths):
+        """
+        Returns the cached standard deviations of the summary statistics of
+        the prior, or None if there are none or they are stale.
+        """
+        scales_filepath = get_stat_scales_filepath(filepaths)
+        if not os.path.exists(scales_filepath):
+            return None
+        with open(scales_filepath) as src:
+            cache = json.load(src)
+        if (cache.get("format") != STAT_SCALES_FORMAT
+                or cache.get("version") != STAT_SCALES_FORMAT_VERSION
+                or cache.get("sources") != describe_prior_sources(filepaths)
+                or cache.get("stat_fieldnames") != self.stat_fieldnames):
+            self.run_logger.info("Ignoring stale summary statistic scales: '{}'".format(scales_filepath))
+            return None
+        self.run_logger.info("Reading summary statistic scales: '{}'".format(scales_filepath))
+        return cache["standard_deviations"]
+
+    def _write_stat_scales(self, filepaths, moments):
+        scales_filepath = get_stat_scales_filepath(filepaths)
+        cache = collections.OrderedDict()
+        cache["format"] = STAT_SCALES_FORMAT
+        cache["version"] = STAT_SCALES_FORMAT_VERSION
+        cache["sources"] = describe_prior_sources(filepaths)
+        cache["num_samples"] = moments.num_rows
+        cache["stat_fieldnames"] = self.stat_fieldnames
+        cache["means"] = moments.means
+        cache["standard_deviations"] = moments.get_standard_deviations()
+        try:
+            with open(scales_filepath, "w") as dest:
+                json.dump(cache, dest, indent=2)
+        except (IOError, OSError) as e:
+            self.run_logger.warning("Failed to cache summary statistic scales: '{}': {}".format(scales_filepath, e))
+            return
+        self.run_logger.info("Summary statistic scales written: '{}'".format(scales_filepath))
+
+    def calculate_stat_scales(self, filepaths, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Sets up the scales of the summary statistics for the distance type,
+        from the cache if possible, or else by a pass over the prior.
+        """
+        moments = self._begin_stat_scales(filepaths)
+        if moments is None:
+            return
+        self.run_logger.info("Calculating summary statistic scales")
+        for first_row_idx, stat_chunk, other_rows in self.iterate_simulated_data(filepaths, chunk_size):
+            moments.add_chunk(stat_chunk)
+        self._finish_stat_scales(filepaths, moments)
+
+    def read_simulated_data(self, filepaths, chunk_size=DEFAULT_CHUNK_SIZE):
+        if (self.distance_engine == "numpy"
+                and filepaths
+                and all(is_binary_prior(filepath) for filepath in filepaths)):
+            self.read_binary_prior(filepaths)
+            moments = self._begin_stat_scales(filepaths)
+            if moments is not None:
+                for start in range(0, self.stat_matrix.shape[0], chunk_size):
+                    moments.add_chunk(self.stat_matrix[start:start+chunk_size])
+                self._finish_stat_scales(filepaths, moments)
+            self._prepare_distance_stat_matrix(filepaths, chunk_size)
+            return
+        moments = self._begin_stat_scales(filepaths)
+        stat_chunks = []
+        for first_row_idx, stat_chunk, other_rows in self.iterate_simulated_data(filepaths, chunk_size):
+            stat_chunks.append(stat_chunk)
+            self.other_values.extend(other_rows)
+            if moments is not None:
+                moments.add_chunk(stat_chunk)
+        if moments is not None:
+            self._finish_stat_scales(filepaths, moments)
+        if self.distance_engine == "numpy":
+            num_cols = len(self.stat_fieldnames) if self.stat_fieldnames is not None else 0
+            if stat_chunks:
+                self.stat_matrix = numpy.concatenate(stat_chunks)
+            else:
+                self.stat_matrix = numpy.empty((0, num_cols), dtype=numpy.float64)
+            self.stat_values = self.stat_matrix
+            self.run_logger.info("Prior summary statistics: {} samples x {} statistics ({:.1f} MB)".format(
+                self.stat_matrix.shape[0],
+                self.stat_matrix.shape[1],
+                self.stat_matrix.nbytes / (1024.0 * 1024.0)))
+        else:
+            for stat_chunk in stat_chunks:
+                self.stat_values.extend(stat_chunk)
+        self._prepare_distance_stat_matrix(filepaths, chunk_size)
+
+    def _prepare_distance_stat_matrix(self, filepaths, chunk_size):
+        if self.num_reduced_dimensions is not None:
+            self.prepare_reduction(filepaths, chunk_size, stat_chunks=(
+                self.stat_matrix[start:start+chunk_size] for start in range(0, self.stat_matrix.shape[0], chunk_size)))
+            start_time = time.time()
+            self.reduced_stat_matrix = self.reducer.transform(self.stat_matrix)
+            self.run_logger.info("Prior summary statistics reduced from {} to {} dimensions ({:.1f} MB to {:.1f} MB) in {:.2f} seconds".format(
+                self.stat_matrix.shape[1],
+                self.reduced_stat_matrix.shape[1],
+                self.stat_matrix.shape[0] * self.stat_matrix.shape[1] * 8 / (1024.0 * 1024.0),
+                self.reduced_stat_matrix.nbytes / (1024.0 * 1024.0),
+                time.time() - start_time))
+        if self.is_use_spatial_index:
+            self.prepare_spatial_index(filepaths)
+
+    def _get_distance_stat_matrix(self):
+        if self.reduced_stat_matrix is not None:
+            return self.reduced_stat_matrix
+        return self.stat_matrix
+
+    def _get_distance_column_scales(self):
+        # scales are applied before projecting
+        if self.reducer is not None:
+            return None
+        return self.column_scales
+
+    def _get_distance_target(self, target_stat_values):
+        if self.reducer is not None:
+            return self.reducer.transform(target_stat_values)
+        return target_stat_values
+
+    def _get_distance_targets(self, targets):
+        if self.reducer is not None and targets:
+            return self.reducer.transform(numpy.asarray(targets, dtype=numpy.float64).reshape(len(targets), -1))
+        return targets
+
+    def prepare_reduction(self, filepaths, chunk_size=DEFAULT_CHUNK_SIZE, stat_chunks=None):
+        """
+        Sets up the projection of the (scaled) summary statistics onto their
+        principal components, reading it from the cache beside the prior if
+        possible, or else fitting it to a sample of the rows of
+        ``stat_chunks`` (by default, read from ``filepaths``) and writing it
+        to the cache.
+        """
+        self.reducer = self._read_reduction(filepaths)
+        if self.reducer is not None:
+            return
+        start_time = time.time()
+        reducer = PrincipalComponentsReducer(
+                num_components=self.num_reduced_dimensions,
+                sample_size=self.reduction_sample_size,
+                random_seed=self.reduction_random_seed)
+        if stat_chunks is None:
+            stat_chunks = (chunk[1] for chunk in self.iterate_simulated_data(filepaths, chunk_size))
+        for stat_chunk in stat_chunks:
+            reducer.add_chunk(stat_chunk)
+        reducer.fit(column_scales=self.column_scales)
+        self.run_logger.info("Fitted {} principal components to {} of {} samples (explaining {:.1%} of the variance) in {:.2f} seconds".format(
+            reducer.components.shape[0],
+            reducer.num_sampled,
+            reducer.num_rows_seen,
+            reducer.explained_variance_ratio,
+            time.time() - start_time))
+        self.reducer = reducer
+        self._write_reduction(filepaths)
+
+    def _get_reduction_metadata(self, filepaths):
+        metadata = collections.OrderedDict()
+        metadata["format"] = REDUCTION_FORMAT
+        metadata["version"] = REDUCTION_FORMAT_VERSION
+        metadata["sources"] = describe_prior_sources(filepaths)
+        metadata["stat_fieldnames"] = self.stat_fieldnames
+        metadata["column_scales"] = self.column_scales
+        metadata["num_components"] = self.num_reduced_dimensions
+        metadata["sample_size"] = self.reduction_sample_size
+        return metadata
+
+    def _read_reduction(self, filepaths):
+        reduction_filepath = get_reduction_filepath(filepaths)
+        if not os.path.exists(reduction_filepath):
+            return None
+        with numpy.load(reduction_filepath, allow_pickle=False) as cache:
+            metadata = json.loads(str(cache["metadata"]))
+            expected_metadata = json.loads(json.dumps(self._get_reduction_metadata(filepaths)))
+            if any(metadata.get(key) != value for key, value in expected_metadata.items()):
+                self.run_logger.info("Ignoring stale dimension reduction: '{}'".format(reduction_filepath))
+                return None
+            self.run_logger.info("Reading dimension reduction: '{}'".format(reduction_filepath))
+            reducer = PrincipalComponentsReducer(
+                    num_components=self.num_reduced_dimensions,
+                    sample_size=self.reduction_sample_size,
+                    random_seed=metadata.get("random_seed"))
+            reducer.column_scales = self.column_scales
+            reducer.mean = cache["mean"]
+            reducer.components = cache["components"]
+            reducer.num_sampled = metadata["num_sampled"]
+            reducer.num_rows_seen = metadata["num_rows_seen"]
+            reducer.explained_variance_ratio = metadata["explained_variance_ratio"]
+        return reducer
+
+    def _write_reduction(self, filepaths):
+        reduction_filepath = get_reduction_filepath(filepaths)
+        metadata = self._get_reduction_metadata(filepaths)
+        metadata["random_seed"] = self.reducer.random_seed
+        metadata["num_sampled"] = self.reducer.num_sampled
+        metadata["num_rows_seen"] = self.reducer.num_rows_seen
+        metadata["explained_variance_ratio"] = self.reducer.explained_variance_ratio
+        try:
+            with open(reduction_filepath, "wb") as dest:
+                numpy.savez(dest,
+                        metadata=numpy.array(json.dumps(metadata)),
+                        mean=self.reducer.mean,
+                        components=self.reducer.components)
+        except (IOError, OSError) as e:
+            self.run_logger.warning("Failed to cache dimension reduction: '{}': {}".format(reduction_filepath, e))
+            return
+        self.run_logger.info("Dimension reduction written: '{}'".format(reduction_filepath))
+
+    def prepare_spatial_index(self, filepaths):
+        """
+        Sets up the spatial index over the (scaled) summary statistics of
+        the prior that has been read from ``filepaths``, reading it from the
+        cache beside the prior if possible, or else building it and writing
+        it to the cache.
+        """
+        self.spatial_index = self._read_spatial_index(filepaths)
+        if self.spatial_index is not None:
+            return
+        self.run_logger.info("Building spatial index over {} samples".format(self.stat_matrix.shape[0]))
+        self.spatial_index = SpatialIndex(self._get_distance_stat_matrix(), column_scales=self._get_distance_column_scales())
+        self._write_spatial_index(filepaths)
+
+    def _get_reduction_digest(self):
+        if self.reducer is None:
+            return None
+        return self.reducer.get_digest()
+
+    def _read_spatial_index(self, filepaths):
+        index_filepath = get_spatial_index_filepath(filepaths)
+        if not os.path.exists(index_filepath):
+            return None
+        with open(index_filepath, "rb") as src:
+            cache = pickle.load(src)
+        if (cache.get("format") != SPATIAL_INDEX_FORMAT
+                or cache.get("version") != SPATIAL_INDEX_FORMAT_VERSION
+                or cache.get("sources") != describe_prior_sources(filepaths)
+                or cache.get("stat_fieldnames") != self.stat_fieldnames
+                or cache.get("column_scales") != self.column_scales
+                or cache.get("reduction") != self._get_reduction_digest()):
+            self.run_logger.info("Ignoring stale spatial index: '{}'".format(index_filepath))
+            return None
+        self.run_logger.info("Reading spatial index: '{}'".format(index_filepath))
+        return cache["spatial_index"]
+
+    def _write_spatial_index(self, filepaths):
+        index_filepath = get_spatial_index_filepath(filepaths)
+        cache = {
+            "format": SPATIAL_INDEX_FORMAT,
+            "version": SPATIAL_INDEX_FORMAT_VERSION,
+            "sources": describe_prior_sources(filepaths),
+            "stat_fieldnames": self.stat_fieldnames,
+            "column_scales": self.column_scales,
+            "reduction": self._get_reduction_digest(),
+            "spatial_index": self.spatial_index,
+        }
+        try:
+            with open(index_filepath, "wb") as dest:
+                pickle.dump(cache, dest, protocol=pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError) as e:
+            self.run_logger.warning("Failed to cache spatial index: '{}': {}".format(index_filepath, e))
+            return
+        self.run_logger.info("Spatial index written: '{}'".format(index_filepath))
+
+    def read_binary_prior(self, filepaths):
+        """
+        Loads one or more binary priors written by ``write_binary_prior``.
+        Unless ``is_memory_map_prior`` is False, the summary statistics are
+        memory-mapped read-only rather than read: loading is quick regardless
+        of the size of the prior, the distance engine works directly on the
+        pages of the files as the OS brings them in, and concurrent processes
+        reading the same prior share a single copy in the OS page cache. If
+        there are multiple priors they are not concatenated, but presented as
+        a ``ShardedStatMatrix``.
+        """
+        if isinstance(filepaths, str):
+            filepaths = [filepaths]
+        shards = []
+        self.other_values = []
+        for filepath in filepaths:
+            self.run_logger.info("Reading binary prior: '{}'".format(filepath))
+            manifest = read_binary_prior_manifest(filepath)
+            self._get_field_indexes(filepath, manifest["fieldnames"])
+            if manifest["stat_fieldnames"] != self.stat_fieldnames:
+                raise ValueError("File '{}': summary statistics not in expected order".format(filepath))
+            shard = open_binary_prior_stats(manifest, mmap_mode="r" if self.is_memory_map_prior else None)
+            shards.append(shard)
+            stored_other_idxs = dict((key, idx) for idx, key in enumerate(manifest["other_fieldnames"]))
+            other_idxs = [stored_other_idxs[key] for key in self.other_fieldnames]
+            with open(manifest["params_filepath"]) as src:
+                reader = csv.reader(
+                        src,
+                        delimiter=BINARY_PRIOR_PARAMS_DELIMITER,
+                        quoting=csv.QUOTE_NONE)
+                next(reader)
+                num_other_values = len(self.other_values)
+                self.other_values.extend([row[i] for i in other_idxs] for row in reader if row)
+            if len(self.other_values) - num_other_values != shard.shape[0]:
+                raise ValueError("File '{}': expecting {} rows but found {}".format(
+                    manifest["params_filepath"], shard.shape[0], len(self.other_values) - num_other_values))
+        if len(shards) == 1:
+            self.stat_matrix = shards[0]
+        else:
+            self.stat_matrix = ShardedStatMatrix(shards)
+        self.stat_values = self.stat_matrix
+        self.run_logger.info("Prior summary statistics: {} samples x {} statistics ({})".format(
+            self.stat_matrix.shape[0],
+            self.stat_matrix.shape[1],
+            "memory-mapped" if self.is_memory_map_prior else "loaded into memory"))
+
+    def write_binary_prior(self, filepaths, output_prefix, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Converts the simulation files into a binary prior, to be read by
+        ``read_binary_prior`` or given in place of the simulation files.
+        Returns the path of the manifest.
+        """
+        if numpy is None:
+            raise ImportError("Writing a binary prior requires NumPy to be installed")
+        if self.all_fieldnames is None:
+            self._configure_fieldnames(self._read_fieldnames(filepaths[0]))
+        num_samples = self.count_simulated_data(filepaths)
+        manifest = collections.OrderedDict()
+        manifest["format"] = BINARY_PRIOR_FORMAT
+        manifest["version"] = BINARY_PRIOR_FORMAT_VERSION
+        manifest["num_samples"] = num_samples
+        manifest["stats_field_prefix"] = self.stats_field_prefix
+        manifest["fieldnames"] = self.all_fieldnames
+        manifest["stat_fieldnames"] = self.stat_fieldnames
+        manifest["other_fieldnames"] = self.other_fieldnames
+        manifest["stats_filename"] = os.path.basename(output_prefix + BINARY_PRIOR_STATS_SUFFIX)
+        manifest["params_filename"] = os.path.basename(output_prefix + BINARY_PRIOR_PARAMS_SUFFIX)
+        manifest["sources"] = [os.path.abspath(filepath) for filepath in filepaths]
+        stats_filepath = output_prefix + BINARY_PRIOR_STATS_SUFFIX
+        self.run_logger.info("Writing binary prior summary statistics: '{}' ({} samples x {} statistics)".format(
+            stats_filepath, num_samples, len(self.stat_fieldnames)))
+        stat_matrix = numpy.lib.format.open_memmap(
+                stats_filepath,
+                mode="w+",
+                dtype=numpy.float64,
+                shape=(num_samples, len(self.stat_fieldnames)))
+        moments = ColumnMomentsAccumulator(len(self.stat_fieldnames))
+        row_count = 0
+        with open(output_prefix + BINARY_PRIOR_PARAMS_SUFFIX, "w") as dest:
+            dest.write(BINARY_PRIOR_PARAMS_DELIMITER.join(self.other_fieldnames))
+            dest.write("\n")
+            for first_row_idx, stat_chunk, other_rows in self.iterate_simulated_data(filepaths, chunk_size):
+                stat_matrix[first_row_idx:first_row_idx+len(other_rows)] = stat_chunk
+                moments.add_chunk(stat_chunk)
+                for other_values in other_rows:
+                    dest.write(BINARY_PRIOR_PARAMS_DELIMITER.join(other_values))
+                    dest.write("\n")
+                row_count += len(other_rows)
+        stat_matrix.flush()
+        del stat_matrix
+        if row_count != num_samples:
+            raise ValueError("Expecting {} samples but found {}".format(num_samples, row_count))
+        manifest_filepath = output_prefix + BINARY_PRIOR_MANIFEST_SUFFIX
+        with open(manifest_filepath, "w") as dest:
+            json.dump(manifest, dest, indent=2)
+        self.run_logger.info("Binary prior written: '{}'".format(manifest_filepath))
+        # scales calculated while converting, so standardized distances do
+        # not need another pass over the prior
+        self._write_stat_scales([manifest_filepath], moments)
+        return manifest_filepath
+
+    def euclidean_distance(self, vector1, vector2):
+        assert len(vector1) == len(vector2)
+        # squared by multiplication rather than `**2`, as `pow()` is not
+        # guaranteed to be correctly rounded, and summed in order rather than
+        # with `sum()`, which compensates for rounding as of Python 3.12, as
+        # we want identical results across the distance engines
+        dist = 0.0
+        if self.column_scales is None:
+            for a, b in zip(vector1, vector2):
+                dist += (a - b) * (a - b)
+        else:
+            for a, b, c in zip(vector1, vector2, self.column_scales):
+                d = (a - b) * c
+                dist += d * d
+        return math.sqrt(dist)
+
+    def calculate_distances(self, target_stat_values):
+        """
+        Returns the distances of every sample from the prior to the target,
+        as a NumPy vector if using the 'numpy' engine, or a list otherwise.
+        """
+        assert len(target_stat_values) == len(self.stat_fieldnames), "Expecting {} values but found {}".format(
+                len(self.stat_fieldnames),
+                len(target_stat_values),
+                )
+        if self.distance_engine == "numpy":
+            return euclidean_distances(
+                    self._get_distance_stat_matrix(),
+                    self._get_distance_target(target_stat_values),
+                    column_scales=self._get_distance_column_scales())
+        else:
+            return [self.euclidean_distance(prior_value, target_stat_values) for prior_value in self.stat_values]
+
+    def closest_values_indexes(self, target_stat_values, num_to_retain):
+        if self.spatial_index is not None:
+            indexes, distances = self.spatial_index.closest(
+                    self._get_distance_stat_matrix(),
+                    self._get_distance_target(target_stat_values),
+                    num_to_retain)
+            return list(zip(distances.tolist(), indexes.tolist()))
+        distances = self.calculate_distances(target_stat_values)
+        if self.distance_engine == "numpy":
+            indexes = select_closest(distances, num_to_retain)
+            return list(zip(distances[indexes].tolist(), indexes.tolist()))
+        # bounded heap; equivalent to (but cheaper than) sorting everything
+        # and then slicing
+        return heapq.nsmallest(num_to_retain, ((d, idx) for idx, d in enumerate(distances)))
+
+    def filter_by_distance(self, target_stat_values, max_distance):
+        if self.spatial_index is not None:
+            indexes, distances = self.spatial_index.within(
+                    self._get_distance_stat_matrix(),
+                    self._get_distance_target(target_stat_values),
+                    max_distance)
+            return list(zip(distances.tolist(), indexes.tolist()))
+        distances = self.calculate_distances(target_stat_values)
+        if self.distance_engine == "numpy":
+            indexes = numpy.flatnonzero(distances <= max_distance)
+            indexes = indexes[numpy.argsort(distances[indexes], kind="stable")]
+            return list(zip(distances[indexes].tolist(), indexes.tolist()))
+        results = [(d, idx) for idx, d in enumerate(distances) if d <= max_distance]
+        results.sort(key=lambda x: x[0])
+        return results
+
+    def read_target_data(self, target_data_filepath):
+        """
+        Returns a list of the summary statistic values of each target in
+        ``target_data_filepath``, in the same order as in the prior.
+        """
+        targets = []
+        with open(target_data_filepath) as src:
+            reader = csv.DictReader(
+                    src,
+                    delimiter=self.field_delimiter,
+                    quoting=csv.QUOTE_NONE)
+            for row_idx, row in enumerate(reader):
+                target_stat_values = []
+                target_other_values = []
+                for key_idx, key in enumerate(self.all_fieldnames): # keys must be read in same order!
+                    if key not in row:
+                        continue
+                    if not self.is_suppress_checks:
+                        if key not in self.stat_fieldnames_check and key not in self.other_fieldname_check:
+                            raise ValueError("File '{}', target {}, column {}: field '{}' not recognized".format(
+                                target_data_filepath, row_idx+1, key_idx+1, key))
+                    if key.startswith(self.stats_field_prefix):
+                        target_stat_values.append(float(row[key]))
+                    else:
+                        target_other_values.append( row[key] )
+                targets.append(target_stat_values)
+        return targets
+
+    def _get_num_to_retain(self, num_prior_samples):
+        if self.rejection_criteria_type == "num":
+            return self.rejection_criteria_value
+        elif self.rejection_criteria_type == "proportion":
+            return int(self.rejection_criteria_value * num_prior_samples)
+        else:
+            return None
+
+    def _write_posterior_file(self, target_data_filepath, target_idx, posterior_rows):
+        with open(os.path.splitext(os.path.basename(target_data_filepath))[0] + ".posterior.{}.tsv".format(target_idx+1), "w") as dest:
+            fieldnames = list(self.other_fieldnames)
+            if self.is_output_summary_stats:
+                fieldnames.extend(self.stat_fieldnames)
+            dest.write(self.field_delimiter.join(str(v) for v in fieldnames))
+            dest.write("\n")
+            for other_values, stat_values in posterior_rows:
+                values = list(other_values)
+                if self.is_output_summary_stats:
+                    values.extend(stat_values)
+                dest.write(self.field_delimiter.join(str(v) for v in values))
+                dest.write("\n")
+
+    def _log_scoring_time(self, num_targets, num_samples, start_time):
+        num_dimensions = len(self.stat_fieldnames)
+        if self.reducer is not None:
+            num_dimensions = self.reducer.components.shape[0]
+        self.run_logger.info("Scored {} targets against {} samples over {} dimensions in {:.2f} seconds".format(
+            num_targets, num_samples, num_dimensions, time.time() - start_time))
+
+    def write_posterior(self, target_data_filepath, chunk_size=DEFAULT_CHUNK_SIZE):
+        targets = self.read_target_data(target_data_filepath)
+        start_time = time.time()
+        if self.is_batch_targets:
+            # score all the targets against each block of the prior at once
+            if self.rejection_criteria_type == "distance":
+                accumulators = [RejectionAccumulator(max_distance=self.rejection_criteria_value) for target in targets]
+            else:
+                num_to_retain = self._get_num_to_retain(len(self.stat_values))
+                accumulators = [RejectionAccumulator(num_to_retain=num_to_retain) for target in targets]
+            distance_targets = self._get_distance_targets(targets)
+            distance_stat_matrix = self._get_distance_stat_matrix()
+            for start in range(0, self.stat_matrix.shape[0], chunk_size):
+                stop = min(start + chunk_size, self.stat_matrix.shape[0])
+                self.score_chunk(
+                        targets=distance_targets,
+                        accumulators=accumulators,
+                        stat_chunk=self.stat_matrix[start:stop],
+                        first_row_idx=start,
+                        other_rows=self.other_values[start:stop],
+                        distance_stat_chunk=distance_stat_matrix[start:stop])
+            self._write_accumulated_posteriors(target_data_filepath, accumulators)
+            self._log_scoring_time(len(targets), len(self.stat_values), start_time)
+            return
+        for target_idx, target_stat_values in enumerate(targets):
+            if self.rejection_criteria_type == "distance":
+                posterior_indexes = self.filter_by_distance(
+                    target_stat_values=target_stat_values,
+                    max_distance=self.rejection_criteria_value)
+            else:
+                posterior_indexes = self.closest_values_indexes(
+                    target_stat_values=target_stat_values,
+                    num_to_retain=self._get_num_to_retain(len(self.stat_values)),)
+            self._write_posterior_file(
+                    target_data_filepath=target_data_filepath,
+                    target_idx=target_idx,
+                    posterior_rows=((self.other_values[index], self.stat_values[index]) for distance, index in posterior_indexes))
+        self._log_scoring_time(len(targets), len(self.stat_values), start_time)
+
+    def stream_posterior(self,
+            target_data_filepath,
+            simulations_data_filepaths,
+            chunk_size=DEFAULT_CHUNK_SIZE,
+            num_processes=1):
+        """
+        As ``write_posterior``, but reads the prior in chunks of
+        ``chunk_size`` rows, scoring each chunk against all the targets and
+        keeping only the samples accepted so far for each target, so that
+        memory use does not depend on the size of the prior.
+
+        If ``num_processes`` is greater than 1, the prior is split into
+        parts (each simulation file, and row ranges of each binary prior)
+        scored by that many worker processes, and the samples accepted for
+        each part are merged, giving the same posterior as a single process.
+        """
+        if self.all_fieldnames is None:
+            self._configure_fieldnames(self._read_fieldnames(simulations_data_filepaths[0]))
+        targets = self.read_target_data(target_data_filepath)
+        if self.rejection_criteria_type == "distance":
+            max_distance = self.rejection_criteria_value
+            num_to_retain = None
+        else:
+            max_distance = None
+            num_prior_samples = None
+            if self.rejection_criteria_type == "proportion":
+                num_prior_samples = self.count_simulated_data(simulations_data_filepaths)
+            num_to_retain = self._get_num_to_retain(num_prior_samples)
+        self.calculate_stat_scales(simulations_data_filepaths, chunk_size)
+        if self.num_reduced_dimensions is not None:
+            self.prepare_reduction(simulations_data_filepaths, chunk_size)
+        accumulators = [RejectionAccumulator(num_to_retain=num_to_retain, max_distance=max_distance) for target in targets]
+        start_time = time.time()
+        if num_processes > 1:
+            num_samples = self._score_in_parallel(
+                    targets=targets,
+                    accumulators=accumulators,
+                    simulations_data_filepaths=simulations_data_filepaths,
+                    chunk_size=chunk_size,
+                    num_processes=num_processes)
+            self._write_accumulated_posteriors(target_data_filepath, accumulators)
+            self._log_scoring_time(len(targets), num_samples, start_time)
+            return
+        num_samples = 0
+        distance_targets = self._get_distance_targets(targets)
+        for first_row_idx, stat_chunk, other_rows in self.iterate_simulated_data(simulations_data_filepaths, chunk_size):
+            self.score_chunk(
+                    targets=distance_targets,
+                    accumulators=accumulators,
+                    stat_chunk=stat_chunk,
+                    first_row_idx=first_row_idx,
+                    other_rows=other_rows)
+            num_samples += len(other_rows)
+        self._write_accumulated_posteriors(target_data_filepath, accumulators)
+        self._log_scoring_time(len(targets), num_samples, start_time)
+
+    def score_chunk(self,
+            targets,
+            accumulators,
+            stat_chunk,
+            first_row_idx,
+            other_rows,
+            distance_stat_chunk=None):
+        """
+        Scores a chunk of samples from the prior against all the targets,
+        adding the accepted samples to the corresponding accumulators.
+
+        The targets are given in the space distances are measured in, i.e.,
+        as returned by ``_get_distance_targets``, so that they are projected
+        once per run rather than once per chunk. ``distance_stat_chunk``
+        holds the rows of ``stat_chunk`` in that space (e.g., a slice of the
+        already projected prior); if not given, ``stat_chunk`` is projected
+        here.
+        """
+        stat_rows = stat_chunk if self.is_output_summary_stats else None
+        column_scales = self._get_distance_column_scales()
+        if distance_stat_chunk is None:
+            if self.reducer is not None:
+                distance_stat_chunk = self.reducer.transform(stat_chunk)
+            else:
+                distance_stat_chunk = stat_chunk
+        stat_chunk = distance_stat_chunk
+        if self.is_batch_targets:
+            results = batch_closest_candidates(
+                    stat_matrix=stat_chunk,
+                    target_matrix=numpy.asarray(targets, dtype=numpy.float64).reshape(len(targets), stat_chunk.shape[1]),
+                    num_to_retain=accumulators[0].num_to_retain if accumulators else None,
+                    max_distances=[accumulator.max_accepted_distance for accumulator in accumulators],
+                    column_scales=column_scales)
+            for accumulator, (candidate_indexes, distances) in zip(accumulators, results):
+                accumulator.add_chunk(
+                        distances=distances,
+                        first_index=first_row_idx,
+                        other_rows=other_rows,
+                        stat_rows=stat_rows,
+                        candidate_indexes=candidate_indexes)
+            return
+        for target_stat_values, accumulator in zip(targets, accumulators):
+            if self.distance_engine == "numpy":
+                distances = euclidean_distances(stat_chunk, target_stat_values, column_scales=column_scales)
+            else:
+                distances = [self.euclidean_distance(prior_value, target_stat_values) for prior_value in stat_chunk]
+            accumulator.add_chunk(
+                    distances=distances,
+                    first_index=first_row_idx,
+                    other_rows=other_rows,
+                    stat_rows=stat_rows)
+
+    def _get_parallel_tasks(self, simulations_data_filepaths, chunk_size, num_processes):
+        """
+        Splits the prior into parts, in order, as tuples of (index, file
+        path, first row, stop row, byte offset of the first row in the
+        parameters file): simulation files are read whole (rows and offset
+        None), while binary priors are split into about ``num_processes``
+        row ranges of at least ``chunk_size`` rows each, which the workers
+        read from the recorded offsets, without reading the rows before.
+        """
+        tasks = []
+        for filepath in simulations_data_filepaths:
+            if not is_binary_prior(filepath):
+                tasks.append((len(tasks), filepath, None, None, None))
+                continue
+            manifest = read_binary_prior_manifest(filepath)
+            num_rows = manifest["num_samples"]
+            range_size = max(chunk_size, -(-num_rows // num_processes))
+            start_rows = list(range(0, num_rows, range_size))
+            start_offsets = get_binary_prior_params_offsets(manifest, start_rows)
+            for start_row, start_offset in zip(start_rows, start_offsets):
+                tasks.append((len(tasks), filepath, start_row, min(start_row + range_size, num_rows), start_offset))
+        return tasks
+
+    def _score_in_parallel(self,
+            targets,
+            accumulators,
+            simulations_data_filepaths,
+            chunk_size,
+            num_processes):
+        tasks = self._get_parallel_tasks(simulations_data_filepaths, chunk_size, num_processes)
+        num_processes = min(num_processes, len(tasks))
+        work_queue = multiprocessing.Queue()
+        for task in tasks:
+            work_queue.put(task)
+        for worker_idx in range(num_processes):
+            work_queue.put(None)
+        results_queue = multiprocessing.Queue()
+        self.run_logger.info("Launching {} worker processes to score {} parts of the prior".format(num_processes, len(tasks)))
+        workers = []
+        for worker_idx in range(num_processes):
+            worker = RejectionWorker(
+                    name=str(worker_idx+1),
+                    rejector=self,
+                    targets=targets,
+                    num_to_retain=accumulators[0].num_to_retain if accumulators else None,
+                    max_distance=accumulators[0].max_distance if accumulators else None,
+                    chunk_size=chunk_size,
+                    work_queue=work_queue,
+                    results_queue=results_queue)
+            worker.start()
+            workers.append(worker)
+        task_results = [None] * len(tasks)
+        try:
+            for task in tasks:
+                result = results_queue.get()
+                if isinstance(result, Exception) or isinstance(result, KeyboardInterrupt):
+                    self.run_logger.error("Exception raised in worker process '{}'"
+                                          "\n>>>\n{}<<<\n".format(
+                                              result.worker_name,
+                                              result.traceback_exc))
+                    raise result
+                task_idx, num_rows, task_samples = result
+                task_results[task_idx] = (num_rows, task_samples)
+        except (Exception, KeyboardInterrupt) as e:
+            for worker in workers:
+                worker.terminate()
+            raise
+        for worker in workers:
+            worker.join()
+        # merge the parts in order, offsetting the indexes of the samples
+        # accepted from each part by the number of rows before it, so that
+        # ties are resolved exactly as in a single pass over the prior
+        row_offset = 0
+        for num_rows, task_samples in task_results:
+            for accumulator, samples in zip(accumulators, task_samples):
+                accumulator.add_samples([(d, row_offset + idx, other_values, stat_values) for d, idx, other_values, stat_values in samples])
+            row_offset += num_rows
+        self.run_logger.info("Merged samples accepted from {} rows".format(row_offset))
+        return row_offset
+
+    def _write_accumulated_posteriors(self, target_data_filepath, accumulators):
+        for target_idx, accumulator in enumerate(accumulators):
+            self._write_posterior_file(
+                    target_data_filepath=target_data_filepath,
+                    target_idx=target_idx,
+                    posterior_rows=((other_values, stat_values) for distance, index, other_values, stat_values in accumulator.get_samples()))
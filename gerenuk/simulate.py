@@ -31,10 +31,15 @@
 
 import subprocess
 import collections
+import math
 import random
 import sys
 import os
 import time
+import array
+import operator
+import json
+import shutil
 try:
     # Python 3
     import queue
@@ -45,6 +50,201 @@ import multiprocessing
 import traceback
 
 from gerenuk import utility
+from gerenuk import coalescent
+
+try:
+    _process_time = time.process_time
+except AttributeError:
+    # Python 2.7
+    _process_time = time.clock
+try:
+    _replace_file = os.replace
+except AttributeError:
+    # Python 2.7
+    _replace_file = os.rename
+
+# Results: '<prefix>.sumstats.tsv', or, with just the parameter values
+# sampled from the prior, '<prefix>.prior.tsv'. With divergence time models
+# drawn from their exact prior probabilities, these are written to
+# '<prefix>.partition-prior.tsv' (see 'PartitionPrior.write').
+SUMSTATS_SUFFIX = ".sumstats.tsv"
+PRIOR_ONLY_SUFFIX = ".prior.tsv"
+PARTITION_PRIOR_SUFFIX = ".partition-prior.tsv"
+
+# Sharded output: each worker process writes the results it simulates to its
+# own file, '<prefix>.part-<N>.sumstats.tsv', with the files described by a
+# manifest, '<prefix>.sumstats.manifest.json'.
+SHARDED_OUTPUT_FORMAT = "gerenuk-sharded-sumstats"
+SHARDED_OUTPUT_FORMAT_VERSION = 1
+SHARDED_OUTPUT_MANIFEST_SUFFIX = ".sumstats.manifest.json"
+
+def get_shard_filepath(output_prefix, shard_idx):
+    return "{}.part-{}{}".format(output_prefix, shard_idx+1, SUMSTATS_SUFFIX)
+
+def read_sharded_output_manifest(filepath):
+    """
+    Returns the manifest of sharded output as a dictionary, with the paths
+    of the files of the shards resolved relative to the manifest.
+    """
+    with open(filepath) as src:
+        manifest = json.load(src)
+    if manifest.get("format") != SHARDED_OUTPUT_FORMAT:
+        raise ValueError("File '{}': not a sharded output manifest".format(filepath))
+    if manifest.get("version") != SHARDED_OUTPUT_FORMAT_VERSION:
+        raise ValueError("File '{}': unsupported sharded output version: {}".format(filepath, manifest.get("version")))
+    dirpath = os.path.dirname(filepath)
+    for shard in manifest["shards"]:
+        shard["filepath"] = os.path.join(dirpath, shard["filename"])
+    return manifest
+
+def merge_sharded_output(manifest_filepath, output_filepath, is_remove_shards=False):
+    """
+    Concatenates the files of sharded output into a single file (keeping just
+    the header row of the first, if written), and returns the number of
+    replicates. If ``is_remove_shards``, the files of the shards and the
+    manifest are removed afterwards.
+    """
+    manifest = read_sharded_output_manifest(manifest_filepath)
+    header = None
+    with open(output_filepath, "wb") as dest:
+        for shard in manifest["shards"]:
+            with open(shard["filepath"], "rb") as src:
+                if manifest["is_header_written"]:
+                    shard_header = src.readline()
+                    if header is None:
+                        header = shard_header
+                        dest.write(header)
+                    elif shard_header != header:
+                        raise ValueError("File '{}': header row differs from that of '{}'".format(
+                            shard["filepath"], manifest["shards"][0]["filepath"]))
+                shutil.copyfileobj(src, dest, 1 << 20)
+    if is_remove_shards:
+        for shard in manifest["shards"]:
+            os.remove(shard["filepath"])
+        os.remove(manifest_filepath)
+    return manifest["num_samples"]
+
+# Checkpoints: how far a run writing its results to a single file has got,
+# periodically recorded in '<prefix>.checkpoint.json' so that an interrupted
+# run can be resumed where it left off.
+CHECKPOINT_FORMAT = "gerenuk-simulation-checkpoint"
+CHECKPOINT_FORMAT_VERSION = 1
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+
+def _encode_rng_state(state):
+    version, internal_state, gauss_next = state
+    return [version, list(internal_state), gauss_next]
+
+def _decode_rng_state(encoded):
+    version, internal_state, gauss_next = encoded
+    return (version, tuple(internal_state), gauss_next)
+
+def read_checkpoint(filepath):
+    """
+    Returns a checkpoint written by ``SimulationCheckpointer`` as a
+    dictionary, with the path of the output file resolved relative to the
+    checkpoint and the states of the random number generators of the
+    worker processes ready to be restored.
+    """
+    with open(filepath) as src:
+        checkpoint = json.load(src)
+    if checkpoint.get("format") != CHECKPOINT_FORMAT:
+        raise ValueError("File '{}': not a simulation checkpoint".format(filepath))
+    if checkpoint.get("version") != CHECKPOINT_FORMAT_VERSION:
+        raise ValueError("File '{}': unsupported checkpoint version: {}".format(filepath, checkpoint.get("version")))
+    checkpoint["output_filepath"] = os.path.join(os.path.dirname(filepath), checkpoint["output_filename"])
+    for worker in checkpoint["workers"]:
+        if worker["rng_state"] is not None:
+            worker["rng_state"] = _decode_rng_state(worker["rng_state"])
+    return checkpoint
+
+def truncate_output_to_checkpoint(checkpoint):
+    """
+    Discards anything written to the output file after the last row recorded
+    by ``checkpoint``, e.g., by a run that was interrupted after it was
+    written, or a partially-written row.
+    """
+    output_filepath = checkpoint["output_filepath"]
+    if os.path.getsize(output_filepath) < checkpoint["output_offset"]:
+        raise ValueError("File '{}': shorter than recorded by checkpoint ({} bytes)".format(
+            output_filepath, checkpoint["output_offset"]))
+    with open(output_filepath, "r+b") as dest:
+        dest.truncate(checkpoint["output_offset"])
+
+class SimulationCheckpointer(object):
+    """
+    Records, every ``frequency`` replicates written by
+    ``GerenukSimulator.execute`` to ``output_dest``, the number of
+    replicates written, the size of the output file, and the state of the
+    random number generator of each worker process when it sent its last
+    results. Resuming from ``checkpoint`` (as returned by
+    ``read_checkpoint``, after ``truncate_output_to_checkpoint``), the
+    worker processes carry on from those states, so replicates lost when the
+    run was interrupted are simulated again exactly as they were, and the
+    checkpoints carry on counting from those of the interrupted run.
+    """
+
+    def __init__(self, filepath, output_dest, frequency=1000, checkpoint=None):
+        if frequency < 1:
+            raise ValueError("Checkpoint frequency must be at least 1")
+        self.filepath = filepath
+        self.output_dest = output_dest
+        self.frequency = frequency
+        self.checkpoint = checkpoint
+        if checkpoint is None:
+            self.num_replicates_completed_previously = 0
+            self.fieldnames = None
+        else:
+            self.num_replicates_completed_previously = checkpoint["num_replicates_completed"]
+            self.fieldnames = checkpoint["fieldnames"]
+
+    def get_worker_state(self, worker_idx):
+        """
+        Returns the random seed of the worker process and the state of its
+        random number generator recorded by the checkpoint resumed from (or
+        ``None`` and ``None`` if not resuming).
+        """
+        if self.checkpoint is None:
+            return None, None
+        worker = self.checkpoint["workers"][worker_idx]
+        return worker["random_seed"], worker["rng_state"]
+
+    def write(self, num_replicates, num_replicates_completed, fieldnames, workers):
+        """
+        Writes a checkpoint, with ``num_replicates_completed`` out of
+        ``num_replicates`` replicates of this run written to the output,
+        and ``workers`` a list of the random seed, number of replicates
+        written, and last random number generator state (or ``None``) of
+        each worker process.
+        """
+        self.output_dest.flush()
+        checkpoint = collections.OrderedDict()
+        checkpoint["format"] = CHECKPOINT_FORMAT
+        checkpoint["version"] = CHECKPOINT_FORMAT_VERSION
+        checkpoint["num_replicates"] = self.num_replicates_completed_previously + num_replicates
+        checkpoint["num_replicates_completed"] = self.num_replicates_completed_previously + num_replicates_completed
+        checkpoint["output_filename"] = os.path.relpath(
+                os.path.abspath(self.output_dest.name),
+                os.path.dirname(os.path.abspath(self.filepath)))
+        checkpoint["output_offset"] = self.output_dest.tell()
+        checkpoint["fieldnames"] = fieldnames
+        checkpoint["workers"] = []
+        for worker_idx, (random_seed, worker_num_replicates_completed, rng_state) in enumerate(workers):
+            if self.checkpoint is not None:
+                worker_num_replicates_completed += self.checkpoint["workers"][worker_idx]["num_replicates_completed"]
+                if rng_state is None:
+                    rng_state = self.checkpoint["workers"][worker_idx]["rng_state"]
+            worker = collections.OrderedDict()
+            worker["random_seed"] = random_seed
+            worker["num_replicates_completed"] = worker_num_replicates_completed
+            worker["rng_state"] = _encode_rng_state(rng_state) if rng_state is not None else None
+            checkpoint["workers"].append(worker)
+        # replace the previous checkpoint only once this one is complete
+        temp_filepath = self.filepath + ".tmp"
+        with open(temp_filepath, "w") as dest:
+            json.dump(checkpoint, dest)
+        _replace_file(temp_filepath, self.filepath)
+        return checkpoint
 
 FSC2_CONFIG_TEMPLATE = """\
 //Number of population samples (demes)
@@ -113,32 +313,333 @@ def sample_partition(
         number_of_elements,
         scaling_parameter,
         rng,):
+    """
+    Returns a partition of the elements ``0, ..., number_of_elements - 1``
+    drawn from the Chinese restaurant process with concentration
+    ``scaling_parameter``, as a list of groups (lists of elements), in the
+    order they were started.
+    """
+    # Each element starts a new group with probability a/(a+i), or else joins
+    # the group of one of the i elements before it, chosen uniformly: i.e., a
+    # group of size m with probability m/(a+i). Drawing a single number
+    # decides both, so each element takes constant time, whatever the number
+    # of groups. The partition is exchangeable, so the elements need not be
+    # seated in a random order.
     groups = []
-    element_ids = [i for i in range(number_of_elements)] # decouple actual element index values, from indexes used to run Dirichlet process
-    rng.shuffle(element_ids)                             # ... thus allowing for us to ensure the "first" index is randomized
+    element_groups = []
     a = scaling_parameter
-    for i, element_id in enumerate(element_ids):
-        probs = []
-        n = i + 1
-        if i == 0:
-            groups.append([element_id])
-            continue
-        p_new = a/(a + n - 1.0)
-        probs.append(p_new)
-        for group in groups:
-            p = len(group)/(a + n - 1.0)
-            probs.append(p)
-        assert abs(sum(probs) - 1.0) <= 1e-5
-        selected_idx = weighted_index_choice(
-                weights=probs,
-                sum_of_weights=1.0,
-                rng=rng)
-        if selected_idx == 0:
-            groups.append([element_id])
-        else:
-            groups[selected_idx-1].append(element_id)
+    for element_id in range(number_of_elements):
+        if element_id > 0:
+            rnd = rng.random() * (a + element_id) - a
+            if rnd >= 0:
+                group = element_groups[min(int(rnd), element_id - 1)]
+                group.append(element_id)
+                element_groups.append(group)
+                continue
+        group = [element_id]
+        groups.append(group)
+        element_groups.append(group)
     return groups
 
+# Largest number of lineage pairs for which the exact prior on their
+# partitions can be precomputed (see 'PartitionPrior'): the number of integer
+# partitions of 30 is 5604.
+PARTITION_PRIOR_MAX_ELEMENTS = 30
+# Largest number of partitions of the lineage pairs to tabulate one by one
+# (there are 21147 partitions of 9 elements, and 115975 of 10).
+PARTITION_PRIOR_MAX_SET_PARTITIONS = 25000
+
+def iterate_integer_partitions(number, max_part=None):
+    """
+    Iterates over the partitions of the integer ``number``, as tuples of
+    parts in decreasing order, with parts no larger than ``max_part``.
+    """
+    if max_part is None:
+        max_part = number
+    if number == 0:
+        yield ()
+        return
+    for part in range(min(number, max_part), 0, -1):
+        for other_parts in iterate_integer_partitions(number - part, part):
+            yield (part,) + other_parts
+
+def iterate_set_partition_codes(number_of_elements, code=(), num_groups=0):
+    """
+    Iterates over the partitions of the elements ``0, ..., number_of_elements - 1``,
+    as tuples of the group of each element, with groups numbered in order
+    of their first element (e.g., ``(0, 0, 1, 0)``), extending ``code``,
+    the groups of the first elements, in ``num_groups`` groups.
+    """
+    if len(code) == number_of_elements:
+        yield code
+        return
+    for group_idx in range(num_groups + 1):
+        for full_code in iterate_set_partition_codes(number_of_elements, code + (group_idx,), max(num_groups, group_idx + 1)):
+            yield full_code
+
+def compile_alias_table(probabilities):
+    """
+    Returns the alias table (Vose's method) for drawing an index with
+    ``probabilities`` in constant time: the probability that each index,
+    drawn uniformly, is kept, and the index to take otherwise.
+    """
+    num_cells = len(probabilities)
+    total_probability = math.fsum(probabilities)
+    scaled_probabilities = [probability * num_cells / total_probability for probability in probabilities]
+    alias_probabilities = [1.0 for idx in range(num_cells)]
+    aliases = list(range(num_cells))
+    small = [idx for idx, p in enumerate(scaled_probabilities) if p < 1.0]
+    large = [idx for idx, p in enumerate(scaled_probabilities) if p >= 1.0]
+    while small and large:
+        small_idx = small.pop()
+        large_idx = large.pop()
+        alias_probabilities[small_idx] = scaled_probabilities[small_idx]
+        aliases[small_idx] = large_idx
+        scaled_probabilities[large_idx] -= 1.0 - scaled_probabilities[small_idx]
+        if scaled_probabilities[large_idx] < 1.0:
+            small.append(large_idx)
+        else:
+            large.append(large_idx)
+    # any left are (but for rounding error) 1.0
+    return alias_probabilities, aliases
+
+def _get_log_rising_factorial(a, n):
+    # log(a (a+1) ... (a+n-1)), summed rather than as a difference of
+    # log-gamma functions, which loses precision with large a
+    return math.fsum(math.log(a + i) for i in range(n))
+
+def _get_num_groups_weights(number_of_elements, concentration):
+    # a^k / a^(n), for k = 1, ..., n: the probability of any particular
+    # partition of n elements into k groups under the Chinese restaurant
+    # process with concentration a, but for the product of the factorials
+    # of one less than the size of each group
+    n = number_of_elements
+    if concentration == 0:
+        return [1.0 / math.factorial(n - 1)] + [0.0 for k in range(2, n + 1)]
+    log_a = math.log(concentration)
+    log_rising_factorial = _get_log_rising_factorial(concentration, n)
+    return [math.exp(k * log_a - log_rising_factorial) for k in range(1, n + 1)]
+
+def _integrate_num_groups_weights(number_of_elements, prior_concentration, num_intervals=4000):
+    # As '_get_num_groups_weights', but integrated over the Gamma hyperprior
+    # on the concentration, a, by Simpson's rule over log(a). The integrand,
+    # a^(shape+k-1) exp(-a/scale) / a^(n), lies between Gamma densities with
+    # shapes shape+k-n and shape+k-1, so the bounds leave out only negligible
+    # tails, but for that below a_min, where a^(n) is (n-1)! a and
+    # exp(-a/scale) is 1, so that it is integrated exactly.
+    n = number_of_elements
+    shape, scale = prior_concentration
+    min_concentration = 1E-10 * min(scale, 1.0)
+    spread = 15.0 * math.sqrt(shape + n)
+    lower_concentration = scale * max(shape - n - spread, 0.0)
+    upper_concentration = scale * (shape + n + spread + 30.0)
+    log_normalization = math.lgamma(shape) + shape * math.log(scale)
+    # shape*t - a/scale - log_normalization, about log(shape*scale),
+    # without the cancellation of large terms with large shapes (using
+    # Stirling's series for log(Gamma(shape)))
+    mode_t = math.log(shape * scale)
+    if shape >= 100:
+        log_mode_density = (0.5 * math.log(shape / (2.0 * math.pi))
+                - 1.0 / (12.0 * shape)
+                + 1.0 / (360.0 * shape ** 3)
+                - 1.0 / (1260.0 * shape ** 5))
+    else:
+        log_mode_density = shape * math.log(shape) - shape - math.lgamma(shape)
+    weights = [0.0 for k in range(n)]
+    if lower_concentration < min_concentration:
+        lower_concentration = min_concentration
+        for k in range(1, n + 1):
+            weights[k-1] = math.exp((k - 1 + shape) * math.log(min_concentration)
+                    - math.log(k - 1 + shape)
+                    - math.lgamma(n)
+                    - log_normalization)
+    lower_t = math.log(lower_concentration)
+    step = (math.log(upper_concentration) - lower_t) / num_intervals
+    terms = [[] for k in range(n)]
+    for point_idx in range(num_intervals + 1):
+        if point_idx == 0 or point_idx == num_intervals:
+            simpson_factor = step / 3.0
+        elif point_idx % 2:
+            simpson_factor = 4.0 * step / 3.0
+        else:
+            simpson_factor = 2.0 * step / 3.0
+        t = lower_t + point_idx * step
+        a = math.exp(t)
+        log_term = (shape * ((t - mode_t) - math.expm1(t - mode_t))
+                + log_mode_density
+                - _get_log_rising_factorial(a, n))
+        for k in range(1, n + 1):
+            terms[k-1].append(simpson_factor * math.exp(log_term + k * t))
+    return [weight + math.fsum(k_terms) for weight, k_terms in zip(weights, terms)]
+
+class PartitionPrior(object):
+    """
+    The exact prior probabilities of the partitions of ``number_of_elements``
+    elements (e.g., of the lineage pairs into groups with the same
+    divergence time) under the Dirichlet process, i.e., the Chinese
+    restaurant process, with concentration drawn from a Gamma hyperprior,
+    ``prior_concentration`` (shape and scale), or fixed at
+    ``concentration``. The probability of a partition depends only on the
+    sizes of its groups, so it is tabulated by integer partition (in
+    ``integer_partitions``, with ``probabilities``). Partitions are drawn
+    from an alias table, in constant time: of every partition, if there
+    are no more than ``PARTITION_PRIOR_MAX_SET_PARTITIONS`` of them, or else
+    of the integer partitions, with the elements then shuffled into groups
+    of the sizes drawn.
+    """
+
+    def __init__(self, number_of_elements, prior_concentration=None, concentration=None):
+        if (prior_concentration is None) == (concentration is None):
+            raise TypeError("Exactly one of 'prior_concentration' and 'concentration' must be specified")
+        if number_of_elements < 1 or number_of_elements > PARTITION_PRIOR_MAX_ELEMENTS:
+            raise ValueError("Exact prior probabilities of partitions can only be computed for 1 to {} elements, not {}".format(
+                PARTITION_PRIOR_MAX_ELEMENTS, number_of_elements))
+        self.number_of_elements = number_of_elements
+        if concentration is None:
+            self.num_groups_weights = _integrate_num_groups_weights(number_of_elements, prior_concentration)
+        else:
+            self.num_groups_weights = _get_num_groups_weights(number_of_elements, concentration)
+        self.integer_partitions = tuple(iterate_integer_partitions(number_of_elements))
+        self.num_partitions = []
+        for group_sizes in self.integer_partitions:
+            # number of partitions of the elements into groups of these sizes
+            num_partitions = math.factorial(number_of_elements)
+            for group_size in group_sizes:
+                num_partitions //= math.factorial(group_size)
+            for multiplicity in collections.Counter(group_sizes).values():
+                num_partitions //= math.factorial(multiplicity)
+            self.num_partitions.append(num_partitions)
+        # the total is 1 but for the error of integrating over the hyperprior
+        total_probability = math.fsum(num_partitions * self.get_partition_probability(group_sizes)
+                for group_sizes, num_partitions in zip(self.integer_partitions, self.num_partitions))
+        self.num_groups_weights = [weight / total_probability for weight in self.num_groups_weights]
+        self.probabilities = [num_partitions * self.get_partition_probability(group_sizes)
+                for group_sizes, num_partitions in zip(self.integer_partitions, self.num_partitions)]
+        if sum(self.num_partitions) <= PARTITION_PRIOR_MAX_SET_PARTITIONS:
+            # the groups of each partition, in order of their first element
+            self.set_partitions = []
+            set_partition_probabilities = []
+            for code in iterate_set_partition_codes(number_of_elements):
+                groups = [[] for group_idx in range(max(code) + 1)]
+                for element_id, group_idx in enumerate(code):
+                    groups[group_idx].append(element_id)
+                self.set_partitions.append(tuple(tuple(group) for group in groups))
+                set_partition_probabilities.append(self.get_partition_probability([len(group) for group in groups]))
+            self.set_partitions = tuple(self.set_partitions)
+            self._alias_probabilities, self._aliases = compile_alias_table(set_partition_probabilities)
+        else:
+            self.set_partitions = None
+            self._alias_probabilities, self._aliases = compile_alias_table(self.probabilities)
+        self._batch_tables = None
+
+    def get_partition_probability(self, group_sizes):
+        """
+        Returns the prior probability of a particular partition of the
+        elements, with groups of sizes ``group_sizes`` (e.g., of the
+        divergence time model 'M1121', with sizes 3 and 1).
+        """
+        probability = self.num_groups_weights[len(group_sizes)-1]
+        for group_size in group_sizes:
+            probability *= math.factorial(group_size - 1)
+        return probability
+
+    def get_num_groups_probabilities(self):
+        """
+        Returns the prior probability of each number of groups, from 1 to
+        ``number_of_elements``.
+        """
+        num_groups_probabilities = [0.0 for k in range(self.number_of_elements)]
+        for group_sizes, probability in zip(self.integer_partitions, self.probabilities):
+            num_groups_probabilities[len(group_sizes)-1] += probability
+        return num_groups_probabilities
+
+    def sample_partition(self, rng):
+        """
+        Returns a partition of the elements ``0, ..., number_of_elements - 1``
+        drawn from the prior, as a tuple of groups (tuples of elements).
+        """
+        num_cells = len(self._aliases)
+        rnd = rng.random() * num_cells
+        idx = min(int(rnd), num_cells - 1)
+        if rnd - idx >= self._alias_probabilities[idx]:
+            idx = self._aliases[idx]
+        if self.set_partitions is not None:
+            return self.set_partitions[idx]
+        element_ids = list(range(self.number_of_elements))
+        rng.shuffle(element_ids)
+        groups = []
+        start_idx = 0
+        for group_size in self.integer_partitions[idx]:
+            groups.append(tuple(element_ids[start_idx:start_idx+group_size]))
+            start_idx += group_size
+        return tuple(groups)
+
+    def sample_partitions_batch(self, num_replicates, rng):
+        """
+        Draws ``num_replicates`` partitions from the prior, with ``rng`` a
+        ``numpy.random.RandomState``, as an array of the group of each
+        element by replicate, with groups numbered in order of their first
+        element.
+        """
+        numpy = coalescent.numpy
+        if self._batch_tables is None:
+            if self.set_partitions is not None:
+                # the group of each element, for each partition
+                group_templates = numpy.empty((len(self.set_partitions), self.number_of_elements), dtype=int)
+                for idx, groups in enumerate(self.set_partitions):
+                    for group_idx, group in enumerate(groups):
+                        group_templates[idx, list(group)] = group_idx
+            else:
+                # the group of each element, of the elements in shuffled
+                # order, for each integer partition
+                group_templates = numpy.array([[group_idx for group_idx, group_size in enumerate(group_sizes) for i in range(group_size)]
+                        for group_sizes in self.integer_partitions], dtype=int)
+            self._batch_tables = (
+                    numpy.array(self._alias_probabilities),
+                    numpy.array(self._aliases, dtype=int),
+                    group_templates)
+        alias_probabilities, aliases, group_templates = self._batch_tables
+        num_cells = len(aliases)
+        rnd = rng.random_sample(num_replicates) * num_cells
+        idxs = numpy.minimum(rnd.astype(int), num_cells - 1)
+        idxs = numpy.where(rnd - idxs < alias_probabilities[idxs], idxs, aliases[idxs])
+        if self.set_partitions is not None:
+            return group_templates[idxs]
+        rows = numpy.arange(num_replicates)
+        shuffled_idxs = numpy.argsort(rng.random_sample((num_replicates, self.number_of_elements)), axis=1)
+        unordered_groups = numpy.empty((num_replicates, self.number_of_elements), dtype=int)
+        unordered_groups[rows[:, None], shuffled_idxs] = group_templates[idxs]
+        return number_groups_in_order(unordered_groups, self.number_of_elements)
+
+    def write(self, results_csv_writer, is_write_header=True):
+        """
+        Writes the table of the prior probabilities of the integer
+        partitions to ``results_csv_writer``: for each, the sizes of the
+        groups, their number, the number of (divergence time) models, i.e.,
+        partitions of the elements, with groups of these sizes, the
+        probability of each of these, and that of all of them together.
+        """
+        results_csv_writer.fieldnames = [
+                "groupSizes",
+                "numDivTimes",
+                "numDivTimeModels",
+                "divTimeModelProbability",
+                "probability",
+                ]
+        if is_write_header:
+            results_csv_writer.writeheader()
+        for group_sizes, num_partitions, probability in zip(self.integer_partitions, self.num_partitions, self.probabilities):
+            results_csv_writer.writerow({
+                "groupSizes": "+".join(str(group_size) for group_size in group_sizes),
+                "numDivTimes": len(group_sizes),
+                "numDivTimeModels": num_partitions,
+                "divTimeModelProbability": probability / num_partitions,
+                "probability": probability,
+                })
+
+# Number of replicates drawn at a time by 'GerenukSimulationModel.iter_prior_batches'
+PRIOR_BATCH_SIZE = 100000
+
 def compose_lineage_pair_label(lineage_pair_idx):
     return "spp{}".format(lineage_pair_idx)
 
@@ -204,9 +705,13 @@ class LineagePair(object):
 
 class GerenukSimulationModel(object):
 
-    def __init__(self, params_d, locus_info,):
+    def __init__(self, params_d, locus_info, is_precompute_partition_prior=False):
         self.configure_loci(locus_info)
         self.configure_params(params_d)
+        self.compile_output_schema()
+        self.partition_prior = None
+        if is_precompute_partition_prior:
+            self.precompute_partition_prior()
 
     def configure_loci(self, locus_info):
         self.label_to_lineage_pair_map = {}
@@ -332,15 +837,70 @@ class GerenukSimulationModel(object):
         if params_d:
             raise Exception("Unrecognized parameter configuration entries: {}".format(params_d))
 
+    def compile_output_schema(self):
+        """
+        Composes the names of the parameter fields of the results, in
+        order, and notes the positions of the values of each lineage pair
+        among them, so that sampling the values of a replicate only has to
+        fill these in. Also notes the order of the loci (those of each
+        lineage pair in turn), that of the summary statistics of the
+        results.
+        """
+        param_fieldnames = ["param.divTimeModel", "param.numDivTimes"]
+        self._div_time_field_idxs = []
+        self._theta_field_idxs = []
+        for lineage_pair in self.lineage_pairs:
+            self._div_time_field_idxs.append(len(param_fieldnames))
+            param_fieldnames.append("param.divTime.{}".format(lineage_pair.taxon_label))
+            theta_field_idxs = []
+            for deme_label in (_DEME0_LABEL, _DEME1_LABEL, _ANCESTOR_DEME_LABEL):
+                theta_field_idxs.append(len(param_fieldnames))
+                param_fieldnames.append("param.theta.{}.{}".format(lineage_pair.taxon_label, deme_label))
+            self._theta_field_idxs.append(tuple(theta_field_idxs))
+        self.param_fieldnames = tuple(param_fieldnames)
+        self.loci = tuple((lineage_pair, locus_definition)
+                for lineage_pair in self.lineage_pairs
+                for locus_definition in lineage_pair.locus_definitions)
+        self._locus_field_name_prefixes = {}
+
+    def get_locus_field_name_prefixes(self, stat_label_prefix):
+        """
+        Returns the prefixes of the names of the summary statistic fields of
+        each locus, in the order of ``loci``.
+        """
+        try:
+            return self._locus_field_name_prefixes[stat_label_prefix]
+        except KeyError:
+            field_name_prefixes = tuple("{}.{}.{}".format(stat_label_prefix, lineage_pair.taxon_label, locus_definition.locus_label)
+                    for lineage_pair, locus_definition in self.loci)
+            self._locus_field_name_prefixes[stat_label_prefix] = field_name_prefixes
+            return field_name_prefixes
+
     def _get_num_lineage_pairs(self):
         return len(self.lineage_pairs)
     num_lineage_pairs = property(_get_num_lineage_pairs)
 
+    def precompute_partition_prior(self):
+        """
+        Tabulates the exact prior probabilities of the partitions of the
+        lineage pairs into groups with the same divergence time (see
+        ``PartitionPrior``), in ``partition_prior``, from which they are
+        then drawn, instead of by the Chinese restaurant process.
+        """
+        if self.num_tau_classes:
+            raise ValueError("Exact prior on divergence time models not applicable with a fixed number of divergence times ('numTauClasses')")
+        self.partition_prior = PartitionPrior(
+                number_of_elements=self.num_lineage_pairs,
+                prior_concentration=self.prior_concentration)
+        return self.partition_prior
+
     def sample_parameter_values_from_prior(self, rng):
-        params = collections.OrderedDict()
+        # values in the order of 'param_fieldnames', so that the fields are
+        # in the same order (that of the lineage pairs) in every replicate,
+        # regardless of the grouping of divergence times
+        param_values = [None for fieldname in self.param_fieldnames]
 
         ## div time
-        params["param.divTimeModel"] = "NA" # initialize here, so first column
         if self.num_tau_classes:
             if self.num_tau_classes >= self.num_lineage_pairs:
                 groups = [[idx] for idx in range(self.num_lineage_pairs)]
@@ -352,6 +912,8 @@ class GerenukSimulationModel(object):
                     group.append(element_ids.pop(0))
                 for element_id in element_ids:
                     rng.choice(groups).append(element_id)
+        elif self.partition_prior is not None:
+            groups = self.partition_prior.sample_partition(rng)
         else:
             concentration_v = rng.gammavariate(*self.prior_concentration)
             # params["param.concentration"] = concentration_v
@@ -360,7 +922,7 @@ class GerenukSimulationModel(object):
                     scaling_parameter=concentration_v, # sample from prior
                     rng=rng,
                     )
-        params["param.numDivTimes"] = len(groups)
+        param_values[1] = len(groups) # param.numDivTimes
         div_time_values = [rng.gammavariate(*self.prior_tau) for i in groups]
         fsc2_run_configurations = collections.OrderedDict()
         div_time_model_desc = [None for i in range(self.num_lineage_pairs)]
@@ -378,7 +940,7 @@ class GerenukSimulationModel(object):
                 ## divergence time
                 div_time_model_desc[lineage_pair_idx] = str(group_id+1) # divergence time model description
                 div_time = div_time_values[group_id]
-                params["param.divTime.{}".format(lineage_pair.taxon_label)] = div_time
+                param_values[self._div_time_field_idxs[lineage_pair_idx]] = div_time
 
                 ## population parameters --- separate N and mu parameterization
                 ## -- deme 0
@@ -436,9 +998,10 @@ class GerenukSimulationModel(object):
                     deme2_theta = rng.gammavariate(*self.prior_ancestral_theta)
                 else:
                     deme2_theta = rng.gammavariate(*self.prior_theta)
-                params["param.theta.{}.{}".format(lineage_pair.taxon_label, _DEME0_LABEL)] = deme0_theta
-                params["param.theta.{}.{}".format(lineage_pair.taxon_label, _DEME1_LABEL)] = deme1_theta
-                params["param.theta.{}.{}".format(lineage_pair.taxon_label, _ANCESTOR_DEME_LABEL)] = deme2_theta
+                deme0_theta_field_idx, deme1_theta_field_idx, deme2_theta_field_idx = self._theta_field_idxs[lineage_pair_idx]
+                param_values[deme0_theta_field_idx] = deme0_theta
+                param_values[deme1_theta_field_idx] = deme1_theta
+                param_values[deme2_theta_field_idx] = deme2_theta
 
                 for locus_id, locus_definition in enumerate(lineage_pair.locus_definitions):
                     # Fastsimecoal2 separates pop size and mutation rate, but
@@ -478,14 +1041,204 @@ class GerenukSimulationModel(object):
                         "ti_proportional_bias": (1.0 * locus_definition.ti_tv_rate_ratio)/3.0,
                         }
                     fsc2_run_configurations[locus_definition] = fsc2_config_d
-        params["param.divTimeModel"] = "M{}".format("".join(div_time_model_desc))
+        param_values[0] = "M{}".format("".join(div_time_model_desc)) # param.divTimeModel
+        params = collections.OrderedDict(zip(self.param_fieldnames, param_values))
         return params, fsc2_run_configurations
 
+    def sample_parameter_values_from_prior_batch(self, num_replicates, rng):
+        """
+        Draws the parameter values of ``num_replicates`` replicates at once,
+        from the same prior as ``sample_parameter_values_from_prior``, with
+        ``rng`` a ``numpy.random.RandomState``. Returns a dictionary with
+        an array of the values of each of ``param_fieldnames``, in that
+        order, and an array of the index of the divergence time of each
+        lineage pair (numbered in order of the first lineage pair with each)
+        by replicate and lineage pair.
+        """
+        numpy = coalescent.numpy
+        if numpy is None:
+            raise ImportError("Sampling parameter values in batches requires NumPy")
+        num_lineage_pairs = self.num_lineage_pairs
+        rows = numpy.arange(num_replicates)
+        if self.num_tau_classes:
+            if self.num_tau_classes >= num_lineage_pairs:
+                div_time_groups = numpy.tile(numpy.arange(num_lineage_pairs), (num_replicates, 1))
+            else:
+                # as for a single replicate: the first of the lineage pairs
+                # in a random order each start a group, and the rest join
+                # groups at random
+                num_groups = self.num_tau_classes
+                shuffled_idxs = numpy.argsort(rng.random_sample((num_replicates, num_lineage_pairs)), axis=1)
+                unordered_groups = numpy.empty((num_replicates, num_lineage_pairs), dtype=int)
+                unordered_groups[rows[:, None], shuffled_idxs[:, :num_groups]] = numpy.arange(num_groups)
+                unordered_groups[rows[:, None], shuffled_idxs[:, num_groups:]] = rng.randint(0, num_groups, (num_replicates, num_lineage_pairs - num_groups))
+                div_time_groups = number_groups_in_order(unordered_groups, num_groups)
+        elif self.partition_prior is not None:
+            div_time_groups = self.partition_prior.sample_partitions_batch(num_replicates, rng)
+        else:
+            # The partition of the lineage pairs drawn by the Chinese
+            # restaurant process is exchangeable, so they can be seated in
+            # order (as 'sample_partition' does), giving groups already
+            # numbered in order of their first lineage pair.
+            # Each lineage pair starts a new group with probability a/(a+i),
+            # or otherwise joins the group of one of the i before it, chosen
+            # uniformly (i.e., a group with probability proportional to its
+            # size).
+            concentration = rng.gamma(self.prior_concentration[0], self.prior_concentration[1], num_replicates)
+            div_time_groups = numpy.zeros((num_replicates, num_lineage_pairs), dtype=int)
+            num_groups = numpy.ones(num_replicates, dtype=int)
+            for lineage_pair_idx in range(1, num_lineage_pairs):
+                is_new = rng.random_sample(num_replicates) * (concentration + lineage_pair_idx) < concentration
+                joined_idxs = rng.randint(0, lineage_pair_idx, num_replicates)
+                div_time_groups[:, lineage_pair_idx] = numpy.where(is_new, num_groups, div_time_groups[rows, joined_idxs])
+                num_groups += is_new
+        div_times = rng.gamma(self.prior_tau[0], self.prior_tau[1], (num_replicates, num_lineage_pairs))[rows[:, None], div_time_groups]
+        deme0_thetas = rng.gamma(self.prior_theta[0], self.prior_theta[1], (num_replicates, num_lineage_pairs))
+        if self.theta_constraints[1] == self.theta_constraints[0]:
+            deme1_thetas = deme0_thetas
+        else:
+            deme1_thetas = rng.gamma(self.prior_theta[0], self.prior_theta[1], (num_replicates, num_lineage_pairs))
+        if self.theta_constraints[2] == self.theta_constraints[0]:
+            deme2_thetas = deme0_thetas
+        elif self.theta_constraints[2] == self.theta_constraints[1]:
+            deme2_thetas = deme1_thetas
+        elif self.prior_ancestral_theta[0] != 0 and self.prior_ancestral_theta[1] != 0:
+            deme2_thetas = rng.gamma(self.prior_ancestral_theta[0], self.prior_ancestral_theta[1], (num_replicates, num_lineage_pairs))
+        else:
+            deme2_thetas = rng.gamma(self.prior_theta[0], self.prior_theta[1], (num_replicates, num_lineage_pairs))
+        param_values = [None for fieldname in self.param_fieldnames]
+        param_values[0] = compose_div_time_models(div_time_groups)
+        param_values[1] = div_time_groups.max(axis=1) + 1
+        for lineage_pair_idx in range(num_lineage_pairs):
+            param_values[self._div_time_field_idxs[lineage_pair_idx]] = div_times[:, lineage_pair_idx]
+            for theta_field_idx, thetas in zip(self._theta_field_idxs[lineage_pair_idx], (deme0_thetas, deme1_thetas, deme2_thetas)):
+                param_values[theta_field_idx] = thetas[:, lineage_pair_idx]
+        return collections.OrderedDict(zip(self.param_fieldnames, param_values)), div_time_groups
+
+    def iter_prior_batches(self, num_replicates, random_seed, batch_size=PRIOR_BATCH_SIZE):
+        """
+        Iterates over the results of ``sample_parameter_values_from_prior_batch``
+        for ``num_replicates`` replicates in batches of up to
+        ``batch_size``, with batch ``i`` drawn with a
+        ``numpy.random.RandomState`` seeded by ``random_seed`` and ``i``, so
+        that the values are the same given the same seed and batch size.
+        """
+        for batch_idx, start_idx in enumerate(range(0, num_replicates, batch_size)):
+            rng = coalescent.numpy.random.RandomState([random_seed & 0xFFFFFFFF, random_seed >> 32, batch_idx])
+            yield self.sample_parameter_values_from_prior_batch(
+                    num_replicates=min(batch_size, num_replicates - start_idx),
+                    rng=rng)
+
+def number_groups_in_order(groups, num_groups):
+    """
+    Returns a copy of an array of the group (less than ``num_groups``) of
+    each element by replicate, with the groups of each replicate renumbered
+    in order of their first element.
+    """
+    numpy = coalescent.numpy
+    num_replicates, num_elements = groups.shape
+    rows = numpy.arange(num_replicates)
+    ordered_groups = numpy.empty((num_replicates, num_elements), dtype=int)
+    group_numbers = numpy.full((num_replicates, num_groups), -1, dtype=int)
+    num_numbered = numpy.zeros(num_replicates, dtype=int)
+    for element_idx in range(num_elements):
+        group = groups[:, element_idx]
+        is_new = group_numbers[rows, group] < 0
+        group_numbers[rows[is_new], group[is_new]] = num_numbered[is_new]
+        num_numbered += is_new
+        ordered_groups[:, element_idx] = group_numbers[rows, group]
+    return ordered_groups
+
+def compose_div_time_models(div_time_groups):
+    """
+    Returns an array of the divergence time model descriptions (as in the
+    'param.divTimeModel' field, e.g., 'M1121') of an array of the group of
+    each lineage pair by replicate (as returned by
+    ``GerenukSimulationModel.sample_parameter_values_from_prior_batch``).
+    """
+    numpy = coalescent.numpy
+    num_replicates, num_lineage_pairs = div_time_groups.shape
+    if num_lineage_pairs < 10:
+        # a single character for each group
+        codes = numpy.empty((num_replicates, num_lineage_pairs + 1), dtype=numpy.uint8)
+        codes[:, 0] = ord("M")
+        codes[:, 1:] = div_time_groups + ord("1")
+        return codes.view("S{}".format(num_lineage_pairs + 1)).reshape(num_replicates).astype(str)
+    return numpy.array(["M{}".format("".join(str(group+1) for group in groups)) for groups in div_time_groups.tolist()])
+
 class Fsc2RuntimeError(RuntimeError):
     def __init__(self, msg):
         RuntimeError.__init__(self, msg)
 
-class Fsc2Handler(object):
+class SimulationHandler(object):
+    """
+    Base class of the simulator backends: simulates the site frequency
+    spectra of loci under the configurations given by
+    ``GerenukSimulationModel.sample_parameter_values_from_prior``, adding
+    them to dictionaries of results with the same field names whichever
+    backend is used. Derived classes implement ``run_batch``.
+    """
+
+    backend_description = None
+    # The phases of a run that are timed, as (key, description) pairs.
+    phase_descriptions = ()
+
+    def __init__(self,
+            name,
+            is_calculate_single_population_sfs,
+            is_calculate_joint_population_sfs,
+            is_unfolded_site_frequency_spectrum,
+            ):
+        self.name = name
+        self.is_unfolded_site_frequency_spectrum = is_unfolded_site_frequency_spectrum
+        self.is_calculate_single_population_sfs = is_calculate_single_population_sfs
+        self.is_calculate_joint_population_sfs = is_calculate_joint_population_sfs
+        self._num_executions = 0
+        # Cumulative time (in seconds) spent in each phase of the runs.
+        self.phase_durations = collections.OrderedDict((key, 0.0) for key, description in self.phase_descriptions)
+
+    def run(self,
+            field_name_prefix,
+            fsc2_config_d,
+            random_seed,
+            results_d,):
+        if results_d is None:
+            results_d = collections.OrderedDict()
+        self.run_batch(
+                field_name_prefixes=[field_name_prefix],
+                fsc2_config_d=fsc2_config_d,
+                random_seed=random_seed,
+                results_ds=[results_d])
+        return results_d
+
+    def run_batch(self,
+            field_name_prefixes,
+            fsc2_config_d,
+            random_seed,
+            results_ds=None):
+        """
+        Runs independent simulations, one for each of
+        ``field_name_prefixes``, under the same configuration, adding the
+        site frequency spectrum of each simulation to the corresponding
+        dictionary of ``results_ds``, with field names prefixed by the
+        corresponding entry of ``field_name_prefixes``.
+        """
+        raise NotImplementedError()
+
+    def describe_phase_durations(self):
+        return "{} {} runs: {}".format(
+                self._num_executions,
+                self.backend_description,
+                ", ".join("{:.3f}s {}".format(self.phase_durations[key], description) for key, description in self.phase_descriptions))
+
+class Fsc2Handler(SimulationHandler):
+
+    backend_description = "FastSimCoal2"
+    phase_descriptions = (
+            ("write", "writing parameter files"),
+            ("execute", "running FastSimCoal2"), # including writing its output
+            ("read", "reading results"),
+            )
 
     def __init__(self,
             name,
@@ -495,26 +1248,27 @@ class Fsc2Handler(object):
             is_calculate_joint_population_sfs,
             is_unfolded_site_frequency_spectrum,
             ):
-        self.name = name
+        SimulationHandler.__init__(self,
+                name=name,
+                is_calculate_single_population_sfs=is_calculate_single_population_sfs,
+                is_calculate_joint_population_sfs=is_calculate_joint_population_sfs,
+                is_unfolded_site_frequency_spectrum=is_unfolded_site_frequency_spectrum)
         self.fsc2_path = fsc2_path
         self.working_directory = working_directory
-        self.is_unfolded_site_frequency_spectrum = is_unfolded_site_frequency_spectrum
         if self.is_unfolded_site_frequency_spectrum:
             self.sfs_file_prefix = "DAF"
             self.fsc2_sfs_generation_command = "-d"
         else:
             self.sfs_file_prefix = "MAF"
             self.fsc2_sfs_generation_command = "-m"
-        self.is_calculate_single_population_sfs = is_calculate_single_population_sfs
-        self.is_calculate_joint_population_sfs = is_calculate_joint_population_sfs
         self._is_file_system_staged = False
-        self._num_executions = 0
         self._current_execution_id = None
         self._parameter_filepath = None
         self._results_dirpath = None
         self._deme0_site_frequency_filepath = None
         self._deme1_site_frequency_filepath = None
         self._joint_site_frequency_filepath = None
+        self._site_frequency_spectrum_keys = {}
 
     def _get_parameter_filepath(self):
         if self._parameter_filepath is None:
@@ -573,71 +1327,150 @@ class Fsc2Handler(object):
             config = FSC2_CONFIG_TEMPLATE.format(**fsc2_config_d)
             dest.write(config)
 
+    def _parse_num_observations(self, filepath, line):
+        # e.g., "1 observations (lhood = 0.0000000000)"
+        try:
+            return int(line.split()[0])
+        except (IndexError, ValueError):
+            raise Fsc2RuntimeError("File '{}': expecting number of observations but found '{}'".format(filepath, line))
+
     def _parse_deme_derived_allele_frequencies(self,
             filepath,
             field_name_prefix,
             results_d):
-        # results_d = collections.OrderedDict()
+        return self._parse_batch_deme_derived_allele_frequencies(
+                filepath=filepath,
+                field_name_prefixes=[field_name_prefix],
+                results_ds=[results_d])[0]
+
+    def _parse_batch_deme_derived_allele_frequencies(self,
+            filepath,
+            field_name_prefixes,
+            results_ds):
+        # One row of values per observation (i.e., simulation of a batched
+        # run) following the header row, each with a trailing tab.
         with open(filepath) as src:
             lines = src.read().split("\n")
-            assert len(lines) == 4 and lines[3] == ""
-            header_row = lines[1].split("\t")
-            results_d_row = lines[2].split("\t")
-            assert len(header_row) == len(results_d_row)
-            for key, val in zip(header_row, results_d_row):
-                if not val:
-                    continue
-                results_d["{}.{}".format(field_name_prefix, key)] = float(val)
-        return results_d
+        num_observations = self._parse_num_observations(filepath, lines[0])
+        if num_observations != len(field_name_prefixes) or len(lines) != num_observations + 3 or lines[-1]:
+            raise Fsc2RuntimeError("File '{}': expecting {} observations".format(filepath, len(field_name_prefixes)))
+        header = lines[1].rstrip("\t")
+        num_fields = header.count("\t") + 1
+        for field_name_prefix, results_d, line in zip(field_name_prefixes, results_ds, lines[2:]):
+            keys = self._get_site_frequency_spectrum_keys(field_name_prefix, header)
+            values = line.rstrip("\t").split("\t")
+            if len(values) != num_fields:
+                raise Fsc2RuntimeError("File '{}': expecting {} values but found {}".format(filepath, num_fields, len(values)))
+            results_d.update(zip(keys, map(float, values)))
+        return results_ds
 
     def _parse_joint_derived_allele_frequencies(self,
             filepath,
             field_name_prefix,
             results_d):
-        # results_d = collections.OrderedDict()
+        return self._parse_batch_joint_derived_allele_frequencies(
+                filepath=filepath,
+                field_name_prefixes=[field_name_prefix],
+                results_ds=[results_d])[0]
+
+    def _parse_batch_joint_derived_allele_frequencies(self,
+            filepath,
+            field_name_prefixes,
+            results_ds):
+        # One matrix per observation (i.e., simulation of a batched run),
+        # each starting with a header row with an empty first column, and
+        # each row after that starting with the label of the row.
         with open(filepath) as src:
             lines = src.read().split("\n")
-            col_keys = lines[1].split("\t")[1:]
-            for line in lines[2:]:
-                if not line:
-                    continue
-                cols = line.split("\t")
-                assert len(cols) - 1 == len(col_keys)
-                row_key = cols[0]
-                for col_key, val in zip(col_keys, cols[1:]):
-                    results_d["{}.{}.{}".format(field_name_prefix, row_key, col_key)] = float(val)
-        return results_d
+        num_observations = self._parse_num_observations(filepath, lines[0])
+        if lines[-1] == "":
+            lines.pop()
+        if num_observations != len(field_name_prefixes) or (len(lines) - 1) % num_observations:
+            raise Fsc2RuntimeError("File '{}': expecting {} observations".format(filepath, len(field_name_prefixes)))
+        block_size = (len(lines) - 1) // num_observations
+        for observation_idx, (field_name_prefix, results_d) in enumerate(zip(field_name_prefixes, results_ds)):
+            start = 1 + observation_idx * block_size
+            header = lines[start]
+            if header[:1] != "\t":
+                raise Fsc2RuntimeError("File '{}': expecting header row of observation {} but found '{}'".format(filepath, observation_idx+1, header))
+            row_keys = []
+            rows = []
+            for line in lines[start+1:start+block_size]:
+                row_key, sep, row = line.partition("\t")
+                row_keys.append(row_key)
+                rows.append(row)
+            keys = self._get_site_frequency_spectrum_keys(field_name_prefix, header, tuple(row_keys))
+            values = "\t".join(rows).split("\t")
+            if len(values) != len(keys):
+                raise Fsc2RuntimeError("File '{}': expecting {} values in observation {} but found {}".format(filepath, len(keys), observation_idx+1, len(values)))
+            results_d.update(zip(keys, map(float, values)))
+        return results_ds
+
+    def _get_site_frequency_spectrum_keys(self, field_name_prefix, header, row_keys=None):
+        # The layout of the site frequency spectrum files of a locus (i.e.,
+        # the column and row labels, given by the sample sizes) is the same
+        # for every run, so the field names of the values are composed only
+        # the first time each is seen.
+        layout = (field_name_prefix, header, row_keys)
+        keys = self._site_frequency_spectrum_keys.get(layout)
+        if keys is None:
+            if row_keys is None:
+                keys = ["{}.{}".format(field_name_prefix, col_key) for col_key in header.split("\t")]
+            else:
+                col_keys = header.split("\t")[1:]
+                keys = ["{}.{}.{}".format(field_name_prefix, row_key, col_key) for row_key in row_keys for col_key in col_keys]
+            self._site_frequency_spectrum_keys[layout] = keys
+        return keys
 
     def _harvest_run_results(self, field_name_prefix, results_d):
+        return self._harvest_batch_run_results(
+                field_name_prefixes=[field_name_prefix],
+                results_ds=[results_d])[0]
+
+    def _harvest_batch_run_results(self, field_name_prefixes, results_ds):
         if self.is_calculate_single_population_sfs:
-            self._parse_deme_derived_allele_frequencies(
+            self._parse_batch_deme_derived_allele_frequencies(
                     filepath=self.deme0_site_frequency_filepath,
-                    field_name_prefix="{}.{}.sfs".format(field_name_prefix, compose_deme_label(0)),
-                    results_d=results_d)
-            self._parse_deme_derived_allele_frequencies(
+                    field_name_prefixes=["{}.{}.sfs".format(field_name_prefix, compose_deme_label(0)) for field_name_prefix in field_name_prefixes],
+                    results_ds=results_ds)
+            self._parse_batch_deme_derived_allele_frequencies(
                     filepath=self.deme1_site_frequency_filepath,
-                    field_name_prefix="{}.{}.sfs".format(field_name_prefix, compose_deme_label(1)),
-                    results_d=results_d)
+                    field_name_prefixes=["{}.{}.sfs".format(field_name_prefix, compose_deme_label(1)) for field_name_prefix in field_name_prefixes],
+                    results_ds=results_ds)
         if self.is_calculate_joint_population_sfs:
-            self._parse_joint_derived_allele_frequencies(
+            self._parse_batch_joint_derived_allele_frequencies(
                     filepath=self.joint_site_frequency_filepath,
-                    field_name_prefix="{}.joint.sfs".format(field_name_prefix),
-                    results_d=results_d)
-        return results_d
+                    field_name_prefixes=["{}.joint.sfs".format(field_name_prefix) for field_name_prefix in field_name_prefixes],
+                    results_ds=results_ds)
+        return results_ds
 
     def _post_execution_cleanup(self):
         pass
 
-    def run(self,
-            field_name_prefix,
+    def run_batch(self,
+            field_name_prefixes,
             fsc2_config_d,
             random_seed,
-            results_d,):
+            results_ds=None):
+        """
+        Runs independent simulations, one for each of
+        ``field_name_prefixes``, under the same configuration, with a single
+        invocation of FastSimCoal2 (i.e., ``-n`` with the number of
+        simulations), adding the site frequency spectrum of each simulation
+        to the corresponding dictionary of ``results_ds``, with field names
+        prefixed by the corresponding entry of ``field_name_prefixes``.
+        """
+        if results_ds is None:
+            results_ds = [collections.OrderedDict() for field_name_prefix in field_name_prefixes]
+        start_time = time.time()
         self._setup_for_execution()
         self._generate_parameter_file(fsc2_config_d)
+        end_time = time.time()
+        self.phase_durations["write"] += end_time - start_time
+        start_time = end_time
         cmds = []
         cmds.append(self.fsc2_path)
-        cmds.extend(["-n", "1"]) # number of simulations to perform
+        cmds.extend(["-n", str(len(field_name_prefixes))]) # number of simulations to perform
         cmds.extend(["-r", str(random_seed)]) # seed for random number generator (positive integer <= 1E6)
         cmds.append(self.fsc2_sfs_generation_command)
         cmds.extend(["-s0", "-x", "-I", ])
@@ -652,12 +1485,239 @@ class Fsc2Handler(object):
         if p.returncode != 0:
             raise Fsc2RuntimeError("FastSimCoal2 execution failure: {}".format(stderr))
         self._num_executions += 1
-        if results_d is None:
-            results_d = collections.OrderedDict()
-        self._harvest_run_results(
-                field_name_prefix=field_name_prefix,
-                results_d=results_d)
+        end_time = time.time()
+        self.phase_durations["execute"] += end_time - start_time
+        start_time = end_time
+        self._harvest_batch_run_results(
+                field_name_prefixes=field_name_prefixes,
+                results_ds=results_ds)
         self._post_execution_cleanup()
+        self.phase_durations["read"] += time.time() - start_time
+        return results_ds
+
+class NativeSimulationHandler(SimulationHandler):
+    """
+    Simulates the site frequency spectra of the model of
+    ``FSC2_CONFIG_TEMPLATE`` directly (see ``gerenuk.coalescent``), without
+    running FastSimCoal2 or exchanging files, with all the simulations of a
+    batch run together.
+    """
+
+    backend_description = "native"
+    phase_descriptions = (
+            ("simulate", "simulating site frequency spectra"),
+            ("tabulate", "compiling results"),
+            )
+
+    def __init__(self,
+            name,
+            is_calculate_single_population_sfs,
+            is_calculate_joint_population_sfs,
+            is_unfolded_site_frequency_spectrum,
+            ):
+        if coalescent.numpy is None:
+            raise ImportError("The native simulation backend requires NumPy")
+        SimulationHandler.__init__(self,
+                name=name,
+                is_calculate_single_population_sfs=is_calculate_single_population_sfs,
+                is_calculate_joint_population_sfs=is_calculate_joint_population_sfs,
+                is_unfolded_site_frequency_spectrum=is_unfolded_site_frequency_spectrum)
+        self._site_frequency_spectrum_keys = {}
+
+    def _get_site_frequency_spectrum_keys(self, field_name_prefix, n0, n1):
+        # composed only the first time each locus is seen
+        layout = (field_name_prefix, n0, n1)
+        keys = self._site_frequency_spectrum_keys.get(layout)
+        if keys is None:
+            keys = []
+            if self.is_calculate_single_population_sfs:
+                for deme_idx, num_genes in enumerate((n0, n1)):
+                    keys.extend("{}.{}.sfs.d{}_{}".format(field_name_prefix, compose_deme_label(deme_idx), deme_idx, count_idx) for count_idx in range(num_genes+1))
+            if self.is_calculate_joint_population_sfs:
+                keys.extend("{}.joint.sfs.d1_{}.d0_{}".format(field_name_prefix, d1_idx, d0_idx) for d1_idx in range(n1+1) for d0_idx in range(n0+1))
+            self._site_frequency_spectrum_keys[layout] = keys
+        return keys
+
+    def run_batch(self,
+            field_name_prefixes,
+            fsc2_config_d,
+            random_seed,
+            results_ds=None):
+        if results_ds is None:
+            results_ds = [collections.OrderedDict() for field_name_prefix in field_name_prefixes]
+        start_time = time.time()
+        n0 = int(fsc2_config_d["d0_sample_size"])
+        n1 = int(fsc2_config_d["d1_sample_size"])
+        sfs = coalescent.simulate_joint_site_frequency_spectra(
+                num_replicates=len(field_name_prefixes),
+                sample_sizes=(n0, n1),
+                population_sizes=(fsc2_config_d["d0_population_size"], fsc2_config_d["d1_population_size"]),
+                div_time=fsc2_config_d["div_time"],
+                mutation_rate=fsc2_config_d["mutation_rate"],
+                num_sites=int(fsc2_config_d["num_sites"]),
+                is_unfolded_site_frequency_spectrum=self.is_unfolded_site_frequency_spectrum,
+                rng=coalescent.numpy.random.RandomState(random_seed))
+        self._num_executions += 1
+        end_time = time.time()
+        self.phase_durations["simulate"] += end_time - start_time
+        start_time = end_time
+        # Same fields, in the same order, as harvested from FastSimCoal2:
+        # the spectrum of each deme, then the joint spectrum by rows of
+        # deme 1 and columns of deme 0.
+        sfs = sfs.astype(float)
+        columns = []
+        if self.is_calculate_single_population_sfs:
+            columns.append(sfs.sum(axis=2))
+            columns.append(sfs.sum(axis=1))
+        if self.is_calculate_joint_population_sfs:
+            columns.append(sfs.transpose(0, 2, 1).reshape(len(field_name_prefixes), -1))
+        values = coalescent.numpy.concatenate(columns, axis=1).tolist()
+        for field_name_prefix, results_d, replicate_values in zip(field_name_prefixes, results_ds, values):
+            results_d.update(zip(self._get_site_frequency_spectrum_keys(field_name_prefix, n0, n1), replicate_values))
+        self.phase_durations["tabulate"] += time.time() - start_time
+        return results_ds
+
+SIMULATOR_BACKENDS = ("fsc2", "native")
+
+class ResultsSchema(object):
+    """
+    The fields of the results produced by a worker, sent once to the parent
+    process, so that the results of (batches of) replicates can then be sent
+    as just their values: those of the fields with floating-point values
+    (i.e., the summary statistics and most of the parameters) packed into an
+    ``array('d')``, and those of the rest (labels, counts, etc.) as tuples.
+    """
+
+    @classmethod
+    def from_results(cls, worker_name, results_d):
+        float_fieldnames = []
+        object_fieldnames = []
+        for key, value in results_d.items():
+            if isinstance(value, float):
+                float_fieldnames.append(key)
+            else:
+                object_fieldnames.append(key)
+        return cls(
+                worker_name=worker_name,
+                fieldnames=list(results_d.keys()),
+                object_fieldnames=object_fieldnames,
+                float_fieldnames=float_fieldnames)
+
+    def __init__(self, worker_name, fieldnames, object_fieldnames, float_fieldnames):
+        self.worker_name = worker_name
+        self.fieldnames = fieldnames
+        self.object_fieldnames = object_fieldnames
+        self.float_fieldnames = float_fieldnames
+        self._output_value_getter = None
+
+    def pack(self, results_ds):
+        """
+        Returns the values of the results of a batch of replicates as a
+        single message, stamped with the time it was packed (to measure the
+        time it spends in the queue).
+        """
+        object_values = []
+        float_values = array.array("d")
+        for results_d in results_ds:
+            if len(results_d) != len(self.fieldnames):
+                raise ValueError("Expecting {} fields in results but found {}".format(len(self.fieldnames), len(results_d)))
+            object_values.append(tuple([results_d[key] for key in self.object_fieldnames]))
+            float_values.extend([results_d[key] for key in self.float_fieldnames])
+        return (self.worker_name, time.time(), object_values, float_values)
+
+    def set_output_fieldnames(self, output_fieldnames):
+        """
+        Sets the order of the values returned by ``unpack_values`` (e.g., that
+        of the columns of the output, which may differ from the order of the
+        fields in the results of this worker).
+        """
+        if set(output_fieldnames) != set(self.fieldnames):
+            raise ValueError("Results of worker '{}' have different fields from the output".format(self.worker_name))
+        packed_positions = {}
+        for idx, key in enumerate(self.object_fieldnames + self.float_fieldnames):
+            packed_positions[key] = idx
+        positions = [packed_positions[key] for key in output_fieldnames]
+        if len(positions) == 1:
+            self._output_value_getter = lambda values: [values[positions[0]]]
+        else:
+            self._output_value_getter = operator.itemgetter(*positions)
+
+    def unpack(self, packed):
+        """
+        Iterates over the values of the results of each replicate packed by
+        ``pack``, in the order set by ``set_output_fieldnames``.
+        """
+        object_values, float_values = packed[2], packed[3]
+        num_float_fields = len(self.float_fieldnames)
+        float_values = float_values.tolist()
+        for row_idx, row_object_values in enumerate(object_values):
+            start = row_idx * num_float_fields
+            yield self._output_value_getter(row_object_values + tuple(float_values[start:start + num_float_fields]))
+
+class ReplicateDispenser(object):
+    """
+    Hands out the replicates to simulate to the worker processes on demand,
+    as ranges of consecutive replicates (of up to ``num_replicates_per_task``
+    each), claimed from a counter shared between the processes. This takes
+    the place of a queue of tasks (with the same ``get_nowait`` method), but
+    takes the same (constant) time and memory to set up whatever the number
+    of replicates.
+    """
+
+    def __init__(self, num_replicates, num_replicates_per_task=1):
+        self.num_replicates_per_task = num_replicates_per_task
+        self._next_replicate_idx = multiprocessing.Value("q", 0)
+        self._num_replicates = multiprocessing.Value("q", num_replicates, lock=False)
+
+    def reset(self, num_replicates):
+        """
+        Starts handing out ``num_replicates`` replicates (again), e.g., for
+        another call to ``GerenukSimulator.execute`` with the same worker
+        processes, which must not be claiming replicates at the time.
+        """
+        with self._next_replicate_idx.get_lock():
+            self._num_replicates.value = num_replicates
+            self._next_replicate_idx.value = 0
+
+    def get_nowait(self):
+        """
+        Returns the index of the first replicate of the next task and the
+        number of replicates in it, or raises ``queue.Empty`` if all the
+        replicates have been handed out.
+        """
+        with self._next_replicate_idx.get_lock():
+            rep_idx = self._next_replicate_idx.value
+            total_num_replicates = self._num_replicates.value
+            if rep_idx >= total_num_replicates:
+                raise queue.Empty()
+            num_replicates = min(self.num_replicates_per_task, total_num_replicates - rep_idx)
+            self._next_replicate_idx.value = rep_idx + num_replicates
+        return rep_idx, num_replicates
+
+class ResultsShardUpdate(object):
+    """
+    Sent to the parent process by a worker writing its results to its own file
+    instead of sending them: the number of (further) replicates written, with
+    the fields of the results given in the first update.
+    """
+
+    def __init__(self, worker_name, filepath, num_results, fieldnames=None):
+        self.worker_name = worker_name
+        self.filepath = filepath
+        self.num_results = num_results
+        self.fieldnames = fieldnames
+        self.packed_time = time.time()
+
+class WorkerJobCompletion(object):
+    """
+    Sent to the parent process by a worker of a pool (see
+    ``GerenukSimulator.start_workers``) when it has finished its part of a
+    call to ``GerenukSimulator.execute``: i.e., it has sent or written all
+    its results, and is waiting for the next call.
+    """
+
+    def __init__(self, worker_name):
+        self.worker_name = worker_name
 
 class SimulationWorker(multiprocessing.Process):
 
@@ -679,17 +1739,42 @@ class SimulationWorker(multiprocessing.Process):
             is_include_model_id_field,
             supplemental_labels,
             debug_mode,
+            is_batch_loci=False,
+            num_replicates_per_draw=1,
+            simulator_backend="fsc2",
+            results_batch_size=1,
+            output_filepath=None,
+            field_delimiter="\t",
+            is_write_header=True,
+            job_queue=None,
+            rng_state=None,
+            is_send_rng_state=False,
             ):
         multiprocessing.Process.__init__(self, name=name)
-        self.fsc2_handler = Fsc2Handler(
-                name=name,
-                fsc2_path=fsc2_path,
-                working_directory=working_directory,
-                is_calculate_single_population_sfs=is_calculate_single_population_sfs,
-                is_calculate_joint_population_sfs=is_calculate_joint_population_sfs,
-                is_unfolded_site_frequency_spectrum=is_unfolded_site_frequency_spectrum)
+        if simulator_backend == "native":
+            self.simulation_handler = NativeSimulationHandler(
+                    name=name,
+                    is_calculate_single_population_sfs=is_calculate_single_population_sfs,
+                    is_calculate_joint_population_sfs=is_calculate_joint_population_sfs,
+                    is_unfolded_site_frequency_spectrum=is_unfolded_site_frequency_spectrum)
+        elif simulator_backend == "fsc2":
+            self.simulation_handler = Fsc2Handler(
+                    name=name,
+                    fsc2_path=fsc2_path,
+                    working_directory=working_directory,
+                    is_calculate_single_population_sfs=is_calculate_single_population_sfs,
+                    is_calculate_joint_population_sfs=is_calculate_joint_population_sfs,
+                    is_unfolded_site_frequency_spectrum=is_unfolded_site_frequency_spectrum)
+        else:
+            raise ValueError("Unrecognized simulator backend: '{}'".format(simulator_backend))
         self.model = model
+        self.random_seed = random_seed
         self.rng = random.Random(random_seed)
+        if rng_state is not None:
+            self.rng.setstate(rng_state)
+        # if True, the state of the random number generator after each batch
+        # of results is sent with them (for checkpoints)
+        self.is_send_rng_state = is_send_rng_state
         self.work_queue = work_queue
         self.results_queue = results_queue
         self.run_logger = run_logger
@@ -700,7 +1785,22 @@ class SimulationWorker(multiprocessing.Process):
         self.is_include_model_id_field = is_include_model_id_field
         self.supplemental_labels = supplemental_labels
         self.is_debug_mode = debug_mode
+        self.is_batch_loci = is_batch_loci
+        self.num_replicates_per_draw = num_replicates_per_draw
         self.kill_received = False
+        self.results_schema = None
+        self.results_batch_size = results_batch_size
+        self._results_batch = []
+        # if given, results are written to this file rather than sent to the
+        # parent process
+        self.output_filepath = output_filepath
+        self.field_delimiter = field_delimiter
+        self.is_write_header = is_write_header
+        self._output_dest = None
+        self._output_writer = None
+        # if given, the worker runs until told to stop, taking the output
+        # options of each call to 'GerenukSimulator.execute' from this queue
+        self.job_queue = job_queue
         self.num_tasks_received = 0
         self.num_tasks_completed = 0
 
@@ -732,10 +1832,30 @@ class SimulationWorker(multiprocessing.Process):
         self.send_worker_message(msg, utility.RunLogger.ERROR_MESSAGING_LEVEL)
 
     def run(self):
-        result = None
+        if self.job_queue is None:
+            self.run_tasks()
+        else:
+            while not self.kill_received:
+                job = self.job_queue.get()
+                if job is None:
+                    break
+                self.output_filepath = job["output_filepath"]
+                self.field_delimiter = job["field_delimiter"]
+                self.is_write_header = job["is_write_header"]
+                self.results_schema = None
+                self.run_tasks()
+                self.results_queue.put(WorkerJobCompletion(self.name))
+        self.send_worker_info(self.simulation_handler.describe_phase_durations())
+
+    def run_tasks(self):
+        """
+        Simulates the replicates of tasks from the work queue until there
+        are no more, sending (or writing) the results.
+        """
+        num_replicates_completed = 0
         while not self.kill_received:
             try:
-                rep_idx = self.work_queue.get_nowait()
+                rep_idx, num_replicates = self.work_queue.get_nowait()
             except queue.Empty:
                 break
             self.num_tasks_received += 1
@@ -744,7 +1864,10 @@ class SimulationWorker(multiprocessing.Process):
             #     task_name=rep_idx))
             # rng = random.Random(random_seed)
             try:
-                result = self.simulate()
+                if num_replicates == 1:
+                    results = [self.simulate()]
+                else:
+                    results = self.simulate_replicates(num_replicates)
             except (KeyboardInterrupt, Exception) as e:
                 # traceback.print_exc()
                 e.worker_name = self.name
@@ -753,39 +1876,118 @@ class SimulationWorker(multiprocessing.Process):
                 break
             if self.kill_received:
                 break
-            self.results_queue.put(result)
+            if self.results_schema is None and self.output_filepath is None:
+                self.results_schema = ResultsSchema.from_results(self.name, results[0])
+                self.results_queue.put(self.results_schema)
+            self._results_batch.extend(results)
+            if len(self._results_batch) >= self.results_batch_size:
+                self.flush_results()
             self.num_tasks_completed += 1
             # self.send_info("Completed task {task_count}: '{task_name}'".format(
-            if rep_idx and self.logging_frequency and rep_idx % self.logging_frequency == 0:
-                self.run_logger.info("Completed replicate {task_name}".format(
-                    task_count=self.num_tasks_received,
-                    task_name=rep_idx))
+            # tasks may complete several replicates at once, so log whenever
+            # the count crosses a multiple of the logging frequency
+            previous_num_replicates_completed = num_replicates_completed
+            num_replicates_completed += len(results)
+            if (self.logging_frequency
+                    and num_replicates_completed // self.logging_frequency > previous_num_replicates_completed // self.logging_frequency):
+                self.run_logger.info("Completed {num_replicates} replicates".format(
+                    num_replicates=num_replicates_completed))
         if self.kill_received:
             self.send_worker_warning("Terminating in response to kill request")
+        else:
+            self.flush_results()
+        if self._output_dest is not None:
+            self._output_dest.close()
+            self._output_dest = None
+            self._output_writer = None
+
+    def flush_results(self):
+        if not self._results_batch:
+            return
+        if self.output_filepath is None:
+            packed = self.results_schema.pack(self._results_batch)
+            if self.is_send_rng_state:
+                packed += (self.rng.getstate(),)
+            self.results_queue.put(packed)
+        else:
+            self.results_queue.put(self._write_results(self._results_batch))
+        self._results_batch = []
+
+    def _write_results(self, results_ds):
+        fieldnames = None
+        if self._output_writer is None:
+            fieldnames = list(results_ds[0].keys())
+            self._output_dest = utility.open_destput_file_for_csv_writer(filepath=self.output_filepath)
+            self._output_writer = utility.get_csv_writer(
+                    dest=self._output_dest,
+                    fieldnames=fieldnames,
+                    delimiter=self.field_delimiter)
+            if self.is_write_header:
+                self._output_writer.writeheader()
+        for results_d in results_ds:
+            self._output_writer.writerow(results_d)
+        # written before the parent process is told of them
+        self._output_dest.flush()
+        return ResultsShardUpdate(
+                worker_name=self.name,
+                filepath=self.output_filepath,
+                num_results=len(results_ds),
+                fieldnames=fieldnames)
 
     def simulate(self):
-        results_d = collections.OrderedDict()
-        if self.is_include_model_id_field:
-            results_d["model.id"] = None
-        if self.supplemental_labels:
-            for key in self.supplemental_labels:
-                results_d[key] = self.supplemental_labels[key]
+        return self.simulate_replicates(1)[0]
+
+    def simulate_replicates(self, num_replicates):
+        """
+        Simulates ``num_replicates`` replicates under a single draw of
+        parameter values from the prior, with each locus (or, if
+        ``is_batch_loci``, each batch of loci with identical configurations)
+        simulated for all the replicates in a single FastSimCoal2 run.
+        Returns a list of the results of each replicate.
+        """
         params, fsc2_run_configurations = self.model.sample_parameter_values_from_prior(rng=self.rng)
-        results_d.update(params)
-        for lineage_pair_idx, lineage_pair in enumerate(self.model.lineage_pairs):
-            for locus_definition in lineage_pair.locus_definitions:
-                self.fsc2_handler.run(
-                        field_name_prefix="{}.{}.{}".format(
-                                self.stat_label_prefix,
-                                lineage_pair.taxon_label,
-                                locus_definition.locus_label),
-                        fsc2_config_d=fsc2_run_configurations[locus_definition],
-                        random_seed=self.rng.randint(1, 1E6),
-                        results_d=results_d,
-                        )
-        if self.is_include_model_id_field:
-            results_d["model.id"] = results_d["param.divTimeModel"]
-        return results_d
+        loci = []
+        field_name_prefixes = self.model.get_locus_field_name_prefixes(self.stat_label_prefix)
+        for field_name_prefix, (lineage_pair, locus_definition) in zip(field_name_prefixes, self.model.loci):
+            loci.append((field_name_prefix, fsc2_run_configurations[locus_definition]))
+        if self.is_batch_loci:
+            # Loci with identical configurations (e.g., the same sample sizes
+            # and number of sites in the same lineage pair) are independent
+            # simulations under the same model, so are run together.
+            batches = collections.OrderedDict()
+            for locus_idx, (field_name_prefix, fsc2_config_d) in enumerate(loci):
+                batches.setdefault(tuple(sorted(fsc2_config_d.items())), []).append(locus_idx)
+            batches = list(batches.values())
+        else:
+            batches = [[locus_idx] for locus_idx in range(len(loci))]
+        locus_results = [[None for locus in loci] for rep_idx in range(num_replicates)]
+        for batch in batches:
+            field_name_prefixes = []
+            for rep_idx in range(num_replicates):
+                field_name_prefixes.extend(loci[locus_idx][0] for locus_idx in batch)
+            results_ds = self.simulation_handler.run_batch(
+                    field_name_prefixes=field_name_prefixes,
+                    fsc2_config_d=loci[batch[0]][1],
+                    random_seed=self.rng.randint(1, 1E6))
+            results_ds = iter(results_ds)
+            for rep_idx in range(num_replicates):
+                for locus_idx in batch:
+                    locus_results[rep_idx][locus_idx] = next(results_ds)
+        replicates = []
+        for rep_idx in range(num_replicates):
+            results_d = collections.OrderedDict()
+            if self.is_include_model_id_field:
+                results_d["model.id"] = None
+            if self.supplemental_labels:
+                for key in self.supplemental_labels:
+                    results_d[key] = self.supplemental_labels[key]
+            results_d.update(params)
+            for locus_results_d in locus_results[rep_idx]:
+                results_d.update(locus_results_d)
+            if self.is_include_model_id_field:
+                results_d["model.id"] = results_d["param.divTimeModel"]
+            replicates.append(results_d)
+        return replicates
 
 class GerenukSimulator(object):
 
@@ -821,6 +2023,20 @@ class GerenukSimulator(object):
                         ", ".join("{}/{}".format(locus.num_genes_deme0, locus.num_genes_deme1) for locus in lineage_pair.locus_definitions),
                         ))
         self.worker_class = SimulationWorker
+        # worker processes kept running between calls to 'execute': see
+        # 'start_workers'
+        self._workers = None
+        self._job_queues = None
+        self._work_queue = None
+        self._results_queue = None
+
+    def __enter__(self):
+        self.start_workers()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_workers()
+        return False
 
     def configure_simulator(self, config_d, verbose=True):
         self.title = config_d.pop("title", "gerenuk-{}-{}".format(time.strftime("%Y%m%d%H%M%S"), id(self)))
@@ -840,9 +2056,15 @@ class GerenukSimulator(object):
         self.logging_frequency = config_d.pop("logging_frequency", 1000)
         if self.is_verbose_setup:
             self.run_logger.info("Configuring simulation '{}'".format(self.title))
+        self.simulator_backend = config_d.pop("simulator_backend", "fsc2")
+        if self.simulator_backend not in SIMULATOR_BACKENDS:
+            raise ValueError("Unrecognized simulator backend: '{}'".format(self.simulator_backend))
         self.fsc2_path = config_d.pop("fsc2_path", "fsc25")
         if self.is_verbose_setup:
-            self.run_logger.info("FastSimCoal2 path: '{}'".format(self.fsc2_path))
+            if self.simulator_backend == "fsc2":
+                self.run_logger.info("FastSimCoal2 path: '{}'".format(self.fsc2_path))
+            else:
+                self.run_logger.info("Simulating with the native backend instead of FastSimCoal2")
         self.rng = config_d.pop("rng", None)
         if self.rng is None:
             self.random_seed = config_d.pop("random_seed", None)
@@ -870,13 +2092,33 @@ class GerenukSimulator(object):
         self.stat_label_prefix = config_d.pop("stat_label_prefix", "stat")
         self.supplemental_labels = config_d.pop("supplemental_labels", None)
         self.is_include_model_id_field = config_d.pop("is_include_model_id_field", False)
+        self.is_batch_loci = config_d.pop("is_batch_loci", False)
+        self.results_batch_size = config_d.pop("results_batch_size", 1)
+        if self.results_batch_size < 1:
+            raise ValueError("Results batch size must be at least 1")
+        if self.is_verbose_setup and self.results_batch_size > 1:
+            self.run_logger.info("Worker processes will send results in batches of {} replicates".format(self.results_batch_size))
+        self.num_replicates_per_draw = config_d.pop("num_replicates_per_draw", 1)
+        if self.num_replicates_per_draw < 1:
+            raise ValueError("Number of replicates per draw of parameter values must be at least 1")
+        if self.is_verbose_setup and self.num_replicates_per_draw > 1:
+            self.run_logger.info("Simulating {} replicates per draw of parameter values".format(self.num_replicates_per_draw))
+        if self.is_verbose_setup and self.is_batch_loci:
+            self.run_logger.info("Loci with identical configurations will be simulated in a single FastSimCoal2 run")
         if "params" not in config_d:
             raise ValueError("Missing 'params' entry in configuration")
         params_d = config_d.pop("params")
         if "locus_info" not in config_d:
             raise ValueError("Missing 'locus_info' entry in configuration")
         locus_info = config_d.pop("locus_info")
-        self.model = GerenukSimulationModel(params_d=params_d, locus_info=locus_info,)
+        is_precompute_partition_prior = config_d.pop("is_precompute_partition_prior", False)
+        self.model = GerenukSimulationModel(
+                params_d=params_d,
+                locus_info=locus_info,
+                is_precompute_partition_prior=is_precompute_partition_prior)
+        if self.is_verbose_setup and is_precompute_partition_prior:
+            self.run_logger.info("Divergence time models drawn from the exact prior probabilities of the {} partitions of {} lineage pairs by group sizes".format(
+                len(self.model.partition_prior.integer_partitions), self.model.num_lineage_pairs))
         if config_d:
             raise Exception("Unrecognized configuration entries: {}".format(config_d))
 
@@ -885,47 +2127,102 @@ class GerenukSimulator(object):
             results_csv_writer=None,
             results_store=None,
             is_write_header=True,
+            shard_output_prefix=None,
+            field_delimiter="\t",
+            checkpointer=None,
             ):
-        # load up queue
-        self.run_logger.info("Creating work queue")
-        work_queue = multiprocessing.Queue()
-        for rep_idx in range(nreps):
-            work_queue.put( rep_idx )
-        time.sleep(0.1) # to avoid: 'IOError: [Errno 32] Broken pipe'; https://stackoverflow.com/questions/36359528/broken-pipe-error-with-multiprocessing-queue
-        self.run_logger.info("Launching {} worker processes".format(self.num_processes))
-        results_queue = multiprocessing.Queue()
-        messenger_lock = multiprocessing.Lock()
-        workers = []
-        for pidx in range(self.num_processes):
-            worker = self.worker_class(
-                    # name=str(pidx+1),
-                    name="{}-{}".format(self.title, pidx+1),
-                    model=self.model,
-                    work_queue=work_queue,
-                    results_queue=results_queue,
-                    fsc2_path=self.fsc2_path,
-                    working_directory=self.working_directory,
-                    run_logger=self.run_logger,
-                    logging_frequency=self.logging_frequency,
-                    messenger_lock=messenger_lock,
-                    random_seed=self.rng.randint(1, sys.maxint),
-                    is_calculate_single_population_sfs=self.is_calculate_single_population_sfs,
-                    is_calculate_joint_population_sfs=self.is_calculate_joint_population_sfs,
-                    is_unfolded_site_frequency_spectrum=self.is_unfolded_site_frequency_spectrum,
-                    stat_label_prefix=self.stat_label_prefix,
-                    is_include_model_id_field=self.is_include_model_id_field,
-                    supplemental_labels=self.supplemental_labels,
-                    debug_mode=self.is_debug_mode,
-                    )
-            worker.start()
-            workers.append(worker)
+        """
+        Simulates ``nreps`` replicates, with the results written to
+        ``results_csv_writer`` and/or added to ``results_store``. If
+        ``shard_output_prefix`` is given, each worker process instead writes
+        its results to its own file (see ``get_shard_filepath``), and the
+        files are described by a manifest, the path of which is returned.
+        Uses the worker processes launched by ``start_workers`` if they are
+        running, or otherwise launches new ones for this call only.
+        If ``checkpointer`` (a ``SimulationCheckpointer``) is given, progress
+        writing to ``results_csv_writer`` is periodically recorded by it, or
+        resumed from the checkpoint it was given.
+        """
+        if checkpointer is not None:
+            if shard_output_prefix is not None:
+                raise ValueError("Checkpoints are not supported with sharded output")
+            if self._workers is not None:
+                raise ValueError("Checkpoints are not supported with worker processes kept running between calls")
+            if checkpointer.checkpoint is not None and len(checkpointer.checkpoint["workers"]) != self.num_processes:
+                raise ValueError("Checkpoint records {} worker processes, but resuming with {}".format(
+                    len(checkpointer.checkpoint["workers"]), self.num_processes))
+        if self._workers is not None:
+            # reuse the running worker processes
+            workers = self._workers
+            work_queue = self._work_queue
+            results_queue = self._results_queue
+            work_queue.reset(nreps)
+            for pidx, job_queue in enumerate(self._job_queues):
+                job_queue.put({
+                    "output_filepath": get_shard_filepath(shard_output_prefix, pidx) if shard_output_prefix is not None else None,
+                    "field_delimiter": field_delimiter,
+                    "is_write_header": is_write_header,
+                    })
+            num_workers_running = len(workers)
+        else:
+            # each task is a single draw of parameter values
+            work_queue = ReplicateDispenser(
+                    num_replicates=nreps,
+                    num_replicates_per_task=self.num_replicates_per_draw)
+            self.run_logger.info("Launching {} worker processes".format(self.num_processes))
+            results_queue = multiprocessing.Queue()
+            messenger_lock = multiprocessing.Lock()
+            workers = []
+            for pidx in range(self.num_processes):
+                if checkpointer is not None:
+                    random_seed, rng_state = checkpointer.get_worker_state(pidx)
+                else:
+                    random_seed, rng_state = None, None
+                worker = self._create_worker(
+                        pidx=pidx,
+                        work_queue=work_queue,
+                        results_queue=results_queue,
+                        messenger_lock=messenger_lock,
+                        random_seed=random_seed,
+                        output_filepath=get_shard_filepath(shard_output_prefix, pidx) if shard_output_prefix is not None else None,
+                        field_delimiter=field_delimiter,
+                        is_write_header=is_write_header,
+                        rng_state=rng_state,
+                        is_send_rng_state=checkpointer is not None,
+                        )
+                worker.start()
+                workers.append(worker)
+            num_workers_running = 0
 
-        # collate results
+        # collate results: each worker sends the schema of its results
+        # before the values of the results themselves
         result_count = 0
+        results_schemas = {}
+        fieldnames = None
+        shards = collections.OrderedDict()
+        num_batches = 0
+        total_queue_latency = 0.0
+        max_queue_latency = 0.0
+        worker_indexes = dict((worker.name, pidx) for pidx, worker in enumerate(workers))
+        worker_result_counts = [0 for worker in workers]
+        worker_rng_states = [None for worker in workers]
+        checkpoint_result_count = 0
+        if checkpointer is not None and checkpointer.fieldnames is not None:
+            # resuming: carry on with the same columns
+            fieldnames = checkpointer.fieldnames
+            if results_csv_writer is not None:
+                results_csv_writer.fieldnames = fieldnames
+        collation_start_time = time.time()
+        collation_start_cpu_time = _process_time()
         try:
-            while result_count < nreps:
+            # workers of a pool must also all report that they are done, so
+            # that nothing from this call is left in the queue for the next
+            while result_count < nreps or num_workers_running:
                 result = results_queue.get()
-                if isinstance(result, KeyboardInterrupt):
+                if isinstance(result, WorkerJobCompletion):
+                    num_workers_running -= 1
+                    continue
+                elif isinstance(result, KeyboardInterrupt):
                     raise result
                 elif isinstance(result, Exception):
                     self.run_logger.error("Exception raised in worker process '{}'"
@@ -933,20 +2230,262 @@ class GerenukSimulator(object):
                                               result.worker_name,
                                               result.traceback_exc))
                     raise result
-                if results_store is not None:
-                    results_store.append(result)
-                if results_csv_writer is not None:
-                    if result_count == 0 and is_write_header:
-                        results_csv_writer.fieldnames = result.keys()
-                        results_csv_writer.writeheader()
-                    results_csv_writer.writerow(result)
+                elif isinstance(result, ResultsSchema):
+                    if fieldnames is None:
+                        fieldnames = result.fieldnames
+                        if results_csv_writer is not None:
+                            results_csv_writer.fieldnames = fieldnames
+                            if is_write_header:
+                                results_csv_writer.writeheader()
+                    result.set_output_fieldnames(fieldnames)
+                    results_schemas[result.worker_name] = result
+                    continue
+                batch_start_cpu_time = _process_time()
+                if isinstance(result, ResultsShardUpdate):
+                    # results already written by the worker
+                    worker_name = result.worker_name
+                    queue_latency = time.time() - result.packed_time
+                    if result.fieldnames is not None:
+                        if fieldnames is None:
+                            fieldnames = result.fieldnames
+                        elif result.fieldnames != fieldnames:
+                            raise ValueError("Worker process '{}' wrote different fields from the others".format(worker_name))
+                    if result.filepath not in shards:
+                        shards[result.filepath] = 0
+                    shards[result.filepath] += result.num_results
+                    batch_result_count = result.num_results
+                else:
+                    worker_name = result[0]
+                    queue_latency = time.time() - result[1]
+                    batch_result_count = 0
+                    for values in results_schemas[worker_name].unpack(result):
+                        if results_store is not None:
+                            results_store.append(collections.OrderedDict(zip(fieldnames, values)))
+                        if results_csv_writer is not None:
+                            # values are already in the order of the columns
+                            results_csv_writer.writer.writerow(values)
+                        batch_result_count += 1
+                    if len(result) > 4:
+                        worker_rng_states[worker_indexes[worker_name]] = result[4]
+                worker_result_counts[worker_indexes[worker_name]] += batch_result_count
                 # self.run_logger.info("Recovered results from worker process '{}'".format(result.worker_name))
-                result_count += 1
+                result_count += batch_result_count
+                num_batches += 1
+                total_queue_latency += queue_latency
+                max_queue_latency = max(max_queue_latency, queue_latency)
+                self.run_logger.debug("Received {} replicates from worker process '{}': {:.4f}s in queue, {:.4f}s CPU time to process".format(
+                    batch_result_count,
+                    worker_name,
+                    queue_latency,
+                    _process_time() - batch_start_cpu_time))
+                if checkpointer is not None and result_count - checkpoint_result_count >= checkpointer.frequency:
+                    self._write_checkpoint(checkpointer, nreps, result_count, fieldnames, workers, worker_result_counts, worker_rng_states)
+                    checkpoint_result_count = result_count
                 # self.info_message("Recovered results from {} of {} worker processes".format(result_count, self.num_processes))
         except (Exception, KeyboardInterrupt) as e:
             for worker in workers:
                 worker.terminate()
+            if self._workers is not None:
+                self._workers = None
+                self._job_queues = None
+                self._work_queue = None
+                self._results_queue = None
             raise
-        self.run_logger.info("All {} worker processes terminated".format(self.num_processes))
+        if num_batches:
+            self.run_logger.info("Received {} replicates in {} batches: {:.4f}s mean ({:.4f}s maximum) time in queue; parent process CPU time {:.3f}s over {:.3f}s".format(
+                result_count,
+                num_batches,
+                total_queue_latency / num_batches,
+                max_queue_latency,
+                _process_time() - collation_start_cpu_time,
+                time.time() - collation_start_time))
+        if checkpointer is not None:
+            self._write_checkpoint(checkpointer, nreps, result_count, fieldnames, workers, worker_result_counts, worker_rng_states)
+        if shard_output_prefix is not None:
+            if self._workers is None:
+                for worker in workers:
+                    worker.join()
+            # in the order of the workers, omitting any that did no work
+            shard_filepaths = [get_shard_filepath(shard_output_prefix, pidx) for pidx in range(self.num_processes)]
+            manifest_filepath = self._write_sharded_output_manifest(
+                    shard_output_prefix=shard_output_prefix,
+                    shards=[(filepath, shards[filepath]) for filepath in shard_filepaths if filepath in shards],
+                    fieldnames=fieldnames,
+                    field_delimiter=field_delimiter,
+                    is_write_header=is_write_header)
+            if self._workers is None:
+                self.run_logger.info("All {} worker processes terminated".format(self.num_processes))
+            return manifest_filepath
+        if self._workers is None:
+            self.run_logger.info("All {} worker processes terminated".format(self.num_processes))
         return results_store
 
+    def start_workers(self):
+        """
+        Launches worker processes that are then reused by every call to
+        ``execute`` until ``stop_workers`` is called, rather than launching
+        new ones for each call. Each keeps its working directory and its
+        random number generator from one call to the next.
+        Also done on entering a ``with`` block, e.g.::
+
+            with GerenukSimulator(config_d, num_processes=4) as gs:
+                for nreps in (100, 1000, 10000):
+                    gs.execute(nreps, results_store=results)
+
+        """
+        if self._workers is not None:
+            raise ValueError("Worker processes are already running")
+        self.run_logger.info("Launching {} worker processes".format(self.num_processes))
+        self._work_queue = ReplicateDispenser(
+                num_replicates=0,
+                num_replicates_per_task=self.num_replicates_per_draw)
+        self._results_queue = multiprocessing.Queue()
+        messenger_lock = multiprocessing.Lock()
+        self._workers = []
+        self._job_queues = []
+        for pidx in range(self.num_processes):
+            job_queue = multiprocessing.Queue()
+            worker = self._create_worker(
+                    pidx=pidx,
+                    work_queue=self._work_queue,
+                    results_queue=self._results_queue,
+                    messenger_lock=messenger_lock,
+                    job_queue=job_queue,
+                    )
+            worker.start()
+            self._workers.append(worker)
+            self._job_queues.append(job_queue)
+
+    def stop_workers(self):
+        """
+        Stops the worker processes launched by ``start_workers``, if they
+        are still running.
+        """
+        if self._workers is None:
+            return
+        for job_queue in self._job_queues:
+            job_queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = None
+        self._job_queues = None
+        self._work_queue = None
+        self._results_queue = None
+        self.run_logger.info("All {} worker processes terminated".format(self.num_processes))
+
+    def _create_worker(self, pidx, work_queue, results_queue, messenger_lock, random_seed=None, **kwargs):
+        if random_seed is None:
+            random_seed = self.rng.randint(1, sys.maxsize)
+        return self.worker_class(
+                # name=str(pidx+1),
+                name="{}-{}".format(self.title, pidx+1),
+                model=self.model,
+                work_queue=work_queue,
+                results_queue=results_queue,
+                fsc2_path=self.fsc2_path,
+                working_directory=os.path.join(self.working_directory, "worker{}".format(pidx+1)),
+                run_logger=self.run_logger,
+                logging_frequency=self.logging_frequency,
+                messenger_lock=messenger_lock,
+                random_seed=random_seed,
+                is_calculate_single_population_sfs=self.is_calculate_single_population_sfs,
+                is_calculate_joint_population_sfs=self.is_calculate_joint_population_sfs,
+                is_unfolded_site_frequency_spectrum=self.is_unfolded_site_frequency_spectrum,
+                stat_label_prefix=self.stat_label_prefix,
+                is_include_model_id_field=self.is_include_model_id_field,
+                supplemental_labels=self.supplemental_labels,
+                debug_mode=self.is_debug_mode,
+                is_batch_loci=self.is_batch_loci,
+                num_replicates_per_draw=self.num_replicates_per_draw,
+                simulator_backend=self.simulator_backend,
+                results_batch_size=self.results_batch_size,
+                **kwargs)
+
+    def write_prior_samples(self,
+            nreps,
+            results_csv_writer,
+            is_write_header=True,
+            batch_size=PRIOR_BATCH_SIZE):
+        """
+        Writes the parameter values of ``nreps`` replicates drawn from the
+        prior (with the same fields as the results of ``execute``, but
+        without the summary statistics) to ``results_csv_writer``, without
+        simulating anything, sampling them in batches in this process (see
+        ``GerenukSimulationModel.iter_prior_batches``). Returns the random
+        seed of the batches.
+        """
+        random_seed = self.rng.randint(1, sys.maxsize)
+        self.run_logger.info("Sampling parameter values of {} replicates from the prior, with random seed {} and batches of {}".format(
+            nreps, random_seed, batch_size))
+        fieldnames = []
+        if self.is_include_model_id_field:
+            fieldnames.append("model.id")
+        if self.supplemental_labels:
+            fieldnames.extend(self.supplemental_labels)
+        fieldnames.extend(self.model.param_fieldnames)
+        results_csv_writer.fieldnames = fieldnames
+        if is_write_header:
+            results_csv_writer.writeheader()
+        start_time = time.time()
+        for params, div_time_groups in self.model.iter_prior_batches(
+                num_replicates=nreps,
+                random_seed=random_seed,
+                batch_size=batch_size):
+            num_replicates = len(div_time_groups)
+            columns = []
+            if self.is_include_model_id_field:
+                columns.append(params["param.divTimeModel"].tolist())
+            if self.supplemental_labels:
+                for key in self.supplemental_labels:
+                    columns.append([self.supplemental_labels[key]] * num_replicates)
+            for values in params.values():
+                columns.append(values.tolist())
+            results_csv_writer.writer.writerows(zip(*columns))
+        self.run_logger.info("Parameter values of {} replicates written in {:.3f}s".format(nreps, time.time() - start_time))
+        return random_seed
+
+    def _write_checkpoint(self,
+            checkpointer,
+            nreps,
+            result_count,
+            fieldnames,
+            workers,
+            worker_result_counts,
+            worker_rng_states):
+        checkpoint = checkpointer.write(
+                num_replicates=nreps,
+                num_replicates_completed=result_count,
+                fieldnames=fieldnames,
+                workers=list(zip([worker.random_seed for worker in workers], worker_result_counts, worker_rng_states)))
+        self.run_logger.debug("Checkpoint: {} of {} replicates written".format(
+            checkpoint["num_replicates_completed"],
+            checkpoint["num_replicates"]))
+
+    def _write_sharded_output_manifest(self,
+            shard_output_prefix,
+            shards,
+            fieldnames,
+            field_delimiter,
+            is_write_header):
+        manifest = collections.OrderedDict()
+        manifest["format"] = SHARDED_OUTPUT_FORMAT
+        manifest["version"] = SHARDED_OUTPUT_FORMAT_VERSION
+        manifest["num_samples"] = sum(num_samples for filepath, num_samples in shards)
+        manifest["fieldnames"] = fieldnames
+        manifest["field_delimiter"] = field_delimiter
+        manifest["is_header_written"] = is_write_header
+        manifest["shards"] = []
+        for filepath, num_samples in shards:
+            shard = collections.OrderedDict()
+            shard["filename"] = os.path.basename(filepath)
+            shard["num_samples"] = num_samples
+            manifest["shards"].append(shard)
+        manifest_filepath = shard_output_prefix + SHARDED_OUTPUT_MANIFEST_SUFFIX
+        with open(manifest_filepath, "w") as dest:
+            json.dump(manifest, dest, indent=2)
+        self.run_logger.info("{} replicates written to {} files: '{}'".format(
+            manifest["num_samples"],
+            len(manifest["shards"]),
+            manifest_filepath))
+        return manifest_filepath
+
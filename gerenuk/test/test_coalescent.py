@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+
+import unittest
+from gerenuk import coalescent
+from gerenuk import simulate
+from gerenuk import utility
+from gerenuk.test.test_fsc2 import get_locus_info, get_params, FAKE_FSC2_PATH
+
+@unittest.skipIf(coalescent.numpy is None, "NumPy not available")
+class CoalescentTestCase(unittest.TestCase):
+
+    def test_isolated_demes_site_frequency_spectrum(self):
+        # With divergence far in the past, each deme is a standard
+        # coalescent, with expected number of sites with i derived genes of
+        # 2 * N * mu * L / i.
+        rng = coalescent.numpy.random.RandomState(1)
+        sfs = coalescent.simulate_joint_site_frequency_spectra(
+                num_replicates=20000,
+                sample_sizes=(6, 4),
+                population_sizes=(1000.0, 500.0),
+                div_time=1E9,
+                mutation_rate=1E-7,
+                num_sites=1E5,
+                is_unfolded_site_frequency_spectrum=True,
+                rng=rng)
+        mean_sfs = sfs.mean(axis=0)
+        for i in range(1, 6):
+            self.assertAlmostEqual(mean_sfs[i, 0] * i, 20.0, delta=0.6)
+        for j in range(1, 4):
+            self.assertAlmostEqual(mean_sfs[0, j] * j, 10.0, delta=0.3)
+        # no sites are shared before the divergence
+        self.assertEqual(sfs[:, 1:6, 1:4].sum(), 0)
+
+    def test_ancestral_total_branch_length(self):
+        # With no divergence, all the genes are sampled from the ancestral
+        # deme, twice the size of deme 1.
+        rng = coalescent.numpy.random.RandomState(1)
+        branch_lengths = coalescent.simulate_branch_lengths(
+                num_replicates=20000,
+                sample_sizes=(6, 4),
+                population_sizes=(1E6, 500.0),
+                div_time=0.0,
+                rng=rng)
+        expected = 2 * 1000.0 * sum(1.0/i for i in range(1, 10))
+        self.assertAlmostEqual(branch_lengths.sum(axis=(1, 2)).mean(), expected, delta=0.02 * expected)
+        self.assertEqual(branch_lengths[:, 0, 0].sum(), 0)
+        self.assertEqual(branch_lengths[:, 6, 4].sum(), 0)
+
+    def test_folding(self):
+        rng = coalescent.numpy.random.RandomState(1)
+        kwargs = {
+            "num_replicates": 50,
+            "sample_sizes": (3, 4),
+            "population_sizes": (1000.0, 1000.0),
+            "div_time": 500.0,
+            "mutation_rate": 1E-6,
+            "num_sites": 1000,
+            }
+        unfolded = coalescent.simulate_joint_site_frequency_spectra(
+                is_unfolded_site_frequency_spectrum=True,
+                rng=coalescent.numpy.random.RandomState(3),
+                **kwargs)
+        folded = coalescent.simulate_joint_site_frequency_spectra(
+                is_unfolded_site_frequency_spectrum=False,
+                rng=coalescent.numpy.random.RandomState(3),
+                **kwargs)
+        self.assertTrue((unfolded.sum(axis=(1, 2)) == 1000).all())
+        self.assertTrue((folded.sum(axis=(1, 2)) == 1000).all())
+        for i in range(4):
+            for j in range(5):
+                if 2 * (i + j) > 7:
+                    self.assertEqual(folded[:, i, j].sum(), 0)
+                    self.assertTrue((folded[:, 3-i, 4-j] >= unfolded[:, 3-i, 4-j]).all())
+
+@unittest.skipIf(coalescent.numpy is None, "NumPy not available")
+class NativeSimulationHandlerTestCase(unittest.TestCase):
+
+    def get_worker(self, model, simulator_backend, working_directory):
+        return simulate.SimulationWorker(
+                name="test",
+                model=model,
+                work_queue=None,
+                results_queue=None,
+                fsc2_path=FAKE_FSC2_PATH,
+                working_directory=working_directory,
+                run_logger=None,
+                logging_frequency=0,
+                messenger_lock=None,
+                random_seed=1,
+                is_calculate_single_population_sfs=True,
+                is_calculate_joint_population_sfs=True,
+                is_unfolded_site_frequency_spectrum=False,
+                stat_label_prefix="stat",
+                is_include_model_id_field=False,
+                supplemental_labels=None,
+                debug_mode=False,
+                simulator_backend=simulator_backend)
+
+    def test_same_fields_as_fsc2(self):
+        model = simulate.GerenukSimulationModel(params_d=get_params(), locus_info=get_locus_info([(4, 3), (5, 3)]))
+        results = {}
+        with utility.TemporaryDirectory(prefix="gerenuk-test-") as working_directory:
+            for simulator_backend in simulate.SIMULATOR_BACKENDS:
+                worker = self.get_worker(model, simulator_backend, working_directory)
+                results[simulator_backend] = worker.simulate()
+        self.assertEqual(list(results["native"].keys()), list(results["fsc2"].keys()))
+        self.assertEqual(
+                [v for key, v in results["native"].items() if key.startswith("param.")],
+                [v for key, v in results["fsc2"].items() if key.startswith("param.")])
+        for locus_label in ("Locus1", "Locus2"):
+            prefix = "stat.S1.{}.".format(locus_label)
+            for label in ("deme0", "deme1", "joint"):
+                self.assertEqual(sum(v for key, v in results["native"].items() if key.startswith(prefix + label)), 80)
+
+    def test_reproducible(self):
+        model = simulate.GerenukSimulationModel(params_d=get_params(), locus_info=get_locus_info([(4, 3), (4, 3)]))
+        worker1 = self.get_worker(model, "native", None)
+        worker2 = self.get_worker(model, "native", None)
+        self.assertEqual(worker1.simulate_replicates(3), worker2.simulate_replicates(3))
+
+if __name__ == "__main__":
+    unittest.main()
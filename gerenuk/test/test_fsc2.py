@@ -6,9 +6,47 @@ import unittest
 import time
 import collections
 from gerenuk import simulate
+from gerenuk import utility
 from gerenuk.utility import StringIO
 from gerenuk.test import TESTS_DATA_DIR
 FSC_DATA_DIR = os.path.join(TESTS_DATA_DIR, "fsc-results")
+FAKE_FSC2_PATH = os.path.join(TESTS_DATA_DIR, "fake-fsc25")
+
+def get_locus_info(num_genes):
+    locus_info = []
+    for locus_idx, (num_genes_deme0, num_genes_deme1) in enumerate(num_genes):
+        locus_info.append({
+            "taxon_label": "S1",
+            "locus_label": "Locus{}".format(locus_idx+1),
+            "ploidy_factor": 1,
+            "mutation_rate_factor": 1,
+            "num_genes_deme0": num_genes_deme0,
+            "num_genes_deme1": num_genes_deme1,
+            "ti_tv_rate_ratio": 3,
+            "num_sites": 80,
+            "freq_a": 0.25,
+            "freq_c": 0.25,
+            "freq_g": 0.25,
+            })
+    return locus_info
+
+def get_params():
+    return {
+        "concentrationShape": 10,
+        "concentrationScale": 0.3766,
+        "thetaShape": 1,
+        "thetaScale": 0.03,
+        "ancestralThetaShape": 0,
+        "ancestralThetaScale": 0,
+        "thetaParameters": "012",
+        "tauShape": 1.0,
+        "tauScale": 0.007,
+        "timeInSubsPerSite": 1,
+        "bottleProportionShared": 0,
+        "migrationShape": 0,
+        "migrationScale": 0,
+        "numTauClasses": 0,
+        }
 
 class Fsc2ConfigurationTestCase(unittest.TestCase):
 
@@ -176,6 +214,233 @@ class Fsc2DataExtractionTestCase(unittest.TestCase):
             for v1, v2 in zip(expected_values, data.values()):
                 self.assertEqual(v1, v2)
 
+class Fsc2SiteFrequencySpectrumParsingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fsc = simulate.Fsc2Handler(
+                name="test-one",
+                fsc2_path="fsc25",
+                working_directory=FSC_DATA_DIR,
+                is_calculate_single_population_sfs=True,
+                is_calculate_joint_population_sfs=True,
+                is_unfolded_site_frequency_spectrum=False)
+
+    def test_deme_layout_cached(self):
+        filepath = os.path.join(FSC_DATA_DIR, "test-one", "test-one_MAFpop1.obs")
+        results_ds = []
+        for rep_idx in range(2):
+            results_ds.append(self.fsc._parse_deme_derived_allele_frequencies(
+                    filepath=filepath,
+                    field_name_prefix="stat.test",
+                    results_d=collections.OrderedDict()))
+        self.assertEqual(list(results_ds[0].keys()), ["stat.test.d1_{}".format(i) for i in range(9)])
+        self.assertEqual(list(results_ds[0].values()), [39, 1100, 98, 40, 0, 101, 214, 2, 0])
+        self.assertEqual(results_ds[0], results_ds[1])
+        self.assertEqual(len(self.fsc._site_frequency_spectrum_keys), 1)
+        # a different layout with the same prefix is not mistaken for the first
+        data = self.fsc._parse_deme_derived_allele_frequencies(
+                filepath=os.path.join(FSC_DATA_DIR, "test-one", "test-one_MAFpop0.obs"),
+                field_name_prefix="stat.test",
+                results_d=collections.OrderedDict())
+        self.assertEqual(list(data.keys()), ["stat.test.d0_{}".format(i) for i in range(6)])
+        self.assertEqual(list(data.values()), [929, 110, 238, 101, 0, 216])
+        self.assertEqual(len(self.fsc._site_frequency_spectrum_keys), 2)
+
+    def test_joint_layout_cached(self):
+        filepath = os.path.join(FSC_DATA_DIR, "test-one", "test-one_jointMAFpop1_0.obs")
+        for rep_idx in range(2):
+            data = self.fsc._parse_joint_derived_allele_frequencies(
+                    filepath=filepath,
+                    field_name_prefix="stat.test",
+                    results_d=collections.OrderedDict())
+            self.assertEqual(len(data), 9 * 6)
+            self.assertEqual(list(data.keys())[:7], ["stat.test.d1_0.d0_{}".format(i) for i in range(6)] + ["stat.test.d1_1.d0_0"])
+            self.assertEqual(list(data.values())[:12], [0, 39, 0, 0, 0, 0, 918, 11, 171, 0, 0, 0])
+            self.assertEqual(data["stat.test.d1_7.d0_5"], 2)
+        self.assertEqual(len(self.fsc._site_frequency_spectrum_keys), 1)
+
+    def test_malformed(self):
+        with utility.TemporaryDirectory(prefix="gerenuk-test-") as tempdir:
+            filepath = os.path.join(tempdir, "test.obs")
+            with open(filepath, "w") as dest:
+                dest.write("1 observations (lhood = 0.0000000000)\n\td0_0\td0_1\nd1_0\t1\t2\nd1_1\t3\n")
+            self.assertRaises(simulate.Fsc2RuntimeError,
+                    self.fsc._parse_joint_derived_allele_frequencies,
+                    filepath=filepath,
+                    field_name_prefix="stat.test",
+                    results_d=collections.OrderedDict())
+
+class Fsc2BatchRunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = utility.TemporaryDirectory(prefix="gerenuk-test-")
+        self.working_directory = self.tempdir.__enter__()
+
+    def tearDown(self):
+        self.tempdir.__exit__()
+
+    def get_fsc_handler(self, name):
+        return simulate.Fsc2Handler(
+                name=name,
+                fsc2_path=FAKE_FSC2_PATH,
+                working_directory=self.working_directory,
+                is_calculate_single_population_sfs=True,
+                is_calculate_joint_population_sfs=True,
+                is_unfolded_site_frequency_spectrum=False)
+
+    def get_worker(self, model, **kwargs):
+        return simulate.SimulationWorker(
+                name="test",
+                model=model,
+                work_queue=None,
+                results_queue=None,
+                fsc2_path=FAKE_FSC2_PATH,
+                working_directory=self.working_directory,
+                run_logger=None,
+                logging_frequency=0,
+                messenger_lock=None,
+                random_seed=1,
+                is_calculate_single_population_sfs=False,
+                is_calculate_joint_population_sfs=True,
+                is_unfolded_site_frequency_spectrum=False,
+                stat_label_prefix="stat",
+                is_include_model_id_field=False,
+                supplemental_labels=None,
+                debug_mode=False,
+                **kwargs)
+
+    def test_batch_split(self):
+        model = simulate.GerenukSimulationModel(params_d=get_params(), locus_info=get_locus_info([(4, 3)]))
+        params, fsc2_run_configurations = model.sample_parameter_values_from_prior(rng=simulate.random.Random(1))
+        fsc2_config_d = list(fsc2_run_configurations.values())[0]
+        batch_results = self.get_fsc_handler("batch").run_batch(
+                field_name_prefixes=["stat.a", "stat.b", "stat.c"],
+                fsc2_config_d=fsc2_config_d,
+                random_seed=7)
+        single_results = self.get_fsc_handler("single").run(
+                field_name_prefix="stat.a",
+                fsc2_config_d=fsc2_config_d,
+                random_seed=7,
+                results_d=None)
+        self.assertEqual(len(batch_results), 3)
+        self.assertEqual(batch_results[0], single_results)
+        for prefix, results_d in zip(("stat.a", "stat.b", "stat.c"), batch_results):
+            # 5 + 4 marginal and 4 x 5 joint
+            self.assertEqual(len(results_d), 29)
+            self.assertTrue(all(key.startswith(prefix + ".") for key in results_d))
+            joint_total = sum(v for key, v in results_d.items() if ".joint." in key)
+            self.assertEqual(joint_total, 80)
+            for deme_idx in range(2):
+                self.assertEqual(sum(v for key, v in results_d.items() if ".deme{}.".format(deme_idx) in key), 80)
+        self.assertNotEqual(list(batch_results[0].values()), list(batch_results[1].values()))
+
+    def test_batched_loci_simulation(self):
+        model = simulate.GerenukSimulationModel(
+                params_d=get_params(),
+                locus_info=get_locus_info([(4, 3), (4, 3), (5, 3), (4, 3)]))
+        results = {}
+        for is_batch_loci in (False, True):
+            worker = self.get_worker(model, is_batch_loci=is_batch_loci)
+            results[is_batch_loci] = worker.simulate()
+            # 2 runs (one batch of 3 loci and one of 1) instead of 4
+            self.assertEqual(worker.simulation_handler._num_executions, 2 if is_batch_loci else 4)
+        self.assertEqual(list(results[True].keys()), list(results[False].keys()))
+        for locus_idx in range(4):
+            values = [v for key, v in results[True].items() if key.startswith("stat.S1.Locus{}.".format(locus_idx+1))]
+            self.assertEqual(sum(values), 80)
+
+    def test_replicates_per_draw(self):
+        model = simulate.GerenukSimulationModel(
+                params_d=get_params(),
+                locus_info=get_locus_info([(4, 3), (4, 3), (5, 3)]))
+        for is_batch_loci in (False, True):
+            worker = self.get_worker(model, is_batch_loci=is_batch_loci)
+            replicates = worker.simulate_replicates(5)
+            # one run per locus (or batch of loci) for all 5 replicates
+            self.assertEqual(worker.simulation_handler._num_executions, 2 if is_batch_loci else 3)
+            self.assertEqual(len(replicates), 5)
+            for results_d in replicates[1:]:
+                self.assertEqual(list(results_d.keys()), list(replicates[0].keys()))
+                for key in results_d:
+                    if key.startswith("param."):
+                        self.assertEqual(results_d[key], replicates[0][key])
+            for results_d in replicates:
+                for locus_idx in range(3):
+                    values = [v for key, v in results_d.items() if key.startswith("stat.S1.Locus{}.".format(locus_idx+1))]
+                    self.assertEqual(sum(values), 80)
+            stats = [tuple(v for key, v in results_d.items() if key.startswith("stat.")) for results_d in replicates]
+            self.assertEqual(len(set(stats)), 5)
+        # a single replicate per draw is the same as a plain simulation
+        worker1 = self.get_worker(model)
+        worker2 = self.get_worker(model)
+        self.assertEqual(worker1.simulate_replicates(1)[0], worker2.simulate())
+
+    def test_output_schema(self):
+        locus_info = get_locus_info([(4, 3), (5, 3)])
+        locus_info[1]["taxon_label"] = "S2"
+        model = simulate.GerenukSimulationModel(params_d=get_params(), locus_info=locus_info)
+        self.assertEqual(model.param_fieldnames, (
+            "param.divTimeModel",
+            "param.numDivTimes",
+            "param.divTime.S1",
+            "param.theta.S1.deme0",
+            "param.theta.S1.deme1",
+            "param.theta.S1.demeA",
+            "param.divTime.S2",
+            "param.theta.S2.deme0",
+            "param.theta.S2.deme1",
+            "param.theta.S2.demeA",
+            ))
+        self.assertEqual(model.get_locus_field_name_prefixes("stat"), ("stat.S1.Locus1", "stat.S2.Locus2"))
+        rng = simulate.random.Random(1)
+        for rep_idx in range(20):
+            params, fsc2_run_configurations = model.sample_parameter_values_from_prior(rng=rng)
+            self.assertEqual(tuple(params.keys()), model.param_fieldnames)
+            self.assertTrue(all(value is not None for value in params.values()))
+            self.assertEqual(params["param.numDivTimes"], len(set([params["param.divTime.S1"], params["param.divTime.S2"]])))
+        worker = self.get_worker(model)
+        results_d = worker.simulate()
+        self.assertEqual(tuple(results_d.keys())[:len(model.param_fieldnames)], model.param_fieldnames)
+        stat_prefixes = [key.split(".joint.")[0] for key in results_d if key.startswith("stat.")]
+        self.assertEqual(sorted(set(stat_prefixes), key=stat_prefixes.index), ["stat.S1.Locus1", "stat.S2.Locus2"])
+
+    def test_phase_durations(self):
+        model = simulate.GerenukSimulationModel(params_d=get_params(), locus_info=get_locus_info([(4, 3), (5, 3)]))
+        worker = self.get_worker(model)
+        worker.simulate()
+        self.assertEqual(list(worker.simulation_handler.phase_durations.keys()), ["write", "execute", "read"])
+        for duration in worker.simulation_handler.phase_durations.values():
+            self.assertGreater(duration, 0)
+        self.assertTrue(worker.simulation_handler.describe_phase_durations().startswith("2 FastSimCoal2 runs"))
+
+class WorkingDirectoryBackendTestCase(unittest.TestCase):
+
+    def test_memory_backend(self):
+        with utility.TemporaryDirectory(prefix="gerenuk-test-") as ram_dir:
+            missing_dir = os.path.join(ram_dir, "missing")
+            parent_dir, backend = utility.get_working_directory_parent(
+                    backend="memory",
+                    parent_dir="scratch",
+                    candidates=[missing_dir, ram_dir])
+            self.assertEqual(parent_dir, ram_dir)
+            self.assertEqual(backend, "memory")
+
+    def test_memory_backend_fallback(self):
+        with utility.TemporaryDirectory(prefix="gerenuk-test-") as ram_dir:
+            missing_dir = os.path.join(ram_dir, "missing")
+            parent_dir, backend = utility.get_working_directory_parent(
+                    backend="memory",
+                    parent_dir="scratch",
+                    candidates=[missing_dir])
+            self.assertEqual(parent_dir, "scratch")
+            self.assertEqual(backend, "disk")
+
+    def test_disk_backend(self):
+        parent_dir, backend = utility.get_working_directory_parent(backend="disk", parent_dir=None)
+        self.assertIs(parent_dir, None)
+        self.assertEqual(backend, "disk")
+        self.assertRaises(ValueError, utility.get_working_directory_parent, backend="nfs")
+
 if __name__ == "__main__":
     unittest.main()
 
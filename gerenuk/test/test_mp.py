@@ -1,8 +1,23 @@
 
+import os
 import unittest
 import time
+import multiprocessing
+import array
+import pickle
+import random
+import collections
+import json
+try:
+    # Python 3
+    import queue
+except ImportError:
+    # Python 2.7
+    import Queue as queue
 from collections import Counter
 from gerenuk import simulate
+from gerenuk import utility
+from gerenuk.test.test_fsc2 import get_params, get_locus_info
 
 class TestWorker(simulate.SimulationWorker):
 
@@ -14,6 +29,27 @@ class TestWorker(simulate.SimulationWorker):
                 "rand_int": self.rng.randint(1, 1E6),
                 }
 
+class ReplicatesTestWorker(simulate.SimulationWorker):
+
+    def simulate_replicates(self, num_replicates):
+        return [{"name": self.name, "task_count": self.num_tasks_received} for rep_idx in range(num_replicates)]
+
+class PidTestWorker(TestWorker):
+
+    def simulate(self):
+        results_d = TestWorker.simulate(self)
+        results_d["pid"] = os.getpid()
+        return results_d
+
+class RandomTestWorker(simulate.SimulationWorker):
+
+    def simulate(self):
+        results_d = collections.OrderedDict()
+        results_d["name"] = self.name
+        results_d["rand_int"] = self.rng.randint(1, 1E6)
+        results_d["rand_float"] = self.rng.random()
+        return results_d
+
 class MpArchitectureTests(unittest.TestCase):
 
     def test_workers_used(self):
@@ -88,5 +124,319 @@ class MpArchitectureTests(unittest.TestCase):
             counter[result["name"]] += 1
         self.assertEqual(len(counter), num_processes)
 
+def claim_replicates(dispenser, claims_queue):
+    claims = []
+    while True:
+        try:
+            claims.append(dispenser.get_nowait())
+        except queue.Empty:
+            break
+    claims_queue.put(claims)
+
+class ReplicateDispenserTests(unittest.TestCase):
+
+    def test_ranges(self):
+        dispenser = simulate.ReplicateDispenser(num_replicates=10, num_replicates_per_task=4)
+        self.assertEqual(dispenser.get_nowait(), (0, 4))
+        self.assertEqual(dispenser.get_nowait(), (4, 4))
+        self.assertEqual(dispenser.get_nowait(), (8, 2))
+        self.assertRaises(queue.Empty, dispenser.get_nowait)
+        self.assertRaises(queue.Empty, dispenser.get_nowait)
+        dispenser.reset(5)
+        self.assertEqual(dispenser.get_nowait(), (0, 4))
+        self.assertEqual(dispenser.get_nowait(), (4, 1))
+        self.assertRaises(queue.Empty, dispenser.get_nowait)
+
+    def test_shared_between_processes(self):
+        dispenser = simulate.ReplicateDispenser(num_replicates=2000, num_replicates_per_task=3)
+        claims_queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=claim_replicates, args=(dispenser, claims_queue)) for pidx in range(3)]
+        for process in processes:
+            process.start()
+        claims = []
+        for process in processes:
+            claims.extend(claims_queue.get())
+        for process in processes:
+            process.join()
+        rep_idxs = []
+        for rep_idx, num_replicates in claims:
+            rep_idxs.extend(range(rep_idx, rep_idx + num_replicates))
+        self.assertEqual(sorted(rep_idxs), list(range(2000)))
+
+    def test_execute(self):
+        config_d = {
+                "title": "test",
+                "standard_error_logging_level": "warning",
+                "log_to_file": False,
+                "params": get_params(),
+                "locus_info": get_locus_info([(4, 3)]),
+                }
+        gs = simulate.GerenukSimulator(config_d=config_d, num_processes=2, is_verbose_setup=False)
+        gs.worker_class = TestWorker
+        results = gs.execute(7, results_store=[])
+        self.assertEqual(len(results), 7)
+        self.assertEqual(sum(1 for result in results if result["task_count"] == 1), 2)
+
+class WorkerPoolTests(unittest.TestCase):
+
+    def get_simulator(self):
+        config_d = {
+                "title": "test",
+                "standard_error_logging_level": "warning",
+                "log_to_file": False,
+                "params": get_params(),
+                "locus_info": get_locus_info([(4, 3)]),
+                }
+        gs = simulate.GerenukSimulator(config_d=config_d, num_processes=2, is_verbose_setup=False)
+        gs.worker_class = PidTestWorker
+        return gs
+
+    def test_workers_reused(self):
+        with self.get_simulator() as gs:
+            pids = set(worker.pid for worker in gs._workers)
+            first_results = gs.execute(3, results_store=[])
+            second_results = gs.execute(4, results_store=[])
+            self.assertEqual(set(worker.pid for worker in gs._workers), pids)
+        self.assertIsNone(gs._workers)
+        self.assertEqual(len(first_results), 3)
+        self.assertEqual(len(second_results), 4)
+        self.assertTrue(set(result["pid"] for result in first_results + second_results) <= pids)
+        # each worker carries on counting tasks (and drawing random numbers)
+        # from where it left off
+        task_counts = collections.defaultdict(list)
+        for result in first_results + second_results:
+            task_counts[result["name"]].append(result["task_count"])
+        for name in task_counts:
+            self.assertEqual(task_counts[name], list(range(1, len(task_counts[name])+1)))
+        rand_ints = [result["rand_int"] for result in first_results + second_results]
+        self.assertEqual(len(set(rand_ints)), len(rand_ints))
+
+    def test_sharded_output(self):
+        with utility.TemporaryDirectory(prefix="gerenuk-test-") as tempdir:
+            with self.get_simulator() as gs:
+                for call_idx, nreps in enumerate((3, 2)):
+                    output_prefix = os.path.join(tempdir, "call{}".format(call_idx+1))
+                    manifest_filepath = gs.execute(nreps, shard_output_prefix=output_prefix)
+                    # shards are complete before the call returns
+                    merged_filepath = output_prefix + simulate.SUMSTATS_SUFFIX
+                    num_samples = simulate.merge_sharded_output(manifest_filepath, merged_filepath, is_remove_shards=True)
+                    self.assertEqual(num_samples, nreps)
+                    with open(merged_filepath) as src:
+                        rows = [line.rstrip("\n").split("\t") for line in src]
+                    self.assertEqual(rows[0], ["name", "task_count", "rand_int", "pid"])
+                    self.assertEqual(len(rows), nreps + 1)
+
+class CheckpointTests(unittest.TestCase):
+
+    def run_simulator(self, nreps, output_filepath, checkpoint_filepath, checkpoint=None):
+        config_d = {
+                "title": "test",
+                "standard_error_logging_level": "warning",
+                "log_to_file": False,
+                "random_seed": 1,
+                "results_batch_size": 2,
+                "params": get_params(),
+                "locus_info": get_locus_info([(4, 3)]),
+                }
+        gs = simulate.GerenukSimulator(config_d=config_d, num_processes=1, is_verbose_setup=False)
+        gs.worker_class = RandomTestWorker
+        dest = utility.open_destput_file_for_csv_writer(filepath=output_filepath, is_append=checkpoint is not None)
+        with dest:
+            checkpointer = simulate.SimulationCheckpointer(
+                    filepath=checkpoint_filepath,
+                    output_dest=dest,
+                    frequency=2,
+                    checkpoint=checkpoint)
+            gs.execute(
+                    nreps,
+                    results_csv_writer=utility.get_csv_writer(dest=dest),
+                    is_write_header=checkpoint is None,
+                    checkpointer=checkpointer)
+
+    def test_resume(self):
+        with utility.TemporaryDirectory(prefix="gerenuk-test-") as tempdir:
+            expected_filepath = os.path.join(tempdir, "expected.sumstats.tsv")
+            self.run_simulator(6, expected_filepath, os.path.join(tempdir, "expected.checkpoint.json"))
+            with open(expected_filepath) as src:
+                expected = src.read()
+            output_filepath = os.path.join(tempdir, "test.sumstats.tsv")
+            checkpoint_filepath = os.path.join(tempdir, "test.checkpoint.json")
+            # a run of 6 replicates interrupted after its checkpoint at 4,
+            # with some of a fifth written
+            self.run_simulator(4, output_filepath, checkpoint_filepath)
+            with open(checkpoint_filepath) as src:
+                checkpoint = json.load(src)
+            checkpoint["num_replicates"] = 6
+            with open(checkpoint_filepath, "w") as dest:
+                json.dump(checkpoint, dest)
+            with open(output_filepath, "a") as dest:
+                dest.write("test-1\t12")
+            checkpoint = simulate.read_checkpoint(checkpoint_filepath)
+            self.assertEqual(checkpoint["output_filepath"], output_filepath)
+            self.assertEqual(checkpoint["fieldnames"], ["name", "rand_int", "rand_float"])
+            self.assertEqual(checkpoint["num_replicates_completed"], 4)
+            self.assertEqual(checkpoint["workers"][0]["num_replicates_completed"], 4)
+            simulate.truncate_output_to_checkpoint(checkpoint)
+            self.run_simulator(
+                    checkpoint["num_replicates"] - checkpoint["num_replicates_completed"],
+                    output_filepath,
+                    checkpoint_filepath,
+                    checkpoint=checkpoint)
+            with open(output_filepath) as src:
+                self.assertEqual(src.read(), expected)
+            checkpoint = simulate.read_checkpoint(checkpoint_filepath)
+            self.assertEqual(checkpoint["num_replicates_completed"], 6)
+            self.assertEqual(checkpoint["workers"][0]["num_replicates_completed"], 6)
+            self.assertEqual(checkpoint["output_offset"], len(expected.encode("utf-8")))
+
+class ResultsSchemaTests(unittest.TestCase):
+
+    def get_results(self, rng):
+        results_d = collections.OrderedDict()
+        results_d["param.divTimeModel"] = "M{}".format(rng.randint(1, 3))
+        results_d["param.numDivTimes"] = rng.randint(1, 3)
+        for i in range(5):
+            results_d["stat.{}".format(i)] = float(rng.randint(0, 10))
+        return results_d
+
+    def test_pack_unpack(self):
+        rng = random.Random(1)
+        results_d = self.get_results(rng)
+        schema = simulate.ResultsSchema.from_results("w1", results_d)
+        self.assertEqual(schema.object_fieldnames, ["param.divTimeModel", "param.numDivTimes"])
+        schema.set_output_fieldnames(schema.fieldnames)
+        results_ds = [self.get_results(rng) for rep_idx in range(3)]
+        packed = schema.pack(results_ds)
+        self.assertIsInstance(packed[3], array.array)
+        self.assertEqual(len(packed[3]), 15)
+        unpacked = list(schema.unpack(pickle.loads(pickle.dumps(packed))))
+        self.assertEqual(len(unpacked), 3)
+        for values, results_d in zip(unpacked, results_ds):
+            self.assertEqual(list(values), list(results_d.values()))
+            self.assertIsInstance(values[1], int)
+
+    def test_reorder(self):
+        rng = random.Random(1)
+        results_d = self.get_results(rng)
+        schema = simulate.ResultsSchema.from_results("w1", results_d)
+        output_fieldnames = list(reversed(schema.fieldnames))
+        schema.set_output_fieldnames(output_fieldnames)
+        values = list(schema.unpack(schema.pack([results_d])))[0]
+        self.assertEqual(list(values), [results_d[key] for key in output_fieldnames])
+        self.assertRaises(ValueError, schema.set_output_fieldnames, output_fieldnames[1:])
+        del results_d["stat.0"]
+        self.assertRaises(ValueError, schema.pack, [results_d])
+
+    def run_worker(self, num_tasks, results_batch_size, name="test", num_replicates_per_task=1, worker_class=TestWorker, run_logger=None, logging_frequency=0, messenger_lock=None, **kwargs):
+        work_queue = queue.Queue()
+        results_queue = queue.Queue()
+        for task_idx in range(num_tasks):
+            work_queue.put((task_idx * num_replicates_per_task, num_replicates_per_task))
+        worker = worker_class(
+                name=name,
+                model=None,
+                work_queue=work_queue,
+                results_queue=results_queue,
+                fsc2_path=None,
+                working_directory=None,
+                run_logger=run_logger,
+                logging_frequency=logging_frequency,
+                messenger_lock=messenger_lock,
+                random_seed=1,
+                is_calculate_single_population_sfs=False,
+                is_calculate_joint_population_sfs=True,
+                is_unfolded_site_frequency_spectrum=False,
+                stat_label_prefix="stat",
+                is_include_model_id_field=False,
+                supplemental_labels=None,
+                debug_mode=False,
+                results_batch_size=results_batch_size,
+                **kwargs)
+        worker.run()
+        messages = []
+        while not results_queue.empty():
+            messages.append(results_queue.get())
+        return messages
+
+    def test_worker_sends_schema_once(self):
+        messages = self.run_worker(num_tasks=3, results_batch_size=1)
+        schema = messages[0]
+        self.assertIsInstance(schema, simulate.ResultsSchema)
+        self.assertEqual(schema.fieldnames, ["name", "task_count", "rand_int"])
+        schema.set_output_fieldnames(schema.fieldnames)
+        task_counts = []
+        for message in messages[1:]:
+            for values in schema.unpack(message):
+                task_counts.append(values[1])
+        self.assertEqual(task_counts, [1, 2, 3])
+
+    def test_worker_batches_results(self):
+        messages = self.run_worker(num_tasks=5, results_batch_size=2)
+        schema = messages[0]
+        schema.set_output_fieldnames(schema.fieldnames)
+        # batches of 2, with the remainder sent when the work runs out
+        batches = [[values[1] for values in schema.unpack(message)] for message in messages[1:]]
+        self.assertEqual(batches, [[1, 2], [3, 4], [5]])
+
+    def test_worker_logs_completed_replicates(self):
+        run_logger = utility.RunLogger(name="gerenuk-test-mp", log_to_stderr=False, log_to_file=False)
+        # tasks of 3 replicates never start at a multiple of 5, but complete
+        # 6 and then 12 replicates, past 5 and 10
+        with self.assertLogs("gerenuk-test-mp", level="INFO") as logs:
+            self.run_worker(
+                    num_tasks=4,
+                    results_batch_size=100,
+                    num_replicates_per_task=3,
+                    worker_class=ReplicatesTestWorker,
+                    run_logger=run_logger,
+                    logging_frequency=5,
+                    messenger_lock=multiprocessing.Lock())
+        self.assertEqual([record.getMessage() for record in logs.records if "replicates" in record.getMessage()],
+                ["Completed 6 replicates", "Completed 12 replicates"])
+
+    def test_sharded_output(self):
+        config_d = {
+                "standard_error_logging_level": "warning",
+                "log_to_file": False,
+                "params": get_params(),
+                "locus_info": get_locus_info([(4, 3)]),
+                }
+        gs = simulate.GerenukSimulator(config_d=config_d, num_processes=2, is_verbose_setup=False)
+        with utility.TemporaryDirectory(prefix="gerenuk-test-") as tempdir:
+            output_prefix = os.path.join(tempdir, "test")
+            shards = []
+            for pidx, num_tasks in enumerate((3, 2)):
+                filepath = simulate.get_shard_filepath(output_prefix, pidx)
+                self.assertEqual(os.path.basename(filepath), "test.part-{}.sumstats.tsv".format(pidx+1))
+                messages = self.run_worker(
+                        num_tasks=num_tasks,
+                        results_batch_size=2,
+                        name="w{}".format(pidx+1),
+                        output_filepath=filepath)
+                # only the number of results written is sent back
+                self.assertTrue(all(isinstance(m, simulate.ResultsShardUpdate) for m in messages))
+                self.assertEqual(messages[0].fieldnames, ["name", "task_count", "rand_int"])
+                self.assertEqual(sum(m.num_results for m in messages), num_tasks)
+                shards.append((filepath, num_tasks))
+            manifest_filepath = gs._write_sharded_output_manifest(
+                    shard_output_prefix=output_prefix,
+                    shards=shards,
+                    fieldnames=["name", "task_count", "rand_int"],
+                    field_delimiter="\t",
+                    is_write_header=True)
+            manifest = simulate.read_sharded_output_manifest(manifest_filepath)
+            self.assertEqual(manifest["num_samples"], 5)
+            self.assertEqual([shard["filepath"] for shard in manifest["shards"]], [filepath for filepath, n in shards])
+            merged_filepath = output_prefix + simulate.SUMSTATS_SUFFIX
+            num_samples = simulate.merge_sharded_output(manifest_filepath, merged_filepath, is_remove_shards=True)
+            self.assertEqual(num_samples, 5)
+            with open(merged_filepath) as src:
+                rows = [line.rstrip("\n").split("\t") for line in src]
+            self.assertEqual(rows[0], ["name", "task_count", "rand_int"])
+            self.assertEqual([row[0] for row in rows[1:]], ["w1", "w1", "w1", "w2", "w2"])
+            self.assertEqual([row[1] for row in rows[1:]], ["1", "2", "3", "1", "2"])
+            self.assertFalse(os.path.exists(manifest_filepath))
+            self.assertFalse(any(os.path.exists(filepath) for filepath, n in shards))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,408 @@
+#! /usr/bin/env python
+
+import unittest
+import random
+import collections
+from gerenuk import coalescent
+from gerenuk import simulate
+from gerenuk import utility
+from gerenuk.utility import StringIO
+from gerenuk.test.test_fsc2 import get_locus_info, get_params
+
+def get_model(num_lineage_pairs, is_precompute_partition_prior=False, **params):
+    locus_info = get_locus_info([(4, 3) for lineage_pair_idx in range(num_lineage_pairs)])
+    for lineage_pair_idx, locus_d in enumerate(locus_info):
+        locus_d["taxon_label"] = "S{}".format(lineage_pair_idx+1)
+    params_d = get_params()
+    params_d.update(params)
+    return simulate.GerenukSimulationModel(
+            params_d=params_d,
+            locus_info=locus_info,
+            is_precompute_partition_prior=is_precompute_partition_prior)
+
+def get_frequencies(values):
+    counts = collections.Counter(values)
+    return dict((value, float(count) / len(values)) for value, count in counts.items())
+
+def get_rising_factorial(a, n):
+    result = 1.0
+    for i in range(n):
+        result *= a + i
+    return result
+
+def get_ewens_partition_probability(group_sizes, concentration):
+    # probability of a given partition (of labeled elements) under the
+    # Chinese restaurant process
+    probability = concentration ** len(group_sizes) / get_rising_factorial(concentration, sum(group_sizes))
+    for group_size in group_sizes:
+        for i in range(1, group_size):
+            probability *= i
+    return probability
+
+def iterate_partition_codes(num_elements):
+    # each partition as the group of each element, with groups numbered in
+    # order of their first element
+    def extend(code, num_groups):
+        if len(code) == num_elements:
+            yield tuple(code)
+            return
+        for group in range(num_groups + 1):
+            for full_code in extend(code + [group], max(num_groups, group + 1)):
+                yield full_code
+    return extend([], 0)
+
+def get_partition_code(groups):
+    code = {}
+    for group_idx, group in enumerate(sorted(groups, key=min)):
+        for element in group:
+            code[element] = group_idx
+    return tuple(code[element] for element in range(len(code)))
+
+def get_chi_squared(counts, expected_probabilities, min_expected_count=5):
+    # cells with small expected counts are pooled
+    num_samples = sum(counts.values())
+    chi_squared = 0.0
+    num_cells = 0
+    pooled_count = 0
+    pooled_expected_count = 0.0
+    for key, probability in expected_probabilities.items():
+        expected_count = probability * num_samples
+        if expected_count < min_expected_count:
+            pooled_count += counts.get(key, 0)
+            pooled_expected_count += expected_count
+            continue
+        chi_squared += (counts.get(key, 0) - expected_count) ** 2 / expected_count
+        num_cells += 1
+    if pooled_expected_count > 0:
+        chi_squared += (pooled_count - pooled_expected_count) ** 2 / pooled_expected_count
+        num_cells += 1
+    if set(counts) - set(expected_probabilities):
+        raise ValueError("Unexpected values: {}".format(set(counts) - set(expected_probabilities)))
+    return chi_squared, num_cells - 1
+
+def get_chi_squared_critical_value(df, z=3.09):
+    # upper 0.1% point of the chi-squared distribution (Wilson-Hilferty
+    # approximation)
+    return df * (1.0 - 2.0 / (9 * df) + z * (2.0 / (9 * df)) ** 0.5) ** 3
+
+class PartitionSamplerTestCase(unittest.TestCase):
+
+    def assertEwensDistributed(self, partition_codes, num_elements, concentration):
+        expected_probabilities = {}
+        for code in iterate_partition_codes(num_elements):
+            group_sizes = collections.Counter(code).values()
+            expected_probabilities[code] = get_ewens_partition_probability(group_sizes, concentration)
+        self.assertAlmostEqual(sum(expected_probabilities.values()), 1.0)
+        chi_squared, df = get_chi_squared(collections.Counter(partition_codes), expected_probabilities)
+        self.assertLess(chi_squared, get_chi_squared_critical_value(df))
+
+    def test_partition_distribution(self):
+        for num_elements, concentration in ((4, 1.5), (5, 0.3)):
+            rng = random.Random(num_elements)
+            partition_codes = []
+            for rep_idx in range(20000):
+                groups = simulate.sample_partition(
+                        number_of_elements=num_elements,
+                        scaling_parameter=concentration,
+                        rng=rng)
+                self.assertEqual(sorted(element for group in groups for element in group), list(range(num_elements)))
+                partition_codes.append(get_partition_code(groups))
+            self.assertEwensDistributed(partition_codes, num_elements, concentration)
+
+    def test_number_of_groups_distribution(self):
+        # P(k groups) = |s(n, k)| a^k / a^(n), with s the Stirling numbers of
+        # the first kind
+        num_elements = 20
+        concentration = 2.5
+        stirling_numbers = [[1]]
+        for n in range(1, num_elements + 1):
+            previous = stirling_numbers[-1] + [0]
+            stirling_numbers.append([0] + [previous[k-1] + (n - 1) * previous[k] for k in range(1, n + 1)])
+        expected_probabilities = dict((k, stirling_numbers[num_elements][k] * concentration ** k / get_rising_factorial(concentration, num_elements))
+                for k in range(1, num_elements + 1))
+        self.assertAlmostEqual(sum(expected_probabilities.values()), 1.0)
+        rng = random.Random(1)
+        counts = collections.Counter(len(simulate.sample_partition(num_elements, concentration, rng)) for rep_idx in range(20000))
+        chi_squared, df = get_chi_squared(counts, expected_probabilities)
+        self.assertLess(chi_squared, get_chi_squared_critical_value(df))
+
+    def test_zero_concentration(self):
+        groups = simulate.sample_partition(number_of_elements=5, scaling_parameter=0.0, rng=random.Random(1))
+        self.assertEqual(groups, [[0, 1, 2, 3, 4]])
+
+    @unittest.skipIf(coalescent.numpy is None, "NumPy not available")
+    def test_batch_partition_distribution(self):
+        # concentration fixed (almost) at 1.5 by the hyperprior
+        model = get_model(4, concentrationShape=1E8, concentrationScale=1.5E-8)
+        params, div_time_groups = model.sample_parameter_values_from_prior_batch(
+                num_replicates=20000,
+                rng=coalescent.numpy.random.RandomState(1))
+        self.assertEwensDistributed([tuple(code) for code in div_time_groups.tolist()], 4, 1.5)
+
+class PartitionPriorTestCase(unittest.TestCase):
+
+    def get_expected_probabilities(self, partition_prior):
+        expected_probabilities = {}
+        for code in iterate_partition_codes(partition_prior.number_of_elements):
+            expected_probabilities[code] = partition_prior.get_partition_probability(list(collections.Counter(code).values()))
+        self.assertAlmostEqual(sum(expected_probabilities.values()), 1.0)
+        return expected_probabilities
+
+    def assertPartitionsDistributed(self, partition_codes, expected_probabilities):
+        chi_squared, df = get_chi_squared(collections.Counter(partition_codes), expected_probabilities)
+        self.assertLess(chi_squared, get_chi_squared_critical_value(df))
+
+    def test_integer_partitions(self):
+        for number, num_partitions in enumerate((1, 1, 2, 3, 5, 7, 11, 15, 22, 30, 42)):
+            integer_partitions = list(simulate.iterate_integer_partitions(number))
+            self.assertEqual(len(integer_partitions), num_partitions)
+            self.assertEqual(len(set(integer_partitions)), num_partitions)
+            for parts in integer_partitions:
+                self.assertEqual(sum(parts), number)
+                self.assertEqual(list(parts), sorted(parts, reverse=True))
+
+    def test_set_partitions(self):
+        for num_elements in range(1, 8):
+            self.assertEqual(list(simulate.iterate_set_partition_codes(num_elements)), list(iterate_partition_codes(num_elements)))
+
+    def test_alias_table(self):
+        probabilities = [0.5, 0.0, 0.125, 0.25, 0.125]
+        alias_probabilities, aliases = simulate.compile_alias_table(probabilities)
+        # probability of each index: that of its own cell being kept, and
+        # of the cells for which it is the alias not being kept
+        cell_probabilities = [0.0 for idx in probabilities]
+        for idx, (alias_probability, alias) in enumerate(zip(alias_probabilities, aliases)):
+            cell_probabilities[idx] += alias_probability / len(probabilities)
+            cell_probabilities[alias] += (1.0 - alias_probability) / len(probabilities)
+        for cell_probability, probability in zip(cell_probabilities, probabilities):
+            self.assertAlmostEqual(cell_probability, probability)
+
+    def test_fixed_concentration(self):
+        for num_elements, concentration in ((1, 2.0), (4, 1.5), (6, 0.3), (5, 0.0)):
+            partition_prior = simulate.PartitionPrior(num_elements, concentration=concentration)
+            expected_probabilities = self.get_expected_probabilities(partition_prior)
+            for code, probability in expected_probabilities.items():
+                group_sizes = collections.Counter(code).values()
+                if concentration:
+                    self.assertAlmostEqual(probability, get_ewens_partition_probability(group_sizes, concentration))
+                else:
+                    self.assertEqual(probability, 1.0 if len(group_sizes) == 1 else 0.0)
+            self.assertAlmostEqual(sum(partition_prior.probabilities), 1.0)
+            self.assertEqual(sum(partition_prior.num_partitions), len(expected_probabilities))
+
+    def test_hyperprior_integration(self):
+        # the probabilities of the partitions sum to 1 before normalization
+        num_elements = 20
+        stirling_numbers = [[1]]
+        for n in range(1, num_elements + 1):
+            previous = stirling_numbers[-1] + [0]
+            stirling_numbers.append([0] + [previous[k-1] + (n - 1) * previous[k] for k in range(1, n + 1)])
+        for prior_concentration in ((10, 0.3766), (0.1, 1.0), (1.0, 1.0), (2.0, 50.0), (1000, 1000), (1E8, 1.5E-8)):
+            weights = simulate._integrate_num_groups_weights(num_elements, prior_concentration)
+            total_probability = sum(stirling_numbers[num_elements][k] * weights[k-1] for k in range(1, num_elements + 1))
+            self.assertAlmostEqual(total_probability, 1.0, places=9)
+        # concentration (almost) fixed by the hyperprior
+        partition_prior = simulate.PartitionPrior(4, prior_concentration=(1E8, 1.5E-8))
+        for code, probability in self.get_expected_probabilities(partition_prior).items():
+            self.assertAlmostEqual(probability, get_ewens_partition_probability(collections.Counter(code).values(), 1.5))
+
+    def test_same_distribution_as_dirichlet_process(self):
+        model = get_model(5)
+        partition_prior = simulate.PartitionPrior(5, prior_concentration=model.prior_concentration)
+        expected_probabilities = self.get_expected_probabilities(partition_prior)
+        rng = random.Random(1)
+        partition_codes = []
+        for rep_idx in range(20000):
+            div_time_model = model.sample_parameter_values_from_prior(rng)[0]["param.divTimeModel"]
+            partition_codes.append(tuple(int(group) - 1 for group in div_time_model[1:]))
+        self.assertPartitionsDistributed(partition_codes, expected_probabilities)
+
+    def test_sample_partition(self):
+        partition_prior = simulate.PartitionPrior(5, prior_concentration=(1.5, 2.0))
+        rng = random.Random(1)
+        partition_codes = []
+        for rep_idx in range(20000):
+            groups = partition_prior.sample_partition(rng)
+            self.assertEqual(sorted(element for group in groups for element in group), list(range(5)))
+            partition_codes.append(get_partition_code(groups))
+        self.assertPartitionsDistributed(partition_codes, self.get_expected_probabilities(partition_prior))
+        counts = collections.Counter(len(partition_prior.sample_partition(rng)) for rep_idx in range(20000))
+        chi_squared, df = get_chi_squared(counts, dict(enumerate(partition_prior.get_num_groups_probabilities(), 1)))
+        self.assertLess(chi_squared, get_chi_squared_critical_value(df))
+
+    def assertGroupSizesDistributed(self, partition_prior, partition_codes):
+        # of partitions too many to tabulate one by one: the sizes of the
+        # groups, and how often two elements share a group
+        num_elements = partition_prior.number_of_elements
+        counts = collections.Counter(tuple(sorted(collections.Counter(code).values(), reverse=True)) for code in partition_codes)
+        chi_squared, df = get_chi_squared(counts, dict(zip(partition_prior.integer_partitions, partition_prior.probabilities)))
+        self.assertLess(chi_squared, get_chi_squared_critical_value(df))
+        expected_shared = sum(probability * sum(group_size * (group_size - 1) for group_size in group_sizes) / float(num_elements * (num_elements - 1))
+                for group_sizes, probability in zip(partition_prior.integer_partitions, partition_prior.probabilities))
+        for element_id in (1, num_elements - 1):
+            shared = sum(code[0] == code[element_id] for code in partition_codes) / float(len(partition_codes))
+            self.assertAlmostEqual(shared, expected_shared, delta=0.015)
+
+    def test_sample_partition_of_many_elements(self):
+        partition_prior = simulate.PartitionPrior(12, prior_concentration=(1.5, 2.0))
+        self.assertEqual(partition_prior.set_partitions, None)
+        rng = random.Random(1)
+        partition_codes = []
+        for rep_idx in range(20000):
+            groups = partition_prior.sample_partition(rng)
+            self.assertEqual(sorted(element for group in groups for element in group), list(range(12)))
+            partition_codes.append(get_partition_code(groups))
+        self.assertGroupSizesDistributed(partition_prior, partition_codes)
+
+    @unittest.skipIf(coalescent.numpy is None, "NumPy not available")
+    def test_sample_partitions_batch(self):
+        for num_elements in (5, 12):
+            partition_prior = simulate.PartitionPrior(num_elements, prior_concentration=(1.5, 2.0))
+            div_time_groups = partition_prior.sample_partitions_batch(20000, coalescent.numpy.random.RandomState(1))
+            self.assertEqual(div_time_groups.shape, (20000, num_elements))
+            partition_codes = [tuple(code) for code in div_time_groups.tolist()]
+            for code in partition_codes[:100]:
+                # numbered in order of first element
+                self.assertEqual(sorted(set(code), key=code.index), list(range(len(set(code)))))
+            if partition_prior.set_partitions is not None:
+                self.assertPartitionsDistributed(partition_codes, self.get_expected_probabilities(partition_prior))
+            else:
+                self.assertGroupSizesDistributed(partition_prior, partition_codes)
+
+    def test_model(self):
+        model = get_model(4, is_precompute_partition_prior=True)
+        self.assertEqual(model.partition_prior.number_of_elements, 4)
+        rng = random.Random(1)
+        for rep_idx in range(50):
+            params, fsc2_run_configurations = model.sample_parameter_values_from_prior(rng)
+            self.assertEqual(tuple(params.keys()), model.param_fieldnames)
+            self.assertEqual(params["param.numDivTimes"], len(set(params["param.divTimeModel"][1:])))
+        self.assertEqual(get_model(4).partition_prior, None)
+        self.assertRaises(ValueError, get_model, 4, numTauClasses=2, is_precompute_partition_prior=True)
+        self.assertRaises(ValueError, get_model, simulate.PARTITION_PRIOR_MAX_ELEMENTS + 1, is_precompute_partition_prior=True)
+
+    def test_write(self):
+        partition_prior = simulate.PartitionPrior(4, concentration=1.5)
+        dest = StringIO()
+        partition_prior.write(utility.get_csv_writer(dest=dest))
+        rows = [line.split("\t") for line in dest.getvalue().splitlines()]
+        self.assertEqual(rows[0], ["groupSizes", "numDivTimes", "numDivTimeModels", "divTimeModelProbability", "probability"])
+        self.assertEqual([row[0] for row in rows[1:]], ["4", "3+1", "2+2", "2+1+1", "1+1+1+1"])
+        self.assertEqual([int(row[2]) for row in rows[1:]], [1, 4, 3, 6, 1])
+        self.assertAlmostEqual(sum(float(row[4]) for row in rows[1:]), 1.0)
+        for row in rows[1:]:
+            group_sizes = [int(group_size) for group_size in row[0].split("+")]
+            self.assertEqual(int(row[1]), len(group_sizes))
+            self.assertAlmostEqual(float(row[3]), get_ewens_partition_probability(group_sizes, 1.5))
+
+@unittest.skipIf(coalescent.numpy is None, "NumPy not available")
+class PriorBatchSamplingTestCase(unittest.TestCase):
+
+    def sample_batch(self, model, num_replicates, random_seed=1):
+        return model.sample_parameter_values_from_prior_batch(
+                num_replicates=num_replicates,
+                rng=coalescent.numpy.random.RandomState(random_seed))
+
+    def assertSameDistribution(self, model, num_replicates=20000, tolerance=0.02):
+        rng = random.Random(1)
+        params_ds = [model.sample_parameter_values_from_prior(rng)[0] for rep_idx in range(num_replicates)]
+        batch_params, div_time_groups = self.sample_batch(model, num_replicates)
+        expected = get_frequencies([params_d["param.divTimeModel"] for params_d in params_ds])
+        observed = get_frequencies(batch_params["param.divTimeModel"].tolist())
+        self.assertEqual(set(observed), set(expected))
+        for div_time_model in expected:
+            self.assertAlmostEqual(observed[div_time_model], expected[div_time_model], delta=tolerance)
+        for fieldname in model.param_fieldnames[1:]:
+            expected_mean = sum(params_d[fieldname] for params_d in params_ds) / num_replicates
+            self.assertAlmostEqual(batch_params[fieldname].mean() / expected_mean, 1.0, delta=0.05)
+
+    def test_fields(self):
+        model = get_model(3)
+        params, div_time_groups = self.sample_batch(model, 50)
+        self.assertEqual(tuple(params.keys()), model.param_fieldnames)
+        for values in params.values():
+            self.assertEqual(len(values), 50)
+        self.assertEqual(div_time_groups.shape, (50, 3))
+        for rep_idx in range(50):
+            groups = div_time_groups[rep_idx].tolist()
+            self.assertEqual(params["param.divTimeModel"][rep_idx], "M" + "".join(str(group+1) for group in groups))
+            self.assertEqual(params["param.numDivTimes"][rep_idx], len(set(groups)))
+            # numbered in order of first lineage pair
+            self.assertEqual(sorted(set(groups), key=groups.index), list(range(len(set(groups)))))
+            for lineage_pair_idx in range(3):
+                for other_idx in range(3):
+                    self.assertEqual(
+                            params["param.divTime.S{}".format(lineage_pair_idx+1)][rep_idx] == params["param.divTime.S{}".format(other_idx+1)][rep_idx],
+                            groups[lineage_pair_idx] == groups[other_idx])
+
+    def test_reproducible(self):
+        model = get_model(4)
+        params1, groups1 = self.sample_batch(model, 100, random_seed=3)
+        params2, groups2 = self.sample_batch(model, 100, random_seed=3)
+        self.assertEqual(groups1.tolist(), groups2.tolist())
+        for fieldname in model.param_fieldnames:
+            self.assertEqual(params1[fieldname].tolist(), params2[fieldname].tolist())
+        batches1 = list(model.iter_prior_batches(num_replicates=250, random_seed=2**40 + 7, batch_size=100))
+        batches2 = list(model.iter_prior_batches(num_replicates=250, random_seed=2**40 + 7, batch_size=100))
+        self.assertEqual([len(groups) for params, groups in batches1], [100, 100, 50])
+        self.assertEqual([groups.tolist() for params, groups in batches1], [groups.tolist() for params, groups in batches2])
+        self.assertNotEqual(batches1[0][1].tolist(), batches1[1][1].tolist())
+
+    def test_same_distribution_as_single_replicates(self):
+        self.assertSameDistribution(get_model(4))
+
+    def test_same_distribution_with_partition_prior(self):
+        self.assertSameDistribution(get_model(4, is_precompute_partition_prior=True))
+
+    def test_same_distribution_with_fixed_number_of_div_times(self):
+        model = get_model(4, numTauClasses=2)
+        params, div_time_groups = self.sample_batch(model, 1000)
+        self.assertEqual(set(params["param.numDivTimes"].tolist()), set([2]))
+        self.assertSameDistribution(model)
+
+    def test_theta_constraints(self):
+        for theta_constraints, expected_equalities in (
+                ("000", (True, True)),
+                ("001", (True, False)),
+                ("011", (False, False)),
+                ("012", (False, False)),
+                ):
+            model = get_model(2, thetaParameters=theta_constraints)
+            params, div_time_groups = self.sample_batch(model, 20)
+            deme0 = params["param.theta.S1.deme0"].tolist()
+            deme1 = params["param.theta.S1.deme1"].tolist()
+            demeA = params["param.theta.S1.demeA"].tolist()
+            self.assertEqual(deme0 == deme1, expected_equalities[0])
+            self.assertEqual(deme0 == demeA, expected_equalities[1])
+            if theta_constraints == "011":
+                self.assertEqual(deme1, demeA)
+
+    def test_many_lineage_pairs(self):
+        model = get_model(12, concentrationShape=1000, concentrationScale=1000)
+        params, div_time_groups = self.sample_batch(model, 5)
+        for rep_idx in range(5):
+            self.assertEqual(params["param.divTimeModel"][rep_idx], "M123456789101112")
+
+    def test_write_prior_samples(self):
+        config_d = {
+                "title": "test",
+                "standard_error_logging_level": "warning",
+                "log_to_file": False,
+                "random_seed": 1,
+                "is_include_model_id_field": True,
+                "supplemental_labels": collections.OrderedDict([("source", "test")]),
+                "params": get_params(),
+                "locus_info": get_locus_info([(4, 3), (4, 3)]),
+                }
+        gs = simulate.GerenukSimulator(config_d=config_d, num_processes=1, is_verbose_setup=False)
+        dest = StringIO()
+        gs.write_prior_samples(25, utility.get_csv_writer(dest=dest), batch_size=10)
+        rows = [line.split("\t") for line in dest.getvalue().splitlines()]
+        self.assertEqual(rows[0], ["model.id", "source"] + list(gs.model.param_fieldnames))
+        self.assertEqual(len(rows), 26)
+        for row in rows[1:]:
+            self.assertEqual(row[0], row[2])
+            self.assertEqual(row[1], "test")
+
+if __name__ == "__main__":
+    unittest.main()
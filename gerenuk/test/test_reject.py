@@ -0,0 +1,534 @@
+import os
+import random
+import statistics
+import tempfile
+import unittest
+from gerenuk import reject
+from gerenuk import utility
+
+def write_prior_file(filepath, num_rows, num_stats, rng, delimiter="\t"):
+    fieldnames = ["param.divTimeModel", "param.numDivTimes"] + ["stat.{}".format(i) for i in range(num_stats)]
+    with open(filepath, "w") as dest:
+        dest.write(delimiter.join(fieldnames) + "\n")
+        for row_idx in range(num_rows):
+            row = ["M{}".format(row_idx), str(rng.randint(1, 3))]
+            for i in range(num_stats):
+                if i % 2:
+                    row.append(str(rng.randint(0, 5)))
+                else:
+                    row.append(repr(rng.uniform(0, 10)))
+            dest.write(delimiter.join(row) + "\n")
+    return fieldnames
+
+def get_rejector(distance_engine, criteria_type="num", criteria_value=10, is_output_summary_stats=False, distance_type="euclidean", stat_weights=None, is_use_spatial_index=False, num_reduced_dimensions=None):
+    run_logger = utility.RunLogger(
+            name="gerenuk-test",
+            log_to_stderr=False,
+            log_to_file=False)
+    return reject.GerenukRejector(
+            rejection_criteria_type=criteria_type,
+            rejection_criteria_value=criteria_value,
+            run_logger=run_logger,
+            logging_frequency=0,
+            is_output_summary_stats=is_output_summary_stats,
+            distance_engine=distance_engine,
+            distance_type=distance_type,
+            stat_weights=stat_weights,
+            is_use_spatial_index=is_use_spatial_index,
+            num_reduced_dimensions=num_reduced_dimensions,
+            reduction_random_seed=1)
+
+@unittest.skipIf(reject.numpy is None, "NumPy not available")
+class DistanceEngineTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = utility.TemporaryDirectory(prefix="gerenuk-test-")
+        cls.tempdir_path = cls.tempdir.__enter__()
+        cls.rng = random.Random(1)
+        cls.prior_filepath = os.path.join(cls.tempdir_path, "prior.tsv")
+        write_prior_file(cls.prior_filepath, num_rows=500, num_stats=37, rng=cls.rng)
+        cls.rejectors = {}
+        for engine in ("numpy", "python"):
+            gr = get_rejector(engine)
+            gr.read_simulated_data([cls.prior_filepath])
+            cls.rejectors[engine] = gr
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.__exit__()
+
+    def get_targets(self):
+        targets = []
+        for i in range(5):
+            targets.append([self.rng.uniform(0, 10) for j in range(37)])
+        # exact duplicate of a prior row, to exercise ties
+        targets.append(list(self.rejectors["python"].stat_values[7]))
+        return targets
+
+    def test_distances_identical(self):
+        for target in self.get_targets():
+            d1 = self.rejectors["numpy"].calculate_distances(target)
+            d2 = self.rejectors["python"].calculate_distances(target)
+            self.assertEqual(d1.tolist(), d2)
+
+    def test_blocked_distances(self):
+        gr = self.rejectors["numpy"]
+        target = self.get_targets()[0]
+        expected = reject.euclidean_distances(gr.stat_matrix, target)
+        for block_num_cells in (1, 37, 100, 37 * 499):
+            d = reject.euclidean_distances(gr.stat_matrix, target, block_num_cells=block_num_cells)
+            self.assertEqual(d.tolist(), expected.tolist())
+
+    def test_einsum_and_reduce_identical(self):
+        is_einsum_exact = reject.is_einsum_exact()
+        try:
+            for target in self.get_targets():
+                expected = self.rejectors["python"].calculate_distances(target)
+                for is_einsum in (is_einsum_exact, False):
+                    reject._IS_EINSUM_EXACT = is_einsum
+                    self.assertEqual(self.rejectors["numpy"].calculate_distances(target).tolist(), expected)
+        finally:
+            reject._IS_EINSUM_EXACT = is_einsum_exact
+
+    def test_closest_values_indexes_identical(self):
+        for target in self.get_targets():
+            for num_to_retain in (1, 10, 499, 500, 1000):
+                r1 = self.rejectors["numpy"].closest_values_indexes(target, num_to_retain)
+                r2 = self.rejectors["python"].closest_values_indexes(target, num_to_retain)
+                self.assertEqual(r1, r2)
+
+    def test_filter_by_distance_identical(self):
+        for target in self.get_targets():
+            for max_distance in (0.0, 10.0, 20.0, 1000.0):
+                r1 = self.rejectors["numpy"].filter_by_distance(target, max_distance)
+                r2 = self.rejectors["python"].filter_by_distance(target, max_distance)
+                self.assertEqual(r1, r2)
+
+@unittest.skipIf(reject.numpy is None, "NumPy not available")
+class SelectClosestTestCase(unittest.TestCase):
+
+    def test_matches_full_sort(self):
+        rng = random.Random(2)
+        for num_values in (1, 2, 10, 100):
+            # small value range to ensure lots of ties
+            distances = reject.numpy.array([float(rng.randint(0, 5)) for i in range(num_values)])
+            full_sort = reject.numpy.argsort(distances, kind="stable").tolist()
+            for num_to_retain in range(0, num_values + 2):
+                indexes = reject.select_closest(distances, num_to_retain)
+                self.assertEqual(indexes.tolist(), full_sort[:num_to_retain])
+
+class RejectionRunner(object):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = utility.TemporaryDirectory(prefix="gerenuk-test-")
+        cls.tempdir_path = cls.tempdir.__enter__()
+        rng = random.Random(3)
+        cls.prior_filepaths = []
+        for i in range(2):
+            filepath = os.path.join(cls.tempdir_path, "prior{}.tsv".format(i))
+            write_prior_file(filepath, num_rows=53, num_stats=8, rng=rng)
+            cls.prior_filepaths.append(filepath)
+        cls.target_filepath = os.path.join(cls.tempdir_path, "target.tsv")
+        write_prior_file(cls.target_filepath, num_rows=2, num_stats=8, rng=rng)
+        with open(cls.prior_filepaths[1]) as src:
+            duplicated_row = src.read().split("\n")[5]
+        with open(cls.target_filepath, "a") as dest:
+            dest.write(duplicated_row + "\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.__exit__()
+
+    def run_rejection(self, is_stream, distance_engine, criteria_type, criteria_value, chunk_size, is_batch_targets=False, prior_filepaths=None, num_processes=1, distance_type="euclidean", stat_weights=None, num_reduced_dimensions=None):
+        if prior_filepaths is None:
+            prior_filepaths = self.prior_filepaths
+        output_dir = tempfile.mkdtemp(dir=self.tempdir_path)
+        gr = get_rejector(
+                distance_engine,
+                criteria_type=criteria_type,
+                criteria_value=criteria_value,
+                is_output_summary_stats=True,
+                distance_type=distance_type,
+                stat_weights=stat_weights,
+                num_reduced_dimensions=num_reduced_dimensions)
+        gr.is_batch_targets = is_batch_targets
+        cwd = os.getcwd()
+        os.chdir(output_dir)
+        try:
+            if is_stream:
+                gr.stream_posterior(self.target_filepath, prior_filepaths, chunk_size=chunk_size, num_processes=num_processes)
+            else:
+                gr.read_simulated_data(prior_filepaths, chunk_size=chunk_size)
+                gr.write_posterior(self.target_filepath)
+        finally:
+            os.chdir(cwd)
+        results = []
+        for target_idx in range(3):
+            with open(os.path.join(output_dir, "target.posterior.{}.tsv".format(target_idx+1))) as src:
+                results.append(src.read())
+        return results
+
+class StreamingRejectionTestCase(RejectionRunner, unittest.TestCase):
+
+    def test_stream_matches_in_memory(self):
+        engines = ["python"]
+        if reject.numpy is not None:
+            engines.append("numpy")
+        for criteria_type, criteria_value in (("num", 1), ("num", 10), ("proportion", 0.2), ("distance", 10.0)):
+            expected = self.run_rejection(False, "python", criteria_type, criteria_value, 1000)
+            self.assertTrue(all(len(r.split("\n")) > 2 for r in expected))
+            for distance_engine in engines:
+                for chunk_size in (1, 7, 1000):
+                    results = self.run_rejection(True, distance_engine, criteria_type, criteria_value, chunk_size)
+                    self.assertEqual(results, expected)
+            if reject.numpy is not None:
+                results = self.run_rejection(False, "numpy", criteria_type, criteria_value, 7)
+                self.assertEqual(results, expected)
+
+    @unittest.skipIf(reject.numpy is None, "NumPy not available")
+    def test_batch_targets_matches_per_target(self):
+        for criteria_type, criteria_value in (("num", 1), ("num", 10), ("proportion", 0.2), ("distance", 10.0), ("distance", 0.0)):
+            expected = self.run_rejection(False, "python", criteria_type, criteria_value, 1000)
+            for is_stream in (False, True):
+                for chunk_size in (1, 7, 1000):
+                    results = self.run_rejection(is_stream, "numpy", criteria_type, criteria_value, chunk_size, is_batch_targets=True)
+                    self.assertEqual(results, expected)
+
+    def test_parallel_matches_serial(self):
+        engines = ["python"]
+        if reject.numpy is not None:
+            engines.append("numpy")
+        for criteria_type, criteria_value in (("num", 1), ("num", 10), ("proportion", 0.2), ("distance", 10.0)):
+            expected = self.run_rejection(False, "python", criteria_type, criteria_value, 1000)
+            for distance_engine in engines:
+                for num_processes in (2, 3):
+                    results = self.run_rejection(True, distance_engine, criteria_type, criteria_value, 7,
+                            num_processes=num_processes)
+                    self.assertEqual(results, expected)
+
+    def test_parallel_logs_scoring_time(self):
+        with self.assertLogs("gerenuk-test", level="INFO") as logs:
+            self.run_rejection(True, "python", "num", 10, 7, num_processes=2)
+        self.assertTrue(any("Scored 3 targets against 106 samples" in message for message in logs.output))
+
+class StandardizedDistanceTestCase(RejectionRunner, unittest.TestCase):
+
+    def test_column_moments(self):
+        rng = random.Random(5)
+        rows = [[rng.uniform(0, 10), float(rng.randint(0, 5)), 3.0] for i in range(101)]
+        moments = reject.ColumnMomentsAccumulator(3)
+        for start in range(0, len(rows), 10):
+            moments.add_chunk(rows[start:start+10])
+        self.assertEqual(moments.num_rows, 101)
+        for col_idx, column in enumerate(zip(*rows)):
+            self.assertAlmostEqual(moments.means[col_idx], statistics.mean(column))
+            self.assertAlmostEqual(moments.get_standard_deviations()[col_idx], statistics.stdev(column))
+        self.assertEqual(moments.get_standard_deviations()[2], 0.0)
+        if reject.numpy is not None:
+            numpy_moments = reject.ColumnMomentsAccumulator(3)
+            stat_matrix = reject.numpy.array(rows)
+            for start in range(0, len(rows), 10):
+                numpy_moments.add_chunk(stat_matrix[start:start+10])
+            self.assertEqual(numpy_moments.means, moments.means)
+            self.assertEqual(numpy_moments.m2s, moments.m2s)
+
+    def test_stat_scales_cached(self):
+        gr = get_rejector("python", distance_type="standardized")
+        gr.read_simulated_data(self.prior_filepaths)
+        expected_stat_values = [list(v) for v in zip(*gr.stat_values)]
+        for scale, column in zip(gr.column_scales, expected_stat_values):
+            self.assertAlmostEqual(scale, 1.0 / statistics.stdev(column))
+        self.assertTrue(os.path.exists(reject.get_stat_scales_filepath(self.prior_filepaths)))
+        gr2 = get_rejector("python", distance_type="standardized")
+        gr2.calculate_stat_scales(self.prior_filepaths)
+        self.assertEqual(gr2.column_scales, gr.column_scales)
+        # stale if the prior is different
+        gr3 = get_rejector("python", distance_type="standardized")
+        self.assertIsNone(gr3._read_stat_scales(self.prior_filepaths[:1]))
+
+    def test_standardized_matches_across_modes(self):
+        engines = ["python"]
+        if reject.numpy is not None:
+            engines.append("numpy")
+        for criteria_type, criteria_value in (("num", 10), ("distance", 3.5)):
+            expected = self.run_rejection(False, "python", criteria_type, criteria_value, 1000, distance_type="standardized")
+            self.assertTrue(all(len(r.split("\n")) > 2 for r in expected))
+            self.assertNotEqual(expected, self.run_rejection(False, "python", criteria_type, criteria_value, 1000))
+            for distance_engine in engines:
+                self.assertEqual(self.run_rejection(False, distance_engine, criteria_type, criteria_value, 7,
+                    distance_type="standardized"), expected)
+                self.assertEqual(self.run_rejection(True, distance_engine, criteria_type, criteria_value, 7,
+                    distance_type="standardized"), expected)
+                self.assertEqual(self.run_rejection(True, distance_engine, criteria_type, criteria_value, 7,
+                    distance_type="standardized", num_processes=2), expected)
+            if reject.numpy is not None:
+                self.assertEqual(self.run_rejection(True, "numpy", criteria_type, criteria_value, 7,
+                    distance_type="standardized", is_batch_targets=True), expected)
+
+    def test_weighted(self):
+        stat_weights = dict(("stat.{}".format(i), 0.0) for i in range(8))
+        stat_weights["stat.0"] = 4.0
+        gr = get_rejector("python")
+        gr.read_simulated_data(self.prior_filepaths)
+        targets = gr.read_target_data(self.target_filepath)
+        engines = ["python"]
+        if reject.numpy is not None:
+            engines.append("numpy")
+        for distance_engine in engines:
+            results = self.run_rejection(False, distance_engine, "num", 10, 7, distance_type="weighted", stat_weights=stat_weights)
+            for target, result in zip(targets, results):
+                rows = [row.split("\t") for row in result.split("\n")[1:] if row]
+                expected = sorted((abs(v[0] - target[0]) for v in gr.stat_values))[:10]
+                self.assertEqual([abs(float(row[2]) - target[0]) for row in rows], expected)
+
+@unittest.skipIf(reject.numpy is None, "NumPy not available")
+class BinaryPriorTestCase(RejectionRunner, unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(BinaryPriorTestCase, cls).setUpClass()
+        gr = get_rejector("numpy")
+        cls.binary_prior_filepath = gr.write_binary_prior(
+                filepaths=cls.prior_filepaths,
+                output_prefix=os.path.join(cls.tempdir_path, "prior"),
+                chunk_size=10)
+
+    def test_binary_prior_contents(self):
+        gr1 = get_rejector("numpy")
+        gr1.read_simulated_data(self.prior_filepaths)
+        gr2 = get_rejector("numpy")
+        gr2.read_simulated_data([self.binary_prior_filepath])
+        self.assertIsInstance(gr2.stat_matrix, reject.numpy.memmap)
+        self.assertEqual(gr1.all_fieldnames, gr2.all_fieldnames)
+        self.assertEqual(gr1.stat_matrix.tolist(), gr2.stat_matrix.tolist())
+        self.assertEqual(gr1.other_values, gr2.other_values)
+
+    def test_parallel_task_offsets(self):
+        gr = get_rejector("numpy")
+        gr.read_simulated_data([self.binary_prior_filepath])
+        for num_processes in (1, 3, 7):
+            tasks = gr._get_parallel_tasks([self.binary_prior_filepath], 10, num_processes)
+            self.assertEqual([task[2] for task in tasks[1:]], [task[3] for task in tasks[:-1]])
+            self.assertEqual((tasks[0][2], tasks[-1][3]), (0, len(gr.other_values)))
+            for task_idx, filepath, start_row, stop_row, start_offset in tasks:
+                chunks = list(gr._iterate_binary_prior(filepath, 4, 0, start_row, stop_row, start_offset))
+                unseeked_chunks = list(gr._iterate_binary_prior(filepath, 4, 0, start_row, stop_row))
+                other_rows = [row for chunk in chunks for row in chunk[2]]
+                self.assertEqual(other_rows, gr.other_values[start_row:stop_row])
+                self.assertEqual([chunk[2] for chunk in chunks], [chunk[2] for chunk in unseeked_chunks])
+
+    def test_sharded_binary_priors(self):
+        binary_prior_filepaths = []
+        for prior_idx, prior_filepath in enumerate(self.prior_filepaths):
+            gr = get_rejector("numpy")
+            binary_prior_filepaths.append(gr.write_binary_prior(
+                    filepaths=[prior_filepath],
+                    output_prefix=os.path.join(self.tempdir_path, "shard{}".format(prior_idx))))
+        gr = get_rejector("numpy")
+        gr.read_simulated_data(binary_prior_filepaths)
+        self.assertIsInstance(gr.stat_matrix, reject.ShardedStatMatrix)
+        for shard in gr.stat_matrix.shards:
+            self.assertIsInstance(shard, reject.numpy.memmap)
+        expected = get_rejector("numpy")
+        expected.read_simulated_data(self.prior_filepaths)
+        self.assertEqual(gr.stat_matrix.shape, expected.stat_matrix.shape)
+        num_rows = expected.stat_matrix.shape[0]
+        for start, stop in ((0, num_rows), (0, 10), (50, 56), (53, 60), (100, 200), (-3, None)):
+            self.assertEqual(gr.stat_matrix[start:stop].tolist(), expected.stat_matrix[start:stop].tolist())
+        for row_idx in (0, 52, 53, num_rows - 1, -1):
+            self.assertEqual(gr.stat_matrix[row_idx].tolist(), expected.stat_matrix[row_idx].tolist())
+        row_idxs = [105, 0, 53, 52, 53]
+        self.assertEqual(gr.stat_matrix[reject.numpy.array(row_idxs)].tolist(), expected.stat_matrix[row_idxs].tolist())
+        for criteria_type, criteria_value in (("num", 10), ("distance", 10.0)):
+            expected_results = self.run_rejection(False, "python", criteria_type, criteria_value, 1000)
+            for is_batch_targets in (False, True):
+                results = self.run_rejection(False, "numpy", criteria_type, criteria_value, 10,
+                        is_batch_targets=is_batch_targets,
+                        prior_filepaths=binary_prior_filepaths)
+                self.assertEqual(results, expected_results)
+
+    def test_binary_prior_matches_text(self):
+        for criteria_type, criteria_value in (("num", 10), ("proportion", 0.2), ("distance", 10.0)):
+            expected = self.run_rejection(False, "python", criteria_type, criteria_value, 1000)
+            for distance_engine in ("numpy", "python"):
+                for is_stream in (False, True):
+                    results = self.run_rejection(is_stream, distance_engine, criteria_type, criteria_value, 7,
+                            prior_filepaths=[self.binary_prior_filepath])
+                    self.assertEqual(results, expected)
+                for num_processes in (2, 4):
+                    results = self.run_rejection(True, distance_engine, criteria_type, criteria_value, 7,
+                            prior_filepaths=[self.binary_prior_filepath],
+                            num_processes=num_processes)
+                    self.assertEqual(results, expected)
+            results = self.run_rejection(True, "numpy", criteria_type, criteria_value, 7,
+                    is_batch_targets=True,
+                    prior_filepaths=[self.binary_prior_filepath, self.binary_prior_filepath])
+            self.assertEqual(len(results), len(expected))
+
+@unittest.skipIf(reject.numpy is None or reject.scipy_spatial is None, "NumPy and SciPy not available")
+class SpatialIndexTestCase(RejectionRunner, unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(SpatialIndexTestCase, cls).setUpClass()
+        cls.binary_prior_filepaths = []
+        for prior_idx, prior_filepath in enumerate(cls.prior_filepaths):
+            cls.binary_prior_filepaths.append(get_rejector("numpy").write_binary_prior(
+                    filepaths=[prior_filepath],
+                    output_prefix=os.path.join(cls.tempdir_path, "shard{}".format(prior_idx))))
+
+    def test_matches_full_scan(self):
+        gr = get_rejector("numpy")
+        gr.read_simulated_data(self.prior_filepaths)
+        targets = gr.read_target_data(self.target_filepath)
+        rng = random.Random(7)
+        targets.extend(list(gr.stat_matrix[rng.randint(0, 105)] + rng.choice((0.0, 1e-9))) for i in range(10))
+        for distance_type in ("euclidean", "standardized"):
+            expected = get_rejector("numpy", distance_type=distance_type)
+            expected.read_simulated_data(self.prior_filepaths)
+            gr = get_rejector("numpy", distance_type=distance_type, is_use_spatial_index=True)
+            gr.read_simulated_data(self.prior_filepaths)
+            self.assertIsNotNone(gr.spatial_index)
+            for target in targets:
+                for num_to_retain in (0, 1, 2, 10, 105, 106, 200):
+                    self.assertEqual(
+                            gr.closest_values_indexes(target, num_to_retain),
+                            expected.closest_values_indexes(target, num_to_retain))
+                for max_distance in (0.0, 1.0, 5.0, 10.0, 1000.0):
+                    self.assertEqual(
+                            gr.filter_by_distance(target, max_distance),
+                            expected.filter_by_distance(target, max_distance))
+
+    def test_cached(self):
+        gr = get_rejector("numpy", is_use_spatial_index=True)
+        gr.read_simulated_data(self.binary_prior_filepaths)
+        self.assertTrue(os.path.exists(reject.get_spatial_index_filepath(self.binary_prior_filepaths)))
+        gr2 = get_rejector("numpy", is_use_spatial_index=True)
+        gr2.read_simulated_data(self.binary_prior_filepaths)
+        self.assertIsNotNone(gr2._read_spatial_index(self.binary_prior_filepaths))
+        # stale if scaled differently
+        gr3 = get_rejector("numpy", distance_type="standardized")
+        gr3.read_simulated_data(self.binary_prior_filepaths)
+        self.assertIsNone(gr3._read_spatial_index(self.binary_prior_filepaths))
+        expected = get_rejector("numpy")
+        expected.read_simulated_data(self.prior_filepaths)
+        for target in expected.read_target_data(self.target_filepath):
+            self.assertEqual(gr2.closest_values_indexes(target, 10), expected.closest_values_indexes(target, 10))
+
+@unittest.skipIf(reject.numpy is None, "NumPy not available")
+class DimensionReductionTestCase(RejectionRunner, unittest.TestCase):
+
+    def test_reservoir_sample(self):
+        reducer = reject.PrincipalComponentsReducer(num_components=2, sample_size=50, random_seed=1)
+        stat_matrix = reject.numpy.arange(1000, dtype=reject.numpy.float64).reshape(500, 2)
+        for start in range(0, 500, 7):
+            reducer.add_chunk(stat_matrix[start:start+7])
+        self.assertEqual(reducer.num_sampled, 50)
+        self.assertEqual(reducer.num_rows_seen, 500)
+        sampled_rows = sorted(int(row[0]) // 2 for row in reducer.sample)
+        self.assertEqual(len(set(sampled_rows)), 50)
+        self.assertTrue(sampled_rows[-1] >= 100)
+
+    def test_reservoir_sample_reproducible(self):
+        rng = reject.numpy.random.RandomState(3)
+        stat_matrix = rng.standard_normal((2000, 30))
+        samples = []
+        components = []
+        for chunk_size in (2000, 2000, 7, 500, 1):
+            reducer = reject.PrincipalComponentsReducer(num_components=3, sample_size=100, random_seed=5)
+            for start in range(0, 2000, chunk_size):
+                reducer.add_chunk(stat_matrix[start:start+chunk_size])
+            samples.append(reducer.sample.copy())
+            reducer.fit()
+            components.append(reducer.components)
+        # a fixed seed gives the same sample, and so the same fit, however
+        # the prior is chunked
+        for sample, chunk_components in zip(samples[1:], components[1:]):
+            self.assertEqual(sample.tolist(), samples[0].tolist())
+            self.assertEqual(chunk_components.tolist(), components[0].tolist())
+        # drawn from the whole prior, rather than from its first rows
+        sampled_rows = set(stat_matrix.tolist().index(row) for row in samples[0].tolist())
+        self.assertEqual(len(sampled_rows), 100)
+        self.assertTrue(max(sampled_rows) >= 1000)
+        reducer = reject.PrincipalComponentsReducer(num_components=3, sample_size=100, random_seed=6)
+        reducer.add_chunk(stat_matrix)
+        self.assertNotEqual(reducer.sample.tolist(), samples[0].tolist())
+
+    def test_components(self):
+        rng = reject.numpy.random.RandomState(2)
+        # 3 latent dimensions, embedded in 200 columns
+        stat_matrix = reject.numpy.dot(rng.standard_normal((400, 3)) * [10.0, 5.0, 2.0], rng.standard_normal((3, 200)))
+        for sample_size in (400, 100):
+            reducer = reject.PrincipalComponentsReducer(num_components=3, sample_size=sample_size, random_seed=1)
+            reducer.add_chunk(stat_matrix)
+            reducer.fit()
+            self.assertAlmostEqual(reducer.explained_variance_ratio, 1.0)
+            # distances preserved in the reduced space
+            reduced = reducer.transform(stat_matrix)
+            self.assertEqual(reduced.shape, (400, 3))
+            for row_idx in (0, 17, 399):
+                self.assertTrue(reject.numpy.allclose(
+                    reject.euclidean_distances(reduced, reduced[row_idx]),
+                    reject.euclidean_distances(stat_matrix, stat_matrix[row_idx])))
+            self.assertTrue(reject.numpy.allclose(reducer.transform(stat_matrix[5]), reduced[5]))
+
+    def test_reduced_rejection(self):
+        # with all the components, the same as without reduction (up to
+        # rounding, so compare to a distance criterion away from ties)
+        for distance_type in ("euclidean", "standardized"):
+            gr = get_rejector("numpy", distance_type=distance_type, num_reduced_dimensions=8)
+            gr.read_simulated_data(self.prior_filepaths)
+            self.assertEqual(gr.reduced_stat_matrix.shape, (106, 8))
+            self.assertTrue(os.path.exists(reject.get_reduction_filepath(self.prior_filepaths)))
+            expected = get_rejector("numpy", distance_type=distance_type)
+            expected.read_simulated_data(self.prior_filepaths)
+            for target in expected.read_target_data(self.target_filepath):
+                self.assertTrue(reject.numpy.allclose(gr.calculate_distances(target), expected.calculate_distances(target)))
+            # read from the cache
+            gr2 = get_rejector("numpy", distance_type=distance_type, num_reduced_dimensions=8)
+            gr2.read_simulated_data(self.prior_filepaths)
+            self.assertEqual(gr2.reducer.components.tolist(), gr.reducer.components.tolist())
+        expected = self.run_rejection(False, "numpy", "num", 5, 7, num_reduced_dimensions=3)
+        self.assertTrue(all(len(r.split("\n")) == 7 for r in expected))
+        for is_stream in (False, True):
+            self.assertEqual(self.run_rejection(is_stream, "numpy", "num", 5, 7, num_reduced_dimensions=3), expected)
+            self.assertEqual(self.run_rejection(is_stream, "numpy", "num", 5, 7, num_reduced_dimensions=3, is_batch_targets=True), expected)
+
+    def test_targets_projected_once(self):
+        gr = get_rejector("numpy", num_reduced_dimensions=3)
+        gr.read_simulated_data(self.prior_filepaths)
+        transformed_shapes = []
+        transform = gr.reducer.transform
+        def counting_transform(stat_rows):
+            transformed_shapes.append(reject.numpy.shape(stat_rows))
+            return transform(stat_rows)
+        gr.reducer.transform = counting_transform
+        targets = gr.read_target_data(self.target_filepath)
+        distance_targets = gr._get_distance_targets(targets)
+        accumulators = [reject.RejectionAccumulator(num_to_retain=5) for target in targets]
+        distance_stat_matrix = gr._get_distance_stat_matrix()
+        for start in range(0, 106, 7):
+            gr.score_chunk(
+                    targets=distance_targets,
+                    accumulators=accumulators,
+                    stat_chunk=gr.stat_matrix[start:start+7],
+                    first_row_idx=start,
+                    other_rows=gr.other_values[start:start+7],
+                    distance_stat_chunk=distance_stat_matrix[start:start+7])
+        # only the targets, once: the prior is already projected
+        self.assertEqual(transformed_shapes, [(3, 8)])
+        # raw (streamed) chunks are projected, but not the targets again
+        for start in range(0, 106, 7):
+            gr.score_chunk(
+                    targets=distance_targets,
+                    accumulators=accumulators,
+                    stat_chunk=gr.stat_matrix[start:start+7],
+                    first_row_idx=start,
+                    other_rows=gr.other_values[start:start+7])
+        self.assertEqual(len(transformed_shapes), 1 + len(range(0, 106, 7)))
+        self.assertTrue(all(shape[0] <= 7 for shape in transformed_shapes[1:]))
+
+if __name__ == "__main__":
+    unittest.main()
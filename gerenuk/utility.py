@@ -77,16 +77,21 @@ def pre_py34_open(file,
             mode=mode,
             buffering=buffering)
 
+# Assigning to 'open' within a function makes it local to the whole function,
+# so the functions below use this instead.
+if sys.version_info.major >= 3 and sys.version_info.minor >= 4:
+    _open = open
+else:
+    _open = pre_py34_open
+
 ##############################################################################
 ## CSV File Handling
 
 def open_destput_file_for_csv_writer(filepath, is_append=False):
-    if not (sys.version_info.major >= 3 and sys.version_info.minor >= 4):
-        open = pre_py34_open
     if filepath is None or filepath == "-":
         dest = sys.stdout
     elif sys.version_info >= (3,0,0):
-        dest = open(filepath, "a" if is_append else "w", newline='')
+        dest = _open(filepath, "a" if is_append else "w", newline='')
     else:
         dest = open(filepath, "ab" if is_append else "wb")
     return dest
@@ -168,9 +173,7 @@ def parse_legacy_configuration(filepath, config_d=None):
     config_d["params"] = {}
     config_d["locus_info"] = []
     section = "preamble"
-    if not (sys.version_info.major >= 3 and sys.version_info.minor >= 4):
-        open = pre_py34_open
-    src = open(filepath)
+    src = _open(filepath)
     for row_idx, row in enumerate(src):
         row = row.strip()
         if not row:
@@ -223,6 +226,39 @@ def parse_legacy_configuration(filepath, config_d=None):
 ##############################################################################
 ## Temporary Directory Handling ( [somewhat] replicates 3.2 'TemporaryDirectory')
 
+# Candidate locations for working files that are held in memory (tmpfs)
+# rather than on disk, in order of preference.
+RAM_BACKED_DIRECTORIES = ("/dev/shm", "/run/shm")
+WORKING_DIRECTORY_BACKENDS = ("disk", "memory")
+
+def find_ram_backed_directory(candidates=None):
+    """
+    Returns the first of ``candidates`` (by default,
+    ``RAM_BACKED_DIRECTORIES``) that is an existing directory that we can
+    create files in, or None if there is no such directory.
+    """
+    if candidates is None:
+        candidates = RAM_BACKED_DIRECTORIES
+    for candidate in candidates:
+        if os.path.isdir(candidate) and os.access(candidate, os.W_OK | os.X_OK):
+            return candidate
+    return None
+
+def get_working_directory_parent(backend, parent_dir=None, candidates=None):
+    """
+    Returns the directory in which to create temporary working directories
+    for the given backend ("disk" or "memory"), and the backend actually
+    used. For the "memory" backend, this is a RAM-backed directory if
+    available, otherwise ``parent_dir`` (i.e., falling back to "disk").
+    """
+    if backend not in WORKING_DIRECTORY_BACKENDS:
+        raise ValueError("Unrecognized working directory backend: '{}'".format(backend))
+    if backend == "memory":
+        ram_dir = find_ram_backed_directory(candidates=candidates)
+        if ram_dir is not None:
+            return ram_dir, "memory"
+    return parent_dir, "disk"
+
 class TemporaryDirectory(object):
 
     def __init__(self,
@@ -400,8 +436,6 @@ class RunLogger(object):
     CRITICAL_MESSAGING_LEVEL = logging.CRITICAL
 
     def __init__(self, **kwargs):
-        if not (sys.version_info.major >= 3 and sys.version_info.minor >= 4):
-            open = pre_py34_open
         self.name = kwargs.get("name", "RunLog")
         self._log = logging.getLogger(self.name)
         self._log.setLevel(RunLogger.DEBUG_MESSAGING_LEVEL)
@@ -417,7 +451,7 @@ class RunLogger(object):
             if "log_stream" in kwargs:
                 log_stream = kwargs.get("log_stream")
             else:
-                log_stream = open(kwargs.get("log_path", self.name + ".log"), "w")
+                log_stream = _open(kwargs.get("log_path", self.name + ".log"), "w")
             handler2 = logging.StreamHandler(log_stream)
             file_logging_level = self.get_logging_level(kwargs.get("file_logging_level", RunLogger.DEBUG_MESSAGING_LEVEL))
             handler2.setLevel(file_logging_level)
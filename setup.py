@@ -12,6 +12,7 @@ setup(
     scripts=[
         "bin/gerenuk-simulate.py",
         "bin/gerenuk-reject.py",
+        "bin/gerenuk-convert-prior.py",
         ],
     url="http://pypi.python.org/pypi/gerenuk/",
     test_suite = "gerenuk.test",